@@ -1,10 +1,12 @@
+import math
 from typing import List, Optional
-from fastapi import Depends, HTTPException, status, Query
+from fastapi import Depends, HTTPException, status, Query, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from backend.app.core.config import settings
+from backend.app.core.rate_limit import rate_limiter
 from backend.app.db.session import get_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
@@ -90,3 +92,33 @@ def check_permissions(required_permissions: List[str]):
                 )
         return current_user
     return permission_checker
+
+def rate_limit(op_class: str):
+    """
+    Dependency giới hạn tốc độ cho REST endpoint tốn kém.
+    Chỉ giải mã JWT (không truy vấn DB) nên request bị từ chối không tốn round trip nào tới MongoDB.
+    Dùng ở tham số dependencies của route để chạy trước get_current_user.
+    """
+    async def limiter(
+        request: Request,
+        token: Optional[str] = Depends(oauth2_scheme),
+        token_query: Optional[str] = Query(None, alias="token")
+    ):
+        user_id = None
+        final_token = token or token_query
+        if final_token:
+            try:
+                payload = jwt.decode(final_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+                user_id = payload.get("sub")
+            except JWTError:
+                pass
+
+        ip = request.client.host if request.client else None
+        retry_after = rate_limiter.hit(op_class, user_id=user_id, ip=ip)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Bạn thao tác quá nhanh. Vui lòng thử lại sau.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    return limiter
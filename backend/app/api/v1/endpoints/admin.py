@@ -10,13 +10,24 @@ import csv
 from pydantic import BaseModel
 
 from backend.app.db.session import get_db
-from backend.app.api.deps import get_current_user, get_current_active_superuser
+from backend.app.api.deps import get_current_user, get_current_active_superuser, rate_limit
 from backend.app.schemas.user import User as UserSchema
-from backend.app.schemas.admin import SystemConfigUpdate, SystemConfigResponse, SupportStatusUpdate, SupportNoteUpdate, SupportMessageUpdate
+from backend.app.schemas.admin import SystemConfigUpdate, SystemConfigResponse, SupportStatusUpdate, SupportNoteUpdate, SupportMessageUpdate, SlowModeUpdate, LexiconTermsCreate, FAQEntryCreate, FAQEntryUpdate
 from backend.app.core.config import settings
+from backend.app.core.runtime_cache import runtime_cache
 
 router = APIRouter()
 
+async def _count_log_records(db, collection: str, query: dict) -> int:
+    """
+    Đếm bản ghi log có tính trường "count" (log sink gộp các lỗi giống nhau khi quá tải, xem core/log_sink.py).
+    """
+    rows = await db[collection].aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "total": {"$sum": {"$ifNull": ["$count", 1]}}}}
+    ]).to_list(length=1)
+    return rows[0]["total"] if rows else 0
+
 @router.get("/config", response_model=SystemConfigResponse)
 async def get_admin_config(
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -82,6 +93,7 @@ async def update_admin_config(
         }},
         upsert=True
     )
+    runtime_cache.invalidate_config()
 
     # 2. Cập nhật Settings trong bộ nhớ & ghi đè file .env
     new_google_key = configs.get("google_api_key")
@@ -133,9 +145,19 @@ async def update_admin_config(
     except Exception as e:
         print(f"⚠️ Lỗi khi cập nhật .env: {e}")
 
+    # Prompt hệ thống thay đổi: câu trả lời AI đã cache không còn hợp lệ
+    if "ai_system_prompt" in configs:
+        from backend.app.api.v1.endpoints.ws.ai_cache import ai_response_cache
+        ai_response_cache.clear()
+
+    # 3. Làm mới pool client AI nếu key thay đổi (client của key không đổi vẫn được dùng lại)
+    if new_google_key is not None or new_openai_key is not None:
+        from backend.app.core.ai_clients import ai_client_pool
+        ai_client_pool.invalidate()
+
     return {"status": "success"}
 
-@router.get("/ai/stats")
+@router.get("/ai/stats", dependencies=[Depends(rate_limit("admin_stats"))])
 async def get_ai_stats(
     db: AsyncIOMotorDatabase = Depends(get_db),
     current_user: dict = Depends(get_current_active_superuser)
@@ -144,7 +166,12 @@ async def get_ai_stats(
     Thống kê sử dụng AI theo MVP.
     """
     total_calls = await db["ai_usage"].count_documents({"status": "success"})
-    error_count = await db["ai_usage"].count_documents({"status": "error"})
+    error_count = await _count_log_records(db, "ai_usage", {"status": "error"})
+    cache_hits = await db["ai_usage"].count_documents({"status": "cache_hit"})
+    cancelled = await db["ai_usage"].count_documents({"status": "cancelled"})
+    from backend.app.core.ai_telemetry import ai_telemetry
+    await ai_telemetry.flush(db)
+    telemetry = await ai_telemetry.summary(db, minutes=24 * 60)
     
     # Feedback 👍 / 👎
     positive_feedback = await db["ai_feedback"].count_documents({"feedback": "like"})
@@ -158,10 +185,15 @@ async def get_ai_stats(
     return {
         "total_calls": total_calls,
         "error_count": error_count,
+        "cache_hits": cache_hits,
+        "cancelled": cancelled,
         "positive_feedback": positive_feedback,
         "negative_feedback": negative_feedback,
         "accuracy": round(accuracy, 1),
-        "latency": 0.8 
+        # Thời gian trả lời p50 (giây) trong 24h qua
+        "latency": round((telemetry["overall"]["metrics"]["total_ms"]["p50"] or 0) / 1000, 2),
+        "ttft_p50_ms": telemetry["overall"]["metrics"]["ttft_ms"]["p50"],
+        "avg_output_tokens": telemetry["overall"]["avg_output_tokens"]
     }
 
 @router.get("/ai/restricted-entities")
@@ -206,9 +238,10 @@ async def toggle_room_ai(
     
     new_status = not room.get("ai_restricted", False)
     await db["chat_rooms"].update_one({"id": room_id}, {"$set": {"ai_restricted": new_status}})
+    runtime_cache.invalidate_room(room_id)
     return {"status": "success", "ai_restricted": new_status}
 
-@router.get("/stats")
+@router.get("/stats", dependencies=[Depends(rate_limit("admin_stats"))])
 async def get_system_stats(
     db: AsyncIOMotorDatabase = Depends(get_db),
     current_user: dict = Depends(get_current_active_superuser)
@@ -254,7 +287,7 @@ async def get_system_stats(
         "timestamp": {"$gte": today}
     })
     ai_usage_count = await db["ai_usage"].count_documents({"status": "success"})
-    ai_errors_count = await db["ai_usage"].count_documents({
+    ai_errors_count = await _count_log_records(db, "ai_usage", {
         "status": "error",
         "timestamp": {"$gte": yesterday}
     })
@@ -279,7 +312,7 @@ async def get_system_stats(
     system_alerts = []
     
     # 1. Kiểm tra lẫy lỗi AI gần đây
-    ai_errors_count = await db["system_logs"].count_documents({
+    ai_errors_count = await _count_log_records(db, "system_logs", {
         "type": "ai_error",
         "timestamp": {"$gte": yesterday}
     })
@@ -326,6 +359,21 @@ async def get_system_stats(
             "timestamp": now.isoformat()
         })
 
+    # 5. Hội thoại hỗ trợ có cảm xúc tiêu cực (điểm trung bình 24h, tính cục bộ)
+    from backend.app.core.sentiment import sentiment_rollups
+    negative_threads = [
+        t for t in await sentiment_rollups.summary(db, "support", hours=24, limit=50, min_count=2)
+        if t["average"] <= -settings.SENTIMENT_LABEL_THRESHOLD
+    ]
+    if negative_threads:
+        system_alerts.append({
+            "type": "support",
+            "level": "warning",
+            "message": f"{len(negative_threads)} hội thoại hỗ trợ có cảm xúc tiêu cực trong 24h qua.",
+            "timestamp": now.isoformat()
+        })
+    sentiment_overview = await sentiment_rollups.overview(db)
+
     # Nếu không có cảnh báo nào, thêm 1 tin nhắn "Hệ thống ổn định" mang tính thực tế
     if not system_alerts:
         system_alerts.append({
@@ -341,24 +389,7 @@ async def get_system_stats(
     new_users_7d = await db["users"].count_documents({"created_at": {"$gte": last_week}, "is_superuser": False})
 
     # Thống kê hỗ trợ thực tế (Số thread mà tin nhắn cuối cùng là của user - chưa trả lời)
-    pipeline_support = [
-        {"$match": {"room_id": "help"}},
-        {"$sort": {"timestamp": -1}},
-        {"$group": {
-            "_id": {"$ifNull": ["$receiver_id", "$sender_id"]},
-            "last_sender_id": {"$first": "$sender_id"}
-        }},
-        {"$match": {"last_sender_id": {"$ne": None}}} # Logic: Nếu sender_id ko phải admin (ở đây tạm so sánh khác null, thực tế nên check role)
-    ]
-    # Lấy danh sách admin để filter
-    admins_cursor = db["users"].find({"is_superuser": True}, {"id": 1})
-    admin_ids = [a["id"] for a in await admins_cursor.to_list(length=100)]
-    
-    support_threads = await db["messages"].aggregate(pipeline_support).to_list(length=100)
-    pending_support = 0
-    for thread in support_threads:
-        if thread["last_sender_id"] not in admin_ids:
-            pending_support += 1
+    pending_support = await db["support_threads"].count_documents({"pending": True})
 
     # Top Phòng chat sôi động nhất (Dựa trên số tin nhắn)
     # Sử dụng aggregation
@@ -436,6 +467,7 @@ async def get_system_stats(
         "system_alerts": system_alerts,
         "top_rooms": top_rooms,
         "hourly_stats": ordered_stats,
+        "sentiment": sentiment_overview,
         "latency_ms": round(latency_ms, 2)
     }
 
@@ -520,58 +552,40 @@ async def get_support_conversations(
 ):
     """
     Lấy danh sách các cuộc trò chuyện hỗ trợ (Những người đã nhắn tin vào phòng help).
+    Đọc từ view support_threads (đã có tin cuối và thẻ user), chỉ tra thêm trạng thái online trong một truy vấn.
     """
-    # Group messages by the "Customer" (User receiving or sending help)
-    pipeline = [
-        {"$match": {"room_id": "help"}},
-        {"$project": {
-            "customer_id": {"$ifNull": ["$receiver_id", "$sender_id"]},
-            "content": 1,
-            "timestamp": 1,
-            "sender_name": 1,
-            "is_bot": 1
-        }},
-        # Loại bỏ các entry không có customer_id (ví dụ tin nhắn hệ thống lỗi)
-        {"$match": {"customer_id": {"$ne": None}}},
-        {"$sort": {"timestamp": -1}},
-        {"$group": {
-            "_id": "$customer_id",
-            "last_message": {"$first": "$content"},
-            "timestamp": {"$first": "$timestamp"},
-            "sender_name": {"$first": "$sender_name"}
-        }},
-        {"$sort": {"timestamp": -1}}
-    ]
-    
-    conversations = await db["messages"].aggregate(pipeline).to_list(length=100)
-    
-    # Bổ sung thông tin user (avatar, online status)
-    results = []
-    # Lấy danh sách admin để loại bỏ họ khỏi danh sách "khách hàng" nếu lỡ bị group vào
-    admin_ids = await db["users"].find({"is_superuser": True}, {"id": 1}).to_list(length=100)
-    admin_id_set = {a["id"] for a in admin_ids}
+    from .ws.support_threads import serialize_timestamp
+
+    threads = await db["support_threads"].find(
+        {"last_activity_at": {"$ne": None}}
+    ).sort("last_activity_at", -1).limit(100).to_list(length=100)
 
-    for conv in conversations:
-        user_id = conv["_id"]
-        if user_id in admin_id_set:
+    user_ids = [t["user_id"] for t in threads]
+    users = await db["users"].find(
+        {"id": {"$in": user_ids}}, {"id": 1, "is_online": 1, "is_superuser": 1}
+    ).to_list(length=len(user_ids) or 1)
+    # Bỏ user đã bị xóa và Admin (nếu lỡ có thread)
+    users_by_id = {u["id"]: u for u in users if not u.get("is_superuser")}
+
+    results = []
+    for thread in threads:
+        user = users_by_id.get(thread["user_id"])
+        if not user:
             continue
-            
-        user = await db["users"].find_one({"id": user_id})
-        thread = await db["support_threads"].find_one({"user_id": user_id})
-        
-        if user:
-            results.append({
-                "user_id": user_id,
-                "username": user.get("username"),
-                "full_name": user.get("full_name"),
-                "avatar_url": user.get("avatar") or user.get("avatar_url"),
-                "last_message": conv["last_message"],
-                "timestamp": conv["timestamp"].isoformat() if isinstance(conv["timestamp"], datetime) else conv["timestamp"],
-                "is_online": user.get("is_online", False),
-                "unread_count": 0,
-                "status": thread.get("status", "ai_processing") if thread else "ai_processing",
-                "internal_note": thread.get("internal_note", "") if thread else ""
-            })
+        results.append({
+            "user_id": thread["user_id"],
+            "username": thread.get("username"),
+            "full_name": thread.get("full_name"),
+            "avatar_url": thread.get("avatar_url"),
+            "last_message": thread.get("last_message"),
+            "timestamp": serialize_timestamp(thread.get("last_activity_at")),
+            "is_online": user.get("is_online", False),
+            "unread_count": thread.get("unread_count", 0),
+            "status": thread.get("status", "ai_processing"),
+            "internal_note": thread.get("internal_note", ""),
+            "pending": thread.get("pending", False),
+            "last_sentiment": thread.get("last_sentiment")
+        })
             
     return results
 
@@ -583,15 +597,12 @@ async def update_support_status(
     current_user: dict = Depends(get_current_active_superuser)
 ):
     """Cập nhật trạng thái hỗ trợ cho user (AI processing / Waiting Admin / Resolved)"""
-    await db["support_threads"].update_one(
-        {"user_id": user_id},
-        {"$set": {
-            "status": status_data.status,
-            "updated_at": datetime.now(timezone.utc),
-            "updated_by": current_user["id"]
-        }},
-        upsert=True
-    )
+    from .ws.support_threads import upsert_thread
+    await upsert_thread(user_id, {"$set": {
+        "status": status_data.status,
+        "updated_at": datetime.now(timezone.utc),
+        "updated_by": current_user["id"]
+    }})
 
     # Thông báo thời gian thực cho người dùng
     from .ws.manager import manager
@@ -611,15 +622,12 @@ async def update_support_note(
     current_user: dict = Depends(get_current_active_superuser)
 ):
     """Cập nhật ghi chú nội bộ cho admin về user này"""
-    await db["support_threads"].update_one(
-        {"user_id": user_id},
-        {"$set": {
-            "internal_note": note_data.note,
-            "updated_at": datetime.now(timezone.utc),
-            "updated_by": current_user["id"]
-        }},
-        upsert=True
-    )
+    from .ws.support_threads import upsert_thread
+    await upsert_thread(user_id, {"$set": {
+        "internal_note": note_data.note,
+        "updated_at": datetime.now(timezone.utc),
+        "updated_by": current_user["id"]
+    }})
     return {"status": "success"}
 
 @router.get("/support/messages/{user_id}")
@@ -631,6 +639,8 @@ async def get_support_messages(
     """
     Lấy lịch sử tin nhắn hỗ trợ của một user cụ thể.
     """
+    from .ws.partitions import partitions, conversation_id
+
     query = {
         "room_id": "help",
         "$or": [
@@ -643,8 +653,13 @@ async def get_support_messages(
             {"is_bot": True, "sender_id": user_id} 
         ]
     }
+    if partitions.ready:
+        # Hội thoại hỗ trợ của user đã được phân vùng riêng
+        query = {"conversation_id": conversation_id("help", user_id)}
     
     messages = await db["messages"].find(query).sort("timestamp", 1).to_list(length=200)
+    # Admin đã mở hội thoại -> đặt lại bộ đếm chưa đọc của hộp thư hỗ trợ
+    await db["support_threads"].update_one({"user_id": user_id}, {"$set": {"unread_count": 0}})
     # Serialize MongoDB objects
     for msg in messages:
         if "_id" in msg: msg["_id"] = str(msg["_id"])
@@ -665,8 +680,13 @@ async def support_reply(
     """
     Admin gửi phản hồi hỗ trợ cho một người dùng.
     """
+    from .ws.receipts import next_conversation_seq, increment_unread
+    from .ws.support_threads import note_reply
+    from .ws.partitions import conversation_id
+
     ts = datetime.now(timezone.utc)
     msg_id = str(uuid.uuid4())
+    seq = await next_conversation_seq("help", reply.user_id, ts)
     
     # Lưu vào DB
     db_msg = {
@@ -676,24 +696,19 @@ async def support_reply(
         "sender_name": "Admin Support",
         "receiver_id": reply.user_id,
         "room_id": "help",
+        "conversation_id": conversation_id("help", reply.user_id),
         "timestamp": ts,
+        "seq": seq,
         "is_bot": False,
         "deleted_by_users": []
     }
     await db["messages"].insert_one(db_msg)
+    await increment_unread("help", receiver_id=reply.user_id, seq=seq)
     
     # Cập nhật trạng thái thread hội thoại thành "Chờ Admin" (đang xử lý bởi con người)
     # hoặc giữ nguyên nếu đang là waiting, nhưng cập nhật thời gian
     new_status = "waiting"
-    await db["support_threads"].update_one(
-        {"user_id": reply.user_id},
-        {"$set": {
-            "status": new_status, 
-            "updated_at": ts,
-            "last_message": reply.content
-        }},
-        upsert=True
-    )
+    await note_reply(reply.user_id, db_msg, "staff", extra={"status": new_status, "updated_at": ts})
 
     # Thông báo thời gian thực cho người dùng về sự thay đổi trạng thái
     from .ws.manager import manager
@@ -713,7 +728,8 @@ async def support_reply(
         "sender_avatar": current_user.get("avatar_url") or current_user.get("avatar"),
         "room_id": "help",
         "receiver_id": reply.user_id,
-        "timestamp": ts.isoformat()
+        "timestamp": ts.isoformat(),
+        "seq": seq
     }
     await manager.send_to_user(reply.user_id, metadata)
     
@@ -802,6 +818,7 @@ async def set_admin_status(
         {"username": username},
         {"$set": {"is_superuser": True}}
     )
+    runtime_cache.invalidate_admins()
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return {"status": "success", "message": f"{username} is now an admin"}
@@ -821,6 +838,7 @@ async def update_user_role(
         {"id": user_id},
         {"$set": {"is_superuser": is_admin}}
     )
+    runtime_cache.invalidate_admins()
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return {"status": "success", "is_superuser": is_admin}
@@ -1039,9 +1057,158 @@ async def toggle_room_lock(
     
     new_status = not room.get("is_locked", False)
     await db["chat_rooms"].update_one({"id": room_id}, {"$set": {"is_locked": new_status}})
+    runtime_cache.invalidate_room(room_id)
     
     return {"status": "success", "is_locked": new_status}
 
+@router.post("/rooms/{room_id}/slow-mode")
+async def set_room_slow_mode(
+    room_id: str,
+    slow_mode: SlowModeUpdate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Admin bật/tắt chế độ chậm cho phòng cộng đồng (0 = tắt)"""
+    if slow_mode.seconds < 0:
+        raise HTTPException(status_code=400, detail="Thời gian chờ không hợp lệ")
+
+    result = await db["chat_rooms"].update_one({"id": room_id}, {"$set": {"slow_mode_seconds": slow_mode.seconds}})
+    runtime_cache.invalidate_room(room_id)
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    return {"status": "success", "slow_mode_seconds": slow_mode.seconds}
+
+@router.get("/rate-limit/stats")
+async def get_rate_limit_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thống kê bộ giới hạn tốc độ (số bucket đang hoạt động, số lần từ chối theo nhóm thao tác)"""
+    from backend.app.core.rate_limit import rate_limiter
+    return rate_limiter.stats()
+
+@router.get("/ai/clients/stats")
+async def get_ai_client_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thống kê pool client AI (số client, tỉ lệ dùng lại, thời gian khởi tạo)"""
+    from backend.app.core.ai_clients import ai_client_pool
+    return ai_client_pool.stats()
+
+@router.get("/ai/models/health")
+async def get_ai_model_health(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Sức khỏe từng model AI: trạng thái circuit, tỉ lệ lỗi, TTFT p50/p95"""
+    from backend.app.core.model_health import model_health
+    return model_health.stats()
+
+@router.get("/ai/scheduler/stats")
+async def get_ai_scheduler_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Bộ lập lịch AI: số lượt đang chạy/đang chờ theo lớp ưu tiên, thời gian chờ p50/p95, bộ đệm stream (resume), số lượt bị dừng"""
+    from backend.app.api.v1.endpoints.ws.ai_scheduler import ai_scheduler
+    from backend.app.api.v1.endpoints.ws.ai_stream import ai_streams
+    from backend.app.api.v1.endpoints.ws.ai_generations import ai_generations
+    return {**ai_scheduler.stats(), "streams": ai_streams.stats(), "generations": ai_generations.stats()}
+
+@router.get("/logs/sink/stats")
+async def get_log_sink_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Bộ ghi log theo lô: số bản ghi đang đệm, đã ghi, đã gộp, bị bỏ do quá tải"""
+    from backend.app.core.log_sink import log_sink
+    return log_sink.stats()
+
+@router.get("/ai/cache/stats")
+async def get_ai_cache_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Cache câu trả lời AI: số mục, tỉ lệ trúng, số request được gộp (single-flight)"""
+    from backend.app.api.v1.endpoints.ws.ai_cache import ai_response_cache
+    return ai_response_cache.stats()
+
+@router.get("/ai/telemetry", dependencies=[Depends(rate_limit("admin_stats"))])
+async def get_ai_telemetry(
+    minutes: int = 60,
+    group_by: str = "model",
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Hiệu năng AI theo model/provider: p50/p90/p99 + histogram thời gian chờ, TTFT, tổng thời gian, token/s"""
+    from backend.app.core.ai_telemetry import ai_telemetry
+
+    if group_by not in ("model", "provider"):
+        raise HTTPException(status_code=400, detail="group_by phải là 'model' hoặc 'provider'")
+    minutes = max(1, min(minutes, settings.AI_TELEMETRY_RETENTION_DAYS * 24 * 60))
+    # Ghi các bucket còn trong bộ nhớ trước để số liệu là mới nhất
+    await ai_telemetry.flush(db)
+    return await ai_telemetry.summary(db, minutes=minutes, group_by=group_by)
+
+@router.get("/sentiment")
+async def get_sentiment_summary(
+    hours: int = 24,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Cảm xúc trung bình theo phòng và theo hội thoại hỗ trợ trong `hours` giờ gần nhất (tiêu cực nhất trước)"""
+    from backend.app.core.sentiment import sentiment_rollups
+
+    hours = max(1, min(hours, settings.SENTIMENT_RETENTION_DAYS * 24))
+    rooms = await sentiment_rollups.summary(db, "room", hours=hours)
+    threads = await sentiment_rollups.summary(db, "support", hours=hours)
+
+    room_docs = await db["chat_rooms"].find(
+        {"id": {"$in": [r["key"] for r in rooms]}}, {"id": 1, "name": 1, "type": 1}
+    ).to_list(length=len(rooms))
+    rooms_by_id = {r["id"]: r for r in room_docs}
+    for row in rooms:
+        room = rooms_by_id.get(row["key"], {})
+        row.update({"room_id": row.pop("key"), "name": room.get("name"), "type": room.get("type")})
+
+    user_docs = await db["users"].find(
+        {"id": {"$in": [t["key"] for t in threads]}}, {"id": 1, "username": 1, "full_name": 1}
+    ).to_list(length=len(threads))
+    users_by_id = {u["id"]: u for u in user_docs}
+    for row in threads:
+        user = users_by_id.get(row["key"], {})
+        row.update({"user_id": row.pop("key"), "username": user.get("username"), "full_name": user.get("full_name")})
+
+    return {
+        "hours": hours,
+        "overall": await sentiment_rollups.overview(db, hours=hours),
+        "rooms": rooms,
+        "support_threads": threads
+    }
+
+@router.get("/smart-replies/stats")
+async def get_smart_reply_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Mô hình gợi ý trả lời nhanh cục bộ: số câu trả lời/đặc trưng, lần huấn luyện cuối, độ trễ gợi ý"""
+    from backend.app.core.smart_reply import smart_replies
+    return smart_replies.stats()
+
+@router.post("/smart-replies/retrain")
+async def retrain_smart_replies(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Huấn luyện lại mô hình gợi ý ngay (không chờ chu kỳ định kỳ)"""
+    from backend.app.core.smart_reply import smart_replies
+    from backend.app.api.v1.endpoints.ws.constants import SELF_ISOLATED_ROOMS
+    await smart_replies.refresh(db, SELF_ISOLATED_ROOMS)
+    return smart_replies.stats()
+
+@router.get("/spam/stats")
+async def get_spam_stats(
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thống kê bộ phát hiện spam (số tin trong cửa sổ, số lần chặn/báo cáo)"""
+    from backend.app.core.spam_detector import spam_detector
+    return spam_detector.stats()
+
 @router.post("/rooms/cleanup/empty")
 async def delete_empty_rooms(
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -1064,6 +1231,7 @@ async def delete_empty_rooms(
         if member_count == 0 or msg_count == 0:
             await db["chat_rooms"].delete_one({"id": room_id})
             await db["messages"].delete_many({"room_id": room_id})
+            runtime_cache.invalidate_room(room_id)
             deleted_count += 1
             
     return {"status": "success", "deleted_count": deleted_count}
@@ -1080,6 +1248,7 @@ async def delete_room_by_admin(
         
     # 1. Xóa phòng
     result = await db["chat_rooms"].delete_one({"id": room_id})
+    runtime_cache.invalidate_room(room_id)
     if result.deleted_count == 0:
         # Thử với ObjectId nếu id string ko khớp (tùy schema)
         pass # Schema hiện tại dùng UUID string cho 'id' field
@@ -1089,6 +1258,182 @@ async def delete_room_by_admin(
     
     return {"status": "success", "message": f"Room {room_id} and its content deleted"}
 
+# --- MODERATION LEXICON ---
+
+@router.get("/moderation/lexicon")
+async def list_lexicon_terms(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Lấy danh sách từ cấm của bộ lọc nội dung cùng trạng thái automaton"""
+    from backend.app.core.content_filter import content_filter
+
+    terms = await db["moderation_lexicon"].find({}, {"_id": 0}).sort("created_at", -1).to_list(length=1000)
+    total = await db["moderation_lexicon"].count_documents({})
+    return {"total": total, "terms": terms, "filter": content_filter.stats()}
+
+@router.post("/moderation/lexicon")
+async def add_lexicon_terms(
+    terms_in: LexiconTermsCreate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thêm (hoặc cập nhật hành động cho) các từ cấm. Automaton được dựng lại trong nền."""
+    from pymongo import UpdateOne
+    from backend.app.core.content_filter import content_filter, fold_text, ACTION_SEVERITY
+
+    if terms_in.action not in ACTION_SEVERITY:
+        raise HTTPException(status_code=400, detail="Hành động không hợp lệ (block, mask, flag)")
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    for term in {t.strip() for t in terms_in.terms if t and t.strip()}:
+        ops.append(UpdateOne(
+            {"folded": fold_text(term)},
+            {
+                "$set": {"term": term, "action": terms_in.action, "whole_word": terms_in.whole_word, "updated_at": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now, "created_by": current_user.get("username")}
+            },
+            upsert=True
+        ))
+    if not ops:
+        raise HTTPException(status_code=400, detail="Danh sách từ trống")
+
+    for i in range(0, len(ops), 1000):
+        await db["moderation_lexicon"].bulk_write(ops[i:i + 1000], ordered=False)
+
+    content_filter.schedule_rebuild(db)
+    return {"status": "success", "count": len(ops)}
+
+@router.delete("/moderation/lexicon/{term_id}")
+async def delete_lexicon_term(
+    term_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Xóa một từ khỏi bộ lọc nội dung"""
+    from backend.app.core.content_filter import content_filter
+
+    result = await db["moderation_lexicon"].delete_one({"id": term_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Term not found")
+
+    content_filter.schedule_rebuild(db)
+    return {"status": "success"}
+
+# --- FAQ KNOWLEDGE BASE ---
+
+def _faq_changed(db):
+    """FAQ thay đổi: dựng lại chỉ mục BM25 và bỏ các câu trả lời Help đã cache theo FAQ cũ"""
+    from backend.app.core.faq_kb import faq_kb
+    from backend.app.api.v1.endpoints.ws.ai_cache import ai_response_cache
+
+    faq_kb.schedule_rebuild(db)
+    ai_response_cache.clear()
+
+@router.get("/faq")
+async def list_faq_entries(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Lấy danh sách FAQ của phòng Help cùng thống kê chỉ mục (tỉ lệ trả lời trực tiếp, độ trễ tra cứu)"""
+    from backend.app.core.faq_kb import faq_kb
+
+    entries = await db["faq_entries"].find({}, {"_id": 0}).sort("created_at", -1).to_list(length=1000)
+    return {"total": len(entries), "entries": entries, "index": faq_kb.stats()}
+
+@router.get("/faq/search")
+async def search_faq_entries(
+    q: str,
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thử một câu hỏi với chỉ mục FAQ (để Admin tinh chỉnh ngưỡng), không tính vào thống kê"""
+    from backend.app.core.faq_kb import faq_kb
+
+    matches = faq_kb.index.search(q, k=max(1, settings.FAQ_CONTEXT_ENTRIES))
+    results = []
+    for i, m in enumerate(matches):
+        if i == 0 and m.confidence >= settings.FAQ_HIGH_CONFIDENCE:
+            decision = "answer"
+        elif m.confidence >= settings.FAQ_MEDIUM_CONFIDENCE:
+            decision = "context"
+        else:
+            decision = "ignore"
+        results.append({
+            "id": m.entry["id"],
+            "question": m.entry["question"],
+            "score": m.score,
+            "confidence": m.confidence,
+            "decision": decision
+        })
+    return {"query": q, "results": results}
+
+@router.post("/faq")
+async def create_faq_entry(
+    entry_in: FAQEntryCreate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Thêm một mục FAQ. Chỉ mục được dựng lại trong nền."""
+    if not entry_in.question.strip() or not entry_in.answer.strip():
+        raise HTTPException(status_code=400, detail="Câu hỏi và câu trả lời không được để trống")
+
+    now = datetime.now(timezone.utc)
+    entry = {
+        "id": str(uuid.uuid4()),
+        "question": entry_in.question.strip(),
+        "answer": entry_in.answer.strip(),
+        "keywords": [k.strip() for k in entry_in.keywords if k and k.strip()],
+        "enabled": entry_in.enabled,
+        "created_at": now,
+        "updated_at": now,
+        "created_by": current_user.get("username")
+    }
+    await db["faq_entries"].insert_one(entry)
+    entry.pop("_id", None)
+
+    _faq_changed(db)
+    return entry
+
+@router.put("/faq/{entry_id}")
+async def update_faq_entry(
+    entry_id: str,
+    entry_in: FAQEntryUpdate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Cập nhật một mục FAQ (nội dung, từ khóa hoặc bật/tắt)"""
+    updates = {k: v for k, v in entry_in.dict(exclude_unset=True).items() if v is not None}
+    if "keywords" in updates:
+        updates["keywords"] = [k.strip() for k in updates["keywords"] if k and k.strip()]
+    for field in ("question", "answer"):
+        if field in updates:
+            updates[field] = updates[field].strip()
+            if not updates[field]:
+                raise HTTPException(status_code=400, detail="Câu hỏi và câu trả lời không được để trống")
+    updates["updated_at"] = datetime.now(timezone.utc)
+
+    result = await db["faq_entries"].update_one({"id": entry_id}, {"$set": updates})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="FAQ entry not found")
+
+    _faq_changed(db)
+    return {"status": "success"}
+
+@router.delete("/faq/{entry_id}")
+async def delete_faq_entry(
+    entry_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: dict = Depends(get_current_active_superuser)
+):
+    """Xóa một mục FAQ"""
+    result = await db["faq_entries"].delete_one({"id": entry_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="FAQ entry not found")
+
+    _faq_changed(db)
+    return {"status": "success"}
+
 # --- REPORT MANAGEMENT ---
 
 @router.get("/reports")
@@ -5,7 +5,10 @@ import re
 
 from backend.app.db.session import get_db
 from backend.app.schemas.message import MessageRead
-from backend.app.api.deps import get_current_user
+from backend.app.api.deps import get_current_user, rate_limit
+from backend.app.api.v1.endpoints.ws.receipts import get_read_watermarks, apply_seen_status, apply_conversation_seen_status
+from backend.app.api.v1.endpoints.ws.partitions import partitions
+from backend.app.core.smart_reply import smart_replies
 
 router = APIRouter()
 
@@ -32,15 +35,30 @@ async def get_room_messages(
         if room_id == "help" and (current_user.get("is_superuser") or current_user.get("role") == "admin"):
             pass # Admins see everything in help
         else:
-            query["$or"] = [
-                {"sender_id": current_user["id"]},
-                {"receiver_id": current_user["id"]}
-            ]
+            # Hội thoại riêng của user: truy vấn theo khóa phân vùng conversation_id
+            del query["room_id"]
+            query.update(partitions.filter(room_id, current_user["id"]))
 
     messages = await db["messages"].find(query).sort("timestamp", 1).limit(limit).to_list(length=limit)
+
+    # Trạng thái "đã xem" được suy ra từ watermark của các thành viên (room_members.last_read_seq).
+    # Phòng biệt lập (AI, Help): seq và watermark tính theo từng hội thoại, dùng watermark của chủ hội thoại
+    # (kể cả khi Admin xem toàn bộ phòng Help gồm nhiều hội thoại)
+    if room_id in ["ai", "help"]:
+        await apply_conversation_seen_status(room_id, messages)
+    else:
+        watermarks, complete = await get_read_watermarks(room_id, current_user["id"])
+        apply_seen_status(messages, watermarks, current_user["id"], include_seen_by=complete)
+
+    # Gợi ý trả lời nhanh cho tin nhắn cuối cùng nếu nó do người khác gửi
+    if messages and room_id not in ["ai", "help"]:
+        last = messages[-1]
+        if last.get("content") and not last.get("file_url") and not last.get("is_bot") and not last.get("is_recalled") \
+                and last.get("sender_id") != current_user["id"]:
+            last["suggestions"] = smart_replies.suggest(last["content"])
     return messages
 
-@router.get("/search/", response_model=List[MessageRead])
+@router.get("/search/", response_model=List[MessageRead], dependencies=[Depends(rate_limit("search"))])
 async def search_messages(
     query: str = Query(..., min_length=1),
     room_id: Optional[str] = None,
@@ -57,21 +75,13 @@ async def search_messages(
     }
     
     # Isolation logic cho tìm kiếm (Chỉ thấy tin nhắn của mình trong các phòng biệt lập)
-    isolation_clause = {
-        "$or": [
-            {"room_id": {"$nin": ["ai", "help"]}},
-            {"sender_id": current_user["id"]},
-            {"receiver_id": current_user["id"]}
-        ]
-    }
+    isolation_clause = partitions.search_isolation(current_user["id"])
     
     if room_id:
-        mongo_query["room_id"] = room_id
         if room_id in ["ai", "help"]:
-            mongo_query["$or"] = [
-                {"sender_id": current_user["id"]},
-                {"receiver_id": current_user["id"]}
-            ]
+            mongo_query.update(partitions.filter(room_id, current_user["id"]))
+        else:
+            mongo_query["room_id"] = room_id
     else:
         # Nếu tìm kiếm global, phải tránh lộ tin nhắn AI/Help của người khác
         mongo_query.update(isolation_clause)
@@ -89,8 +99,10 @@ async def clear_room_messages(
     Xóa lịch sử trò chuyện từ phía người dùng hiện tại (Messenger style).
     """
     # Thêm user_id vào mảng deleted_by_users của tất cả tin nhắn hiện tại trong phòng
+    # (phòng AI/Help: chỉ hội thoại riêng của user)
+    query = partitions.filter(room_id, current_user["id"]) if room_id in ["ai", "help"] else {"room_id": room_id}
     await db["messages"].update_many(
-        {"room_id": room_id},
+        query,
         {"$addToSet": {"deleted_by_users": current_user["id"]}}
     )
     return {"status": "success", "message": "Chat history cleared for you"}
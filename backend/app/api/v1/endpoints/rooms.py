@@ -2,11 +2,14 @@ from typing import Any, List
 from fastapi import APIRouter, Depends, HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timezone
+import asyncio
 import uuid
 
 from backend.app.db.session import get_db
 from backend.app.schemas.room import Room, RoomCreate, GroupCreate, RoomUpdate, AddMembers, MemberRoleUpdate
 from backend.app.api.deps import get_current_user
+from backend.app.api.v1.endpoints.ws.partitions import partitions, conversation_id
+from backend.app.core.runtime_cache import runtime_cache
 
 router = APIRouter()
 
@@ -23,6 +26,8 @@ async def get_rooms(
     # Lấy IDs các phòng mà người dùng là thành viên
     memberships = await db["room_members"].find({"user_id": current_user["id"]}).to_list(length=1000)
     user_room_ids = [m["room_id"] for m in memberships]
+    # Membership đã có sẵn bộ đếm chưa đọc (duy trì tăng dần), không cần truy vấn thêm
+    membership_map = {m["room_id"]: m for m in memberships}
 
     # LinkUp Refinement: Cho phép Admin thấy phòng Help để hỗ trợ khách hàng
     is_admin = current_user.get("is_superuser") or current_user.get("role") == "admin"
@@ -35,8 +40,85 @@ async def get_rooms(
         ]
     }
     
-    rooms_list = await db["chat_rooms"].find(query).sort("updated_at", -1).to_list(length=100)
-    
+    me = current_user["id"]
+    # Tin nhắn cuối của mọi phòng lấy trong cùng aggregation với danh sách phòng ($lookup + $limit 1 theo từng phòng,
+    # dùng index room_id + timestamp) thay vì một truy vấn cho mỗi phòng. Phòng AI/Help chỉ xét hội thoại riêng.
+    if partitions.ready:
+        isolated = [{"conversation_id": {"$in": [conversation_id(r, me) for r in ("ai", "help")]}}]
+    else:
+        isolated = [
+            {"room_id": "ai", "$or": [{"sender_id": me}, {"receiver_id": me}]},
+            # LinkUp: Cả admin và user đều chỉ thấy thread cá nhân của mình trong ChatPage để đồng bộ trải nghiệm
+            # Thread cá nhân: sender_id là mình và không có người nhận cụ thể (gửi cho hệ thống/AI)
+            # HOẶC mình là người nhận (hệ thống/admin khác phản hồi mình)
+            {"room_id": "help", "$or": [{"sender_id": me, "receiver_id": None}, {"receiver_id": me}]}
+        ]
+    last_message_match = {
+        "$expr": {"$eq": ["$room_id", "$$room_id"]},
+        # Tin nhắn cuối cùng không bị người dùng xóa phía họ
+        "deleted_by_users": {"$ne": me},
+        "$or": [{"room_id": {"$nin": ["ai", "help"]}}, *isolated]
+    }
+    rooms_cursor = db["chat_rooms"].aggregate([
+        {"$match": query},
+        {"$sort": {"updated_at": -1}},
+        {"$limit": 100},
+        {"$lookup": {
+            "from": "messages",
+            "let": {"room_id": "$id"},
+            "pipeline": [
+                {"$match": last_message_match},
+                {"$sort": {"timestamp": -1}},
+                {"$limit": 1},
+                {"$project": {
+                    "id": 1, "content": 1, "is_recalled": 1, "file_url": 1, "file_type": 1,
+                    "sender_name": 1, "timestamp": 1
+                }}
+            ],
+            "as": "last_message_doc"
+        }}
+    ])
+    # Trạng thái hỗ trợ của user hiện tại (phòng Help luôn có trong danh sách) lấy song song
+    rooms_list, thread = await asyncio.gather(
+        rooms_cursor.to_list(length=100),
+        db["support_threads"].find_one({"user_id": me}, {"status": 1, "internal_note": 1})
+    )
+
+    # Phòng 1-1: thành viên còn lại, thông tin user và quan hệ bạn bè lấy bằng $in rồi ghép trong bộ nhớ
+    direct_ids = [r["id"] for r in rooms_list if r.get("type") == "direct" and r["id"] not in ("ai", "help")]
+    other_member_map = {}
+    users_map = {}
+    friend_ids = set()
+    if direct_ids:
+        other_members = await db["room_members"].find(
+            {"room_id": {"$in": direct_ids}, "user_id": {"$ne": me}}, {"room_id": 1, "user_id": 1}
+        ).to_list(length=None)
+        for m in other_members:
+            other_member_map.setdefault(m["room_id"], m)
+        other_ids = list({m["user_id"] for m in other_member_map.values()})
+        if other_ids:
+            users, friendships = await asyncio.gather(
+                db["users"].find(
+                    {"id": {"$in": other_ids}},
+                    {
+                        "id": 1, "username": 1, "full_name": 1, "avatar_url": 1, "is_online": 1,
+                        "show_online_status": 1, "blocked_users": 1
+                    }
+                ).to_list(length=None),
+                db["friend_requests"].find(
+                    {
+                        "status": "accepted",
+                        "$or": [
+                            {"from_id": me, "to_id": {"$in": other_ids}},
+                            {"from_id": {"$in": other_ids}, "to_id": me}
+                        ]
+                    },
+                    {"from_id": 1, "to_id": 1}
+                ).to_list(length=None)
+            )
+            users_map = {u["id"]: u for u in users}
+            friend_ids = {f["to_id"] if f["from_id"] == me else f["from_id"] for f in friendships}
+
     # Xử lý thông tin bổ sung cho từng phòng
     final_rooms = []
     for room in rooms_list:
@@ -50,42 +132,19 @@ async def get_rooms(
         elif room.get("type") == "private":
             room["type"] = "group"
         # Lấy thông tin member của user hiện tại
-        membership = await db["room_members"].find_one({
-            "room_id": room["id"],
-            "user_id": current_user["id"]
-        })
+        membership = membership_map.get(room["id"])
         is_pinned = membership.get("is_pinned", False) if membership else False
+        unread_count = membership.get("unread_count", 0) if membership else 0
 
-        # Lấy tin nhắn cuối cùng (không bị người dùng xóa phía họ)
-        msg_query = {
-            "room_id": room["id"],
-            "deleted_by_users": {"$ne": current_user["id"]}
-        }
-        
-        # Isolation logic cho phòng đặc biệt (AI, Help)
-        if room["id"] == "ai":
-            msg_query["$or"] = [
-                {"sender_id": current_user["id"]},
-                {"receiver_id": current_user["id"]}
-            ]
-        elif room["id"] == "help":
-            # LinkUp: Cả admin và user đều chỉ thấy thread cá nhân của mình trong ChatPage để đồng bộ trải nghiệm
-            # Thread cá nhân: sender_id là mình và không có người nhận cụ thể (gửi cho hệ thống/AI)
-            # HOẶC mình là người nhận (hệ thống/admin khác phản hồi mình)
-            msg_query["$or"] = [
-                {"sender_id": current_user["id"], "receiver_id": None},
-                {"receiver_id": current_user["id"]}
-            ]
-            
+        if room["id"] == "help":
             room["name"] = "Help & Support"
             
             # Thêm metadata status cho người dùng hiện tại
-            thread = await db["support_threads"].find_one({"user_id": current_user["id"]})
             if thread:
                 room["support_status"] = thread.get("status")
                 room["support_note"] = thread.get("internal_note")
 
-        last_msg = await db["messages"].find(msg_query).sort("timestamp", -1).limit(1).to_list(length=1)
+        last_msg = room.pop("last_message_doc", None)
         
         last_message_content = None
         last_message_id = None
@@ -109,38 +168,27 @@ async def get_rooms(
 
         if room["type"] == "direct":
             # Tìm tên của người kia trong cuộc trò chuyện 1-1
-            other_member = await db["room_members"].find_one({
-                "room_id": room["id"],
-                "user_id": {"$ne": current_user["id"]}
-            })
+            other_member = other_member_map.get(room["id"])
             
             other_name = "Unknown"
             other_avatar = None
             is_online = False
+            blocked_by_other = False
             if other_member:
-                other_user = await db["users"].find_one({"id": other_member["user_id"]})
+                other_user = users_map.get(other_member["user_id"])
                 if other_user:
                     other_name = other_user.get("full_name") or other_user["username"]
                     other_avatar = other_user.get("avatar_url")
                     
-                    # Kiểm tra bạn bè: Chỉ hiện online nếu đã kết bạn
-                    is_friend = await db["friend_requests"].find_one({
-                        "status": "accepted",
-                        "$or": [
-                            {"from_id": current_user["id"], "to_id": other_user["id"]},
-                            {"from_id": other_user["id"], "to_id": current_user["id"]}
-                        ]
-                    })
-                    
                     # Ràng buộc: Chỉ hiển thị online nếu là bạn bè và user đó cho phép và KHÔNG có quan hệ chặn
                     is_online = False
-                    if is_friend:
+                    if other_user["id"] in friend_ids:
                         is_online = other_user.get("is_online", False) and other_user.get("show_online_status", True)
                     
                     if other_user["id"] in current_user.get("blocked_users", []):
                         is_online = False
                     
-                    blocked_by_other = current_user["id"] in other_user.get("blocked_users", [])
+                    blocked_by_other = me in other_user.get("blocked_users", [])
                     if blocked_by_other:
                         is_online = False
             
@@ -153,7 +201,9 @@ async def get_rooms(
                 "avatar_url": other_avatar,
                 "is_online": is_online,
                 "is_pinned": is_pinned,
-                "blocked_by_other": blocked_by_other if other_member else False,
+                "unread_count": unread_count,
+                "has_unread": unread_count > 0,
+                "blocked_by_other": blocked_by_other,
                 "updated_at": room.get("updated_at"),
                 "last_message": last_message_content,
                 "last_message_id": last_message_id,
@@ -167,6 +217,8 @@ async def get_rooms(
             room["last_message_sender"] = last_message_sender
             room["last_message_at"] = last_message_at
             room["is_pinned"] = is_pinned
+            room["unread_count"] = unread_count
+            room["has_unread"] = unread_count > 0
             final_rooms.append(room)
             
     return final_rooms
@@ -424,6 +476,7 @@ async def update_room(
         {"id": room_id},
         {"$set": update_data}
     )
+    runtime_cache.invalidate_room(room_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Không tìm thấy phòng.")
@@ -6,7 +6,7 @@ import re
 import uuid
 
 from backend.app.db.session import get_db
-from backend.app.api.deps import get_current_user
+from backend.app.api.deps import get_current_user, rate_limit
 from backend.app.schemas.room import Room as RoomSchema
 from pydantic import BaseModel
 
@@ -33,7 +33,7 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/search", response_model=List[UserOut])
+@router.get("/search", response_model=List[UserOut], dependencies=[Depends(rate_limit("search"))])
 async def search_users(
     q: str = Query(..., min_length=1),
     db: AsyncIOMotorDatabase = Depends(get_db),
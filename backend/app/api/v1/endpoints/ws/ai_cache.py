@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.content_filter import fold_text
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để các biến thể "Cách tạo nhóm?", "cach tao  nhom" dùng chung một mục cache:
+    bỏ dấu tiếng Việt, chữ thường, bỏ dấu câu và khoảng trắng thừa.
+    """
+    return " ".join(_NON_WORD.sub(" ", fold_text(prompt or "")).split())
+
+def prompt_version(sys_config: dict) -> str:
+    """
+    Phiên bản prompt hệ thống: đổi ai_system_prompt thì toàn bộ khóa cache cũ tự động không còn khớp.
+    """
+    return hashlib.sha256((sys_config.get("ai_system_prompt") or "").encode("utf-8")).hexdigest()[:12]
+
+class AIResponseCache:
+    """
+    Cache câu trả lời AI cho các câu hỏi lặp lại (phòng Help), khóa theo câu hỏi đã chuẩn hóa,
+    phiên bản prompt hệ thống và biến thể cá nhân hóa. Loại bỏ theo LRU (AI_CACHE_MAX_ENTRIES) và TTL.
+    Khóa không chứa ngữ cảnh hội thoại nên chỉ dùng cho lượt sinh không kèm ngữ cảnh riêng của user (xem ai_logic.py).
+    Single-flight: các request giống nhau đến cùng lúc chỉ tạo một lượt sinh, các request sau chờ kết quả.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        # key -> (câu trả lời, thời điểm lưu)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+
+    def make_key(self, prompt: str, version: str, variant: str) -> Optional[str]:
+        """
+        Trả về None nếu câu hỏi không nên cache (quá ngắn/quá dài, dễ phụ thuộc ngữ cảnh hội thoại).
+        """
+        normalized = normalize_prompt(prompt)
+        if not (settings.AI_CACHE_MIN_CHARS <= len(normalized) <= settings.AI_CACHE_MAX_CHARS):
+            return None
+        return f"{version}|{variant}|{normalized}"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def lookup(self, key: str) -> Tuple[Optional[str], bool]:
+        """
+        Trả về (câu trả lời đã cache, là_leader).
+        - Có sẵn trong cache: (response, False).
+        - Đang có request khác sinh cùng câu hỏi: chờ kết quả của nó (tối đa AI_CACHE_WAIT_SECONDS);
+          nếu nó lỗi, bị bỏ hoặc quá thời gian thì trả về (None, False) để tự sinh.
+        - Chưa có: (None, True) - request này là leader, phải gọi complete() hoặc fail().
+        """
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response, False
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=settings.AI_CACHE_WAIT_SECONDS), False
+            except asyncio.TimeoutError:
+                self.wait_timeouts += 1
+                return None, False
+            except Exception:
+                return None, False
+
+        self.misses += 1
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        return None, True
+
+    def complete(self, key: str, response: str):
+        if response:
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def fail(self, key: str, error: BaseException):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error if isinstance(error, Exception) else Exception(str(error)))
+            # Tránh cảnh báo "exception was never retrieved" khi không có request nào chờ
+            future.exception()
+
+    def abandon(self, key: str):
+        """
+        Leader không lưu kết quả (bị dừng, thoát sớm, hoặc câu trả lời phụ thuộc ngữ cảnh riêng của user):
+        giải phóng các request đang chờ để chúng tự sinh. Không làm gì nếu đã complete()/fail().
+        """
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "wait_timeouts": self.wait_timeouts,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+ai_response_cache = AIResponseCache(settings.AI_CACHE_MAX_ENTRIES, settings.AI_CACHE_TTL_SECONDS)
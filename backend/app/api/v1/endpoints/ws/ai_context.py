@@ -0,0 +1,244 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, List, Optional, Set
+from backend.app.db.session import db
+from backend.app.core.config import settings
+from .constants import SELF_ISOLATED_ROOMS
+from .partitions import partitions
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Bạn là bộ tóm tắt hội thoại của LinkUp. Cập nhật bản tóm tắt hiện có bằng các tin nhắn mới. "
+    "Giữ lại: chủ đề chính, quyết định, câu hỏi còn mở, thông tin người dùng đã cung cấp. "
+    "Viết bằng tiếng Việt, gạch đầu dòng ngắn gọn, không quá {max_words} từ. Chỉ trả về bản tóm tắt."
+)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Ước lượng số token (tiếng Việt có dấu trung bình ~3 ký tự/token), đủ chính xác để giữ prompt trong ngân sách.
+    """
+    return len(text) // 3 + 1 if text else 0
+
+def conversation_key(room_id: str, user_id: Optional[str]) -> str:
+    # Phòng biệt lập (AI/Help): mỗi user có một hội thoại và bản tóm tắt riêng
+    return f"{room_id}:{user_id}" if room_id in SELF_ISOLATED_ROOMS and user_id else room_id
+
+def _conversation_filter(room_id: str, user_id: Optional[str]) -> dict:
+    if room_id in SELF_ISOLATED_ROOMS and user_id:
+        return partitions.filter(room_id, user_id)
+    return {"room_id": room_id}
+
+def _format_line(msg: dict, max_chars: int) -> str:
+    sender = msg.get("sender_name") or "AI"
+    content = (msg.get("content") or "").replace("\n", " ")
+    if len(content) > max_chars:
+        content = content[:max_chars] + "…"
+    return f"[{sender}]: {content}"
+
+class AIContextBuilder:
+    """
+    Dựng ngữ cảnh cho AI trong giới hạn token (AI_CONTEXT_TOKEN_BUDGET):
+    tin nhắn gần nhất giữ nguyên văn (mới nhất trước, dừng khi hết ngân sách) + bản tóm tắt cuốn chiếu
+    của phần hội thoại cũ hơn (collection room_summaries). Bản tóm tắt được cập nhật dần trong nền
+    mỗi khi có thêm AI_SUMMARY_BATCH tin nằm ngoài cửa sổ nguyên văn, nên kích thước prompt
+    luôn bị chặn trên dù hội thoại dài đến đâu.
+    Lượt tóm tắt đi qua ai_scheduler (ưu tiên thấp nhất, chung giới hạn đồng thời) và trừ quota AI như
+    lượt trả lời; mỗi hội thoại được xét tối đa một lần mỗi AI_SUMMARY_DEBOUNCE_SECONDS.
+    """
+    def __init__(self):
+        # Hội thoại đang dùng AI (từ lần build gần nhất tới khi lượt tóm tắt xong) - chỉ những hội thoại này được đếm tin mới
+        self._active: Set[str] = set()
+        self._pending: Dict[str, int] = {}
+        # Hội thoại có lượt tóm tắt đang chờ/chạy trong bộ lập lịch
+        self._scheduled: Set[str] = set()
+        # key -> thời điểm lên lịch gần nhất (theo thứ tự thời gian, để dọn các mục hết hạn debounce)
+        self._last_scheduled: "OrderedDict[str, float]" = OrderedDict()
+        self.summaries_updated = 0
+        self.debounced = 0
+        self.quota_fallbacks = 0
+
+    async def build(
+        self,
+        room_id: str,
+        user_id: Optional[str] = None,
+        exclude_message_id: Optional[str] = None,
+        header: str = "",
+        budget_tokens: Optional[int] = None
+    ) -> str:
+        budget = budget_tokens or settings.AI_CONTEXT_TOKEN_BUDGET
+        key = conversation_key(room_id, user_id)
+        self._active.add(key)
+
+        summary_doc = await db["room_summaries"].find_one({"_id": key})
+        summary = (summary_doc or {}).get("summary") or ""
+        summarized_seq = (summary_doc or {}).get("summarized_seq", 0)
+
+        used = estimate_tokens(header)
+        summary_block = f"--- Tóm tắt hội thoại trước đó ---\n{summary}\n" if summary else ""
+        used += estimate_tokens(summary_block)
+
+        query = _conversation_filter(room_id, user_id)
+        recent = await db["messages"].find(
+            query, {"id": 1, "sender_name": 1, "content": 1, "seq": 1}
+        ).sort("timestamp", -1).limit(settings.AI_CONTEXT_MAX_MESSAGES).to_list(length=settings.AI_CONTEXT_MAX_MESSAGES)
+
+        lines: List[str] = []
+        for msg in recent:
+            if exclude_message_id and msg.get("id") == exclude_message_id:
+                continue
+            # Phần đã nằm trong bản tóm tắt không cần lặp lại nguyên văn
+            if summary and msg.get("seq") and msg["seq"] <= summarized_seq:
+                break
+            line = _format_line(msg, settings.AI_CONTEXT_MAX_MESSAGE_CHARS)
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+
+        self.schedule_summary(room_id, user_id)
+        return header + summary_block + "--- Lịch sử chat gần đây ---\n" + "".join(f"{line}\n" for line in lines)
+
+    def note_message(self, room_id: str, user_id: Optional[str] = None):
+        """
+        Gọi sau khi ghi một tin nhắn mới (chỉ thao tác bộ nhớ). Đủ AI_SUMMARY_BATCH tin mới trong một hội thoại
+        đang dùng AI thì lên lịch cập nhật bản tóm tắt.
+        """
+        key = conversation_key(room_id, user_id)
+        if key not in self._active:
+            return
+        self._pending[key] = self._pending.get(key, 0) + 1
+        if self._pending[key] >= settings.AI_SUMMARY_BATCH:
+            self.schedule_summary(room_id, user_id)
+
+    def schedule_summary(self, room_id: str, user_id: Optional[str] = None):
+        key = conversation_key(room_id, user_id)
+        if key in self._scheduled:
+            return
+        now = time.monotonic()
+        debounce = settings.AI_SUMMARY_DEBOUNCE_SECONDS
+        while self._last_scheduled:
+            oldest_key, at = next(iter(self._last_scheduled.items()))
+            if now - at < debounce:
+                break
+            del self._last_scheduled[oldest_key]
+        if key in self._last_scheduled:
+            # Giữ nguyên số tin đang chờ: lần note_message/build sau khoảng debounce sẽ lên lịch lại
+            self.debounced += 1
+            return
+        self._last_scheduled[key] = now
+        self._pending[key] = 0
+        self._scheduled.add(key)
+        asyncio.create_task(self._enqueue(room_id, user_id, key))
+
+    async def _enqueue(self, room_id: str, user_id: Optional[str], key: str):
+        from .ai_scheduler import ai_scheduler, PRIORITY_BACKGROUND
+        try:
+            # user_id riêng cho từng hội thoại: không chiếm lượt đồng thời của chính user, mỗi hội thoại chờ tối đa một lượt
+            accepted = await ai_scheduler.submit(
+                f"summary:{key}:{time.monotonic_ns()}", f"summary:{key}", room_id, PRIORITY_BACKGROUND,
+                partial(self._update_summary, room_id, user_id, key), kind="summary"
+            )
+        except Exception as e:
+            print(f"Error scheduling AI summary for {key}: {e}")
+            accepted = False
+        if not accepted:
+            self._finish(key)
+
+    def _finish(self, key: str):
+        self._scheduled.discard(key)
+        self._active.discard(key)
+        self._pending.pop(key, None)
+
+    async def _update_summary(self, room_id: str, user_id: Optional[str], key: str):
+        try:
+            summary_doc = await db["room_summaries"].find_one({"_id": key}) or {}
+            summarized_seq = summary_doc.get("summarized_seq", 0)
+
+            query = _conversation_filter(room_id, user_id)
+            query["seq"] = {"$gt": summarized_seq}
+            limit = settings.AI_SUMMARY_BATCH * 5 + settings.AI_SUMMARY_KEEP_RECENT
+            backlog = await db["messages"].find(
+                query, {"sender_name": 1, "content": 1, "seq": 1}
+            ).sort("seq", 1).limit(limit).to_list(length=limit)
+
+            # Các tin gần nhất luôn được đưa nguyên văn vào prompt nên chưa cần tóm tắt
+            candidates = backlog[:-settings.AI_SUMMARY_KEEP_RECENT] if settings.AI_SUMMARY_KEEP_RECENT else backlog
+            if len(candidates) < settings.AI_SUMMARY_BATCH:
+                return
+
+            new_summary = await self._summarize(room_id, user_id, summary_doc.get("summary") or "", candidates)
+            # Điều kiện summarized_seq: bỏ qua nếu worker khác vừa cập nhật trước
+            await db["room_summaries"].update_one(
+                {"_id": key, "summarized_seq": summarized_seq} if summary_doc else {"_id": key},
+                {"$set": {
+                    "room_id": room_id,
+                    "summary": new_summary,
+                    "summarized_seq": candidates[-1]["seq"],
+                    "updated_at": datetime.now(timezone.utc)
+                }},
+                upsert=not summary_doc
+            )
+            self.summaries_updated += 1
+        except Exception as e:
+            print(f"Error updating AI summary for {key}: {e}")
+        finally:
+            self._finish(key)
+
+    async def _summarize(self, room_id: str, user_id: Optional[str], previous: str, messages: List[dict]) -> str:
+        max_tokens = settings.AI_SUMMARY_MAX_TOKENS
+        transcript = "\n".join(_format_line(m, settings.AI_CONTEXT_MAX_MESSAGE_CHARS) for m in messages)
+
+        from backend.app.core.admin_config import get_system_config
+        from backend.app.core.ai_quota import ai_quota
+        sys_config = await get_system_config(db)
+        if sys_config.get("ai_enabled", True):
+            # Tóm tắt tốn một lượt gọi model như câu trả lời: hội thoại riêng trừ quota của user, phòng chung trừ quota phòng
+            if room_id in SELF_ISOLATED_ROOMS and user_id:
+                limits = [(f"user:{user_id}", sys_config.get("ai_limit_per_user", 50))]
+            else:
+                limits = [(f"room:{room_id}", sys_config.get("ai_limit_per_group", 200))]
+            reservation, exhausted = await ai_quota.reserve(db, limits)
+            if exhausted:
+                self.quota_fallbacks += 1
+            else:
+                from .ai_logic import generate_with_failover
+                prompt = f"Bản tóm tắt hiện có:\n{previous or '(chưa có)'}\n\nTin nhắn mới:\n{transcript}"
+                try:
+                    parts = []
+                    async for _, chunk in generate_with_failover(
+                        SUMMARY_SYSTEM_PROMPT.format(max_words=max_tokens // 2), prompt
+                    ):
+                        parts.append(chunk)
+                    summary = "".join(parts).strip()
+                    if summary:
+                        return self._trim(summary, max_tokens)
+                except Exception as e:
+                    print(f"⚠️ AI summary failed, using extractive fallback: {e}")
+                await ai_quota.refund(db, reservation)
+
+        # Dự phòng khi AI tắt/lỗi: giữ các dòng rút gọn mới nhất trong ngân sách
+        lines = (previous.splitlines() if previous else []) + [_format_line(m, 120) for m in messages]
+        return self._trim("\n".join(lines), max_tokens)
+
+    @staticmethod
+    def _trim(summary: str, max_tokens: int) -> str:
+        lines = summary.splitlines()
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        text = "\n".join(lines)
+        return text[:max_tokens * 3]
+
+    def stats(self) -> dict:
+        return {
+            "active_conversations": len(self._active),
+            "scheduled_updates": len(self._scheduled),
+            "summaries_updated": self.summaries_updated,
+            "debounced": self.debounced,
+            "quota_fallbacks": self.quota_fallbacks
+        }
+
+context_builder = AIContextBuilder()
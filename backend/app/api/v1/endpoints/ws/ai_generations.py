@@ -0,0 +1,75 @@
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Lý do dừng một lượt AI
+CANCEL_USER = "user"              # User bấm dừng (frame 'cancel_ai')
+CANCEL_SUPERSEDED = "superseded"  # User gửi yêu cầu mới trong cùng phòng
+
+class RunningGeneration:
+    __slots__ = ("message_id", "user_id", "room_id", "is_suggestion", "task", "cancel_reason")
+
+    def __init__(self, message_id: str, user_id: str, room_id: str, is_suggestion: bool, task: Optional[asyncio.Task]):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.room_id = room_id
+        self.is_suggestion = is_suggestion
+        self.task = task
+        self.cancel_reason: Optional[str] = None
+
+class AIGenerationRegistry:
+    """
+    Các lượt AI đang chờ/stream, khóa theo ai_msg_id. Lượt được giữ chỗ (task=None) ngay khi vào bộ lập lịch,
+    nên cancel_ai đến lúc còn chờ hoặc đang kiểm tra quota/dựng prompt vẫn được ghi nhận và áp dụng khi stream bắt đầu.
+    Chỉ phần gọi model/stream được gắn task nên hủy sẽ dừng provider ngay tại điểm await hiện tại;
+    phần lưu câu trả lời dang dở vẫn chạy bình thường.
+    """
+    def __init__(self):
+        self._running: Dict[str, RunningGeneration] = {}
+        self.cancelled: Counter = Counter()
+
+    def reserve(self, message_id: str, user_id: str, room_id: str, is_suggestion: bool):
+        """Giữ chỗ cho lượt vừa vào bộ lập lịch (chưa có task stream)."""
+        self._running.setdefault(message_id, RunningGeneration(message_id, user_id, room_id, is_suggestion, None))
+
+    def register(self, message_id: str, user_id: str, room_id: str, is_suggestion: bool, task: asyncio.Task):
+        """Gắn task stream; lượt đã bị hủy khi còn giữ chỗ thì dừng task ngay."""
+        entry = self._running.get(message_id)
+        if entry is None:
+            self._running[message_id] = RunningGeneration(message_id, user_id, room_id, is_suggestion, task)
+            return
+        entry.task = task
+        if entry.cancel_reason:
+            task.cancel()
+
+    def unregister(self, message_id: str) -> Optional[str]:
+        """Bỏ đăng ký, trả về lý do nếu lượt này đã bị hủy."""
+        entry = self._running.pop(message_id, None)
+        return entry.cancel_reason if entry else None
+
+    def cancel_reason(self, message_id: str) -> Optional[str]:
+        entry = self._running.get(message_id)
+        return entry.cancel_reason if entry else None
+
+    def cancel(self, message_id: str, user_id: str, reason: str = CANCEL_USER) -> bool:
+        """Chỉ người đã yêu cầu lượt trả lời mới được hủy nó. Lượt còn giữ chỗ chỉ được đánh dấu (xem register)."""
+        entry = self._running.get(message_id)
+        if entry is None or entry.user_id != user_id or entry.cancel_reason or (entry.task and entry.task.done()):
+            return False
+        entry.cancel_reason = reason
+        if entry.task:
+            entry.task.cancel()
+        self.cancelled[reason] += 1
+        return True
+
+    def running_for(self, user_id: str, room_id: str, is_suggestion: bool) -> List[str]:
+        return [
+            e.message_id for e in self._running.values()
+            if e.user_id == user_id and e.room_id == room_id and e.is_suggestion == is_suggestion
+        ]
+
+    def stats(self) -> dict:
+        streaming = sum(1 for e in self._running.values() if e.task)
+        return {"running": streaming, "reserved": len(self._running) - streaming, "cancelled": dict(self.cancelled)}
+
+ai_generations = AIGenerationRegistry()
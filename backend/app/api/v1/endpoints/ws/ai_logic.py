@@ -1,42 +1,211 @@
 import uuid
+import time
 import asyncio
 from datetime import datetime, timezone
 from typing import List, Optional
-from google import genai
-from google.genai import types
-from langchain_openai import ChatOpenAI
 from backend.app.db.session import db
-from backend.app.core.admin_config import get_system_api_key
+from backend.app.core.config import settings
+from backend.app.core.ai_providers import ai_providers, AIProvider, AIProviderNotConfigured
+from backend.app.core.model_health import model_health
+from backend.app.core.ai_quota import ai_quota
+from backend.app.core.faq_kb import faq_kb, format_faq_context
+from backend.app.core.sentiment import sentiment_scorer, sentiment_label
+from backend.app.core.ai_telemetry import ai_telemetry
+from backend.app.core.log_sink import log_sink
+from backend.app.core.runtime_cache import runtime_cache
 from .manager import manager
-from .constants import SELF_ISOLATED_ROOMS, LINKUP_SYSTEM_PROMPT
+from .constants import SELF_ISOLATED_ROOMS, LINKUP_SYSTEM_PROMPT, DEFAULT_HELP_FAQ
+from .receipts import next_message_seq, next_conversation_seq, increment_unread
+from .ai_stream import ChunkCoalescer, ai_streams
+from .ai_cache import ai_response_cache, prompt_version
+from .ai_retrieval import retrieval_service, format_snippets
+from .support_threads import note_reply, upsert_thread
+from .partitions import message_conversation_id
+from .ai_context import estimate_tokens
+from .ai_scheduler import ai_scheduler
+from .ai_generations import ai_generations
 
 # Danh sách dự phòng theo yêu cầu: Ưu tiên model mới nhất và fallback dần
-fallback_models = [
+# (AI_FALLBACK_MODELS ghi đè, ví dụ "fake-bench" để chạy offline với provider giả lập)
+fallback_models = [m.strip() for m in settings.AI_FALLBACK_MODELS.split(",") if m.strip()] or [
     "gemini-3-flash-preview", 
     "gemini-3-flash",        
     "gemini-2.5-flash", 
     "gemini-2.5-flash-lite"
 ]
 
-async def get_ai_model(db_instance, model_name="gemini-1.5-flash"):
-    if "gpt" in model_name.lower():
-        api_key = await get_system_api_key(db_instance, "openai")
-        if not api_key: 
-            print("⚠️ OpenAI API Key is missing.")
-            return None
-        return ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            streaming=True
-        )
-    
-    api_key = await get_system_api_key(db_instance, "google")
-    if not api_key:
-        print("⚠️ Google API Key is missing.")
+async def get_ai_model(db_instance, model_name="gemini-1.5-flash") -> Optional[AIProvider]:
+    """
+    Chọn provider cho model (xem core/ai_providers.py). Trả về None nếu provider chưa có API key.
+    """
+    provider = ai_providers.resolve(model_name)
+    if not await provider.is_configured(db_instance):
+        log_sink.print_throttled(f"api_key:{provider.name}", f"⚠️ {provider.name} API Key is missing.")
         return None
-        
-    client = genai.Client(api_key=api_key)
-    return client, model_name
+    return provider
+
+async def stream_model_text(model_name: str, system_prompt: str, final_prompt: str):
+    """
+    Stream phản hồi của một model, chỉ yield các đoạn văn bản khác rỗng.
+    """
+    provider = await get_ai_model(db, model_name=model_name)
+    if not provider:
+        raise AIProviderNotConfigured(f"No API key configured for {model_name}")
+
+    async for chunk_text in provider.stream(db, model_name, system_prompt, final_prompt):
+        if chunk_text:
+            yield chunk_text
+
+async def _first_chunk(stream):
+    return await stream.__anext__()
+
+async def _close_attempt(attempt: dict):
+    attempt["task"].cancel()
+    try:
+        await attempt["task"]
+    except (asyncio.CancelledError, Exception):
+        pass
+    try:
+        await attempt["stream"].aclose()
+    except Exception:
+        pass
+
+async def generate_with_failover(system_prompt: str, final_prompt: str):
+    """
+    Stream câu trả lời qua danh sách fallback_models, yield (model, đoạn văn bản).
+    - Model có circuit đang mở bị bỏ qua (xem core/model_health.py).
+    - Hedged mode (AI_HEDGE_ENABLED): nếu chưa có token đầu tiên sau AI_HEDGE_DELAY_MS, chạy thêm model kế tiếp
+      song song và giữ model nào stream trước, hủy các model còn lại.
+    - Lỗi giữa chừng sau khi đã stream: giữ phần đã gửi, không ghép thêm câu trả lời của model khác.
+    """
+    candidates = iter(model_health.candidates(fallback_models))
+    hedge_delay = settings.AI_HEDGE_DELAY_MS / 1000 if settings.AI_HEDGE_ENABLED else None
+    attempts = []
+    winner = None
+    first_chunk = None
+    last_error = None
+
+    def start_next() -> bool:
+        model = next(candidates, None)
+        if model is None:
+            return False
+        stream = stream_model_text(model, system_prompt, final_prompt)
+        attempts.append({
+            "model": model,
+            "stream": stream,
+            "task": asyncio.create_task(_first_chunk(stream)),
+            "started": time.perf_counter()
+        })
+        return True
+
+    start_next()
+    try:
+        while attempts and winner is None:
+            done, _ = await asyncio.wait(
+                [a["task"] for a in attempts],
+                timeout=hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Model hiện tại chưa trả token đầu tiên kịp hạn: hedge sang model kế tiếp
+                start_next()
+                continue
+
+            for attempt in [a for a in attempts if a["task"] in done]:
+                try:
+                    chunk = attempt["task"].result()
+                except StopAsyncIteration:
+                    last_error = Exception(f"Model {attempt['model']} returned an empty response")
+                    model_health.record_failure(attempt["model"], str(last_error))
+                except AIProviderNotConfigured as e:
+                    log_sink.print_throttled(f"not_configured:{attempt['model']}", f"⚠️ {e}")
+                    last_error = e
+                    model_health.release_probe(attempt["model"])
+                except Exception as e:
+                    log_sink.print_throttled(f"model:{attempt['model']}", f"⚠️ Model {attempt['model']} failed: {e}")
+                    last_error = e
+                    model_health.record_failure(attempt["model"], str(e))
+                else:
+                    if winner is None:
+                        winner, first_chunk = attempt, chunk
+                        attempts.remove(attempt)
+                    continue
+                attempts.remove(attempt)
+
+            if winner is None and not attempts:
+                start_next()
+    finally:
+        # Các model thua hedge (hoặc request bị hủy): dừng stream, trả lại lượt probe, không tính là lỗi
+        for attempt in attempts:
+            model_health.release_probe(attempt["model"])
+            await _close_attempt(attempt)
+
+    if winner is None:
+        if last_error: raise last_error
+        raise Exception("All models failed to respond")
+
+    model = winner["model"]
+    ttft_ms = (time.perf_counter() - winner["started"]) * 1000
+    recorded = False
+    try:
+        yield model, first_chunk
+        async for chunk in winner["stream"]:
+            yield model, chunk
+        model_health.record_success(model, ttft_ms)
+        recorded = True
+    except Exception as e:
+        log_sink.print_throttled(f"model:{model}", f"⚠️ Model {model} failed mid-stream: {e}")
+        model_health.record_failure(model, str(e))
+        recorded = True
+    finally:
+        if not recorded:
+            model_health.release_probe(model)
+
+def record_ai_telemetry(
+    model_name: Optional[str],
+    status: str,
+    queue_ms: Optional[float],
+    started: float,
+    first_token_at: Optional[float],
+    response: str = ""
+):
+    """
+    Ghi một lượt trả lời vào histogram hiệu năng (core/ai_telemetry.py).
+    Mức fallback là vị trí của model trong fallback_models; câu trả lời FAQ/cache được tính là provider "local".
+    """
+    if model_name in ("faq", "cache"):
+        provider, level = "local", None
+    elif model_name:
+        provider = ai_providers.resolve(model_name).name
+        level = fallback_models.index(model_name) if model_name in fallback_models else None
+    else:
+        provider, level = None, None
+    ai_telemetry.record(
+        model_name, provider, level,
+        status=status,
+        queue_ms=queue_ms,
+        ttft_ms=(first_token_at - started) * 1000 if first_token_at else None,
+        total_ms=(time.perf_counter() - started) * 1000,
+        output_tokens=estimate_tokens(response),
+        output_chars=len(response)
+    )
+
+async def resolve_ai_recipients(room_id: str, user_id: str, is_ai_room: bool, is_suggestion_mode: bool) -> List[str]:
+    """
+    Danh sách người nhận các frame AI của một lượt trả lời:
+    - Gợi ý do user chủ động yêu cầu (suggestion): chỉ người yêu cầu.
+    - Phòng AI: chính user; phòng Help thêm các Admin đang online.
+    - Phòng thường: toàn bộ thành viên.
+    """
+    if is_suggestion_mode:
+        return [user_id]
+    if is_ai_room:
+        recipients = [user_id]
+        if room_id == "help":
+            admins = await db["users"].find({"is_superuser": True, "is_online": True}, {"id": 1}).to_list(length=50)
+            recipients += [a["id"] for a in admins if a.get("id") and a["id"] != user_id]
+        return recipients
+    return await manager.get_room_member_ids(room_id)
 
 async def run_ai_generation_task(
     room_id: str, 
@@ -55,6 +224,16 @@ async def run_ai_generation_task(
     """
     Chạy xử lý AI trong background task để WebSocket không bị block.
     """
+    quota_reservation = None
+    coalescer = None
+    recipients = []
+    # Leader single-flight của cache Help: phải được giải phóng trên mọi nhánh thoát (xem finally cuối hàm)
+    cache_key = None
+    is_cache_leader = False
+    # Đo hiệu năng: TTFT và tổng thời gian tính từ lúc job rời hàng đợi
+    started = time.perf_counter()
+    first_token_at = None
+    current_model_name = None
     try:
         from backend.app.core.admin_config import get_system_config
         sys_config = await get_system_config(db)
@@ -64,24 +243,17 @@ async def run_ai_generation_task(
                 return
 
             if is_suggestion_mode:
-                members = await db["room_members"].find({"room_id": room_id}).to_list(length=100)
-                for member in members:
-                    if member["user_id"] != user_id:
-                        suggestion_data = data.copy()
-                        if suggestion_data["type"] == "message":
-                            suggestion_data["type"] = "ai_suggestion"
-                        else:
-                            suggestion_data["type"] = f"ai_suggestion_{suggestion_data['type']}"
-                        await manager.send_to_user(member["user_id"], suggestion_data)
-            elif is_ai_room:
-                await manager.send_to_user(user_id, data)
-                if room_id == "help":
-                    admins = await db["users"].find({"is_superuser": True, "is_online": True}).to_list(length=50)
-                    for admin in admins:
-                        if admin["id"] != user_id:
-                            await manager.send_to_user(admin["id"], data)
+                suggestion_data = data.copy()
+                if suggestion_data["type"] == "message":
+                    suggestion_data["type"] = "ai_suggestion"
+                else:
+                    suggestion_data["type"] = f"ai_suggestion_{suggestion_data['type']}"
+                await manager.send_to_users(recipients, suggestion_data)
             else:
-                await manager.broadcast_to_room(room_id, data)
+                await manager.send_to_users(recipients, data)
+
+        # Xác định người nhận một lần cho cả lượt sinh câu trả lời thay vì truy vấn DB cho từng chunk
+        recipients = await resolve_ai_recipients(room_id, user_id, is_ai_room, is_suggestion_mode)
 
         # 1. KIỂM TRA BẬT/TẮT AI HỆ THỐNG
         if not sys_config.get("ai_enabled", True):
@@ -106,7 +278,7 @@ async def run_ai_generation_task(
             })
             return
 
-        room_doc = await db["chat_rooms"].find_one({"id": room_id})
+        room_doc = await runtime_cache.room(db, room_id)
         if room_doc and room_doc.get("ai_restricted"):
             await send_ai_data({
                 "type": "message",
@@ -128,15 +300,11 @@ async def run_ai_generation_task(
             # Tự động chuyển về 'ai_processing' nếu AI đang phản hồi cho một thread đã đóng hoặc chưa rõ
             if not thread or thread.get("status") == "resolved":
                 new_status = "ai_processing"
-                await db["support_threads"].update_one(
-                    {"user_id": user_id},
-                    {"$set": {
-                        "status": new_status,
-                        "username": username,
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }},
-                    upsert=True
-                )
+                await upsert_thread(user_id, {"$set": {
+                    "status": new_status,
+                    "username": username,
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                }})
                 # Thông báo thời gian thực
                 await manager.send_to_user(user_id, {
                     "type": "support_status_update",
@@ -144,39 +312,35 @@ async def run_ai_generation_task(
                     "status": new_status
                 })
 
+        # User đã dừng lượt này khi còn chờ/kiểm tra: chưa giữ quota, chưa gửi frame nào nên chỉ báo hủy
+        stop_reason = ai_generations.cancel_reason(ai_msg_id)
+        if stop_reason:
+            await manager.send_to_user(user_id, {
+                "type": "ai_cancelled",
+                "message_id": ai_msg_id,
+                "room_id": room_id,
+                "reason": stop_reason
+            })
+            return
+
         # 3. KIỂM TRA GIỚI HẠN SỐ LƯỢNG (CHỈ ÁP DỤNG CHO USER THƯỜNG)
+        # Giữ chỗ nguyên tử trên bộ đếm theo ngày, hoàn trả nếu sinh câu trả lời thất bại
         if user_role != "admin" and "ai_unlimited" not in user_permissions:
-            today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Giới hạn cá nhân
-            user_calls = await db["ai_usage"].count_documents({
-                "user_id": user_id,
-                "timestamp": {"$gte": today_start},
-                "status": "success"
-            })
             user_limit = sys_config.get("ai_limit_per_user", 50)
-            if user_calls >= user_limit:
-                await send_ai_data({
-                    "type": "message",
-                    "room_id": room_id,
-                    "content": f"❌ Bạn đã hết lượt sử dụng AI hôm nay ({user_limit}/{user_limit}). Thử lại vào ngày mai nhé!",
-                    "sender": "Hệ thống",
-                    "is_error": True
-                })
-                return
-
-            # Giới hạn phòng (Group)
-            room_calls = await db["ai_usage"].count_documents({
-                "room_id": room_id,
-                "timestamp": {"$gte": today_start},
-                "status": "success"
-            })
             room_limit = sys_config.get("ai_limit_per_group", 200)
-            if room_calls >= room_limit:
+            quota_reservation, exhausted = await ai_quota.reserve(db, [
+                (f"user:{user_id}", user_limit),
+                (f"room:{room_id}", room_limit)
+            ])
+            if exhausted:
+                if exhausted.startswith("user:"):
+                    content = f"❌ Bạn đã hết lượt sử dụng AI hôm nay ({user_limit}/{user_limit}). Thử lại vào ngày mai nhé!"
+                else:
+                    content = f"❌ Phòng này đã hết lượt sử dụng AI hôm nay ({room_limit}/{room_limit})."
                 await send_ai_data({
                     "type": "message",
                     "room_id": room_id,
-                    "content": f"❌ Phòng này đã hết lượt sử dụng AI hôm nay ({room_limit}/{room_limit}).",
+                    "content": content,
                     "sender": "Hệ thống",
                     "is_error": True
                 })
@@ -193,6 +357,17 @@ async def run_ai_generation_task(
             "room_id": room_id
         })
 
+        # Cơ sở tri thức FAQ của phòng Help: khớp chắc chắn thì trả lời ngay không gọi model,
+        # khớp vừa thì chỉ đưa các mục liên quan vào prompt thay cho toàn bộ FAQ
+        faq_answer = None
+        faq_block = ""
+        if room_id == "help" and not is_suggestion_mode and settings.FAQ_ENABLED and len(faq_kb.index):
+            faq_answer, faq_context = faq_kb.lookup(prompt)
+            if faq_context:
+                faq_block = f"HƯỚNG DẪN FAQ & Hỗ trợ (LinkUp FAQ):\n{format_faq_context(faq_context)}\n\n"
+        elif room_id == "help":
+            faq_block = DEFAULT_HELP_FAQ
+
         if room_id == "help":
             ai_identity = "Hỗ trợ LinkUp"
             personalized_system_prompt = (
@@ -211,11 +386,7 @@ async def run_ai_generation_task(
                 "4. Nếu vấn đề vượt quá khả năng (lỗi hệ thống, khiếu nại, thanh toán) hoặc người dùng yêu cầu 'gặp admin', 'nhân viên hỗ trợ':\n"
                 "   → Bạn PHẢI trả lời: 'Vấn đề này cần nhân viên hỗ trợ kiểm tra thêm. Mình sẽ chuyển cuộc trò chuyện cho admin để hỗ trợ bạn tốt hơn nhé.'\n"
                 "5. KHÔNG bao giờ giả vờ là nhân viên thật hoặc con người.\n\n"
-                "HƯỚNG DẪN FAQ & Hỗ trợ (LinkUp FAQ):\n"
-                "- LinkUp là gì? Nền tảng chat thời gian thực kết nối cộng đồng.\n"
-                "- Cách tạo nhóm: Nhấn '+' ở danh sách phòng chat.\n"
-                "- Chat AI: Gõ @ai trong bất kỳ phòng nào hoặc vào phòng 'LinkUp AI'.\n"
-                "- Bảo mật: Hỗ trợ thu hồi tin nhắn, chặn người dùng.\n\n"
+                f"{faq_block}"
                 "CÁCH ỨNG XỬ\n"
                 "- Nếu chưa đủ thông tin: hỏi lại nhẹ nhàng.\n"
                 "- Nếu không chắc: nói rõ giới hạn của bạn.\n"
@@ -246,79 +417,137 @@ async def run_ai_generation_task(
         else:
             personalized_system_prompt += "\n\n[QUYỀN HẠN: THÀNH VIÊN] Bạn đang trả lời thành viên thông thường. Hãy trả lời thân thiện, ngắn gọn và tập trung vào các vấn đề người dùng thảo luận."
 
-        # 2.7 TÍCH HỢP PHÂN TÍCH THÁI ĐỘ (SENTIMENT ANALYSIS)
+        # 2.7 THÁI ĐỘ NGƯỜI DÙNG: điểm cảm xúc tính cục bộ, chỉ gửi một thẻ ngắn cho model
+        sentiment_tag = None
         if sys_config.get("ai_sentiment_analysis", False):
-            personalized_system_prompt += (
-                "\n\n[CHẾ ĐỘ: PHÂN TÍCH THÁI ĐỘ ĐANG BẬT]\n"
-                "- Hãy phân tích thái độ của người dùng qua tin nhắn mới nhất (ví dụ: Vui vẻ, Giận dữ, Thất vọng, Trung lập, Cần giúp đỡ gấp).\n"
-                "- Nếu thái độ tiêu cực (giận dữ, thất vọng), hãy bắt đầu câu trả lời bằng một câu đồng cảm ngắn gọn.\n"
-                "- Nếu người dùng đang rất hài lòng, hãy phản hồi một cách hào hứng.\n"
-                "- Luôn điều chỉnh tông giọng để xoa dịu hoặc khích lệ người dùng phù hợp với thái độ của họ."
-            )
+            sentiment_score = sentiment_scorer.score(prompt)
+            sentiment_tag = sentiment_label(sentiment_score)
+            personalized_system_prompt += f"\n\n[USER_SENTIMENT: {sentiment_tag} {sentiment_score:+.2f}]"
 
         full_response = ""
-        success = False
-        last_error = None
-        final_prompt = f"Dưới đây là ngữ cảnh cuộc trò chuyện gần nhất:\n{chat_context}\n\nNgười dùng vừa yêu cầu: {prompt}" if chat_context else prompt
+        current_model_name = None
+
+        # Lượt trả lời có stream chunk: giữ bộ đệm để client mất kết nối có thể nối tiếp (resume_ai)
+        stream_buffer = None
+        if is_ai_room and not is_suggestion_mode:
+            stream_buffer = ai_streams.start(ai_msg_id, room_id, recipients)
+        coalescer = ChunkCoalescer(send_ai_data, ai_msg_id, stream=stream_buffer)
 
-        for current_model_name in fallback_models:
+        # Cache câu trả lời cho các câu hỏi lặp lại trong phòng Help (kèm single-flight).
+        # Chỉ cache lượt không có ngữ cảnh riêng: prompt kèm hội thoại/lịch sử Help của user này
+        # không được phát lại cho user khác
+        cached_response = None
+        if room_id == "help" and not is_suggestion_mode and faq_answer is None and not chat_context:
+            variant = "|".join([
+                (user_prefs or {}).get("preferred_style") or "-",
+                (user_prefs or {}).get("language") or "-",
+                "admin" if user_role == "admin" or "ai_unlimited" in user_permissions else "member",
+                sentiment_tag or "-"
+            ])
+            cache_key = ai_response_cache.make_key(prompt, prompt_version(sys_config), variant)
+            if cache_key:
+                cached_response, is_cache_leader = await ai_response_cache.lookup(cache_key)
+
+        usage_status = "success"
+        if faq_answer is not None:
+            full_response = faq_answer.entry["answer"]
+            current_model_name = "faq"
+            usage_status = "faq_hit"
+        elif cached_response is not None:
+            full_response = cached_response
+            current_model_name = "cache"
+            usage_status = "cache_hit"
+
+        async def stream_reply():
+            nonlocal full_response, current_model_name, first_token_at, is_cache_leader
+            if usage_status != "success":
+                first_token_at = time.perf_counter()
+                # Phát lại qua cùng giao thức 'chunk' như câu trả lời sinh mới
+                step = max(1, settings.AI_STREAM_FLUSH_CHARS)
+                for i in range(0, len(full_response), step):
+                    await coalescer.add(full_response[i:i + step])
+                    await coalescer.flush()
+                return
+
+            final_prompt = f"Dưới đây là ngữ cảnh cuộc trò chuyện gần nhất:\n{chat_context}\n\nNgười dùng vừa yêu cầu: {prompt}" if chat_context else prompt
             try:
-                result = await get_ai_model(db, model_name=current_model_name)
-                if not result: continue
-                
-                if isinstance(result, tuple):
-                    client, target_model = result
-                    response_stream = await client.aio.models.generate_content_stream(
-                        model=target_model,
-                        contents=final_prompt,
-                        config=types.GenerateContentConfig(
-                            system_instruction=personalized_system_prompt,
-                            tools=[types.Tool(google_search=types.GoogleSearchRetrieval())]
-                        )
-                    )
-                    
-                    async for chunk in response_stream:
-                        chunk_text = chunk.text
-                        if chunk_text:
-                            full_response += chunk_text
-                            await send_ai_data({"type": "chunk", "message_id": ai_msg_id, "content": chunk_text})
-                else:
-                    llm = result
-                    from langchain_core.messages import SystemMessage, HumanMessage
-                    messages = [SystemMessage(content=personalized_system_prompt), HumanMessage(content=final_prompt)]
-                    async for chunk in llm.astream(messages):
-                        chunk_text = chunk.content
-                        if isinstance(chunk_text, list):
-                            chunk_text = "".join([str(p.get("text", p)) if isinstance(p, dict) else str(p) for p in chunk_text])
-                        if chunk_text:
-                            full_response += chunk_text
-                            await send_ai_data({"type": "chunk", "message_id": ai_msg_id, "content": chunk_text})
-                
-                if full_response:
-                    success = True
-                    break
-            except Exception as e:
-                print(f"⚠️ Model {current_model_name} failed: {e}")
-                last_error = e
-                continue
+                # Truy xuất các tin nhắn cũ liên quan (chỉ mục vector cục bộ của phòng, trong phạm vi user được xem)
+                if settings.AI_RETRIEVAL_ENABLED:
+                    try:
+                        snippets = await retrieval_service.search(room_id, user_id, prompt)
+                        if snippets:
+                            if is_cache_leader:
+                                # Câu trả lời dựa trên tin nhắn riêng của user: không lưu cache
+                                ai_response_cache.abandon(cache_key)
+                                is_cache_leader = False
+                            final_prompt = (
+                                f"Các tin nhắn cũ hơn trong phòng có liên quan tới câu hỏi:\n{format_snippets(snippets)}\n\n"
+                                + final_prompt
+                            )
+                    except Exception as e:
+                        log_sink.print_throttled("ai_retrieval", f"⚠️ AI retrieval failed: {e}")
+
+                async for current_model_name, chunk_text in generate_with_failover(personalized_system_prompt, final_prompt):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    full_response += chunk_text
+                    await coalescer.add(chunk_text)
+            except BaseException as e:
+                # Bị dừng giữa chừng: không cache câu trả lời dang dở, các request đang chờ tự sinh lại
+                if is_cache_leader:
+                    ai_response_cache.fail(cache_key, e)
+                raise
+            if is_cache_leader:
+                ai_response_cache.complete(cache_key, full_response)
+
+        # Phần stream chạy trong task riêng, đăng ký theo ai_msg_id để user dừng được (cancel_ai)
+        # hoặc bị thay thế bởi yêu cầu mới trong cùng phòng; hủy đến trong lúc dựng prompt thì task dừng ngay khi đăng ký
+        generation = asyncio.create_task(stream_reply())
+        ai_generations.register(ai_msg_id, user_id, room_id, is_suggestion_mode, generation)
+        try:
+            await generation
+        except asyncio.CancelledError:
+            if ai_generations.cancel_reason(ai_msg_id) is None:
+                # Chính lượt AI bị hủy (ví dụ server tắt): dừng luôn phần stream
+                generation.cancel()
+                raise
+        finally:
+            stop_reason = ai_generations.unregister(ai_msg_id)
+        await coalescer.close()
 
-        if not success:
-            if last_error: raise last_error
-            else: raise Exception("All models failed to respond")
+        if usage_status != "success" or stop_reason:
+            # Câu trả lời từ FAQ/cache và lượt bị dừng không tốn lượt gọi model
+            await ai_quota.refund(db, quota_reservation)
+            quota_reservation = None
 
-        # 3. GHI LOG SỬ DỤNG THÀNH CÔNG
-        await db["ai_usage"].insert_one({
+        # 3. GHI LOG SỬ DỤNG (trả lời từ FAQ/cache và lượt bị dừng được tính riêng)
+        usage_doc = {
             "message_id": ai_msg_id,
             "timestamp": datetime.now(timezone.utc),
             "user_id": user_id,
             "room_id": room_id,
-            "status": "success",
-            "model": current_model_name if 'current_model_name' in locals() else "unknown"
-        })
+            "status": "cancelled" if stop_reason else usage_status,
+            "model": current_model_name or "unknown"
+        }
+        if stop_reason:
+            usage_doc["stop_reason"] = stop_reason
+        log_sink.emit("ai_usage", usage_doc)
+        # Lượt đã được dùng, không hoàn trả kể cả khi các bước sau lỗi
+        quota_reservation = None
+        record_ai_telemetry(
+            current_model_name, "cancelled" if stop_reason else "ok",
+            ai_scheduler.queue_wait_ms(ai_msg_id), started, first_token_at, full_response
+        )
+        # Lượt bị dừng trước khi có nội dung (hoặc gợi ý bị dừng): chỉ gửi frame kết thúc, không lưu tin nhắn
+        deliver_answer = not stop_reason or (bool(full_response) and not is_suggestion_mode)
 
         ai_final_ts = datetime.now(timezone.utc)
         
-        if not is_suggestion_mode:
+        if not is_suggestion_mode and deliver_answer:
+            if room_id in SELF_ISOLATED_ROOMS:
+                ai_seq = await next_conversation_seq(room_id, user_id, ai_final_ts)
+            else:
+                ai_seq = await next_message_seq({"id": room_id}, ai_final_ts)
             db_ai_msg = {
                 "id": ai_msg_id,
                 "content": full_response,
@@ -328,13 +557,22 @@ async def run_ai_generation_task(
                 "receiver_id": user_id if room_id in SELF_ISOLATED_ROOMS else None,
                 "room_id": room_id,
                 "timestamp": ai_final_ts,
+                "seq": ai_seq,
                 "is_bot": True,
                 "deleted_by_users": []
             }
+            if stop_reason:
+                db_ai_msg["is_stopped"] = True
+            partition_key = message_conversation_id(db_ai_msg)
+            if partition_key:
+                db_ai_msg["conversation_id"] = partition_key
             await db["messages"].insert_one(db_ai_msg)
-            await db["chat_rooms"].update_one({"id": room_id}, {"$set": {"updated_at": ai_final_ts}})
+            retrieval_service.note_message(db_ai_msg, user_id)
+            if room_id == "help":
+                await note_reply(user_id, db_ai_msg, "bot")
+            await increment_unread(room_id, receiver_id=db_ai_msg["receiver_id"], seq=db_ai_msg.get("seq"))
 
-        await send_ai_data({
+        final_message = {
             "type": "message",
             "message_id": ai_msg_id,
             "sender_id": None,
@@ -345,40 +583,52 @@ async def run_ai_generation_task(
             "is_bot": True,
             "room_id": room_id,
             "timestamp": ai_final_ts.isoformat()
-        })
-
-        await send_ai_data({
+        }
+        end_frame = {
             "type": "end",
             "message_id": ai_msg_id,
             "room_id": room_id,
             "timestamp": ai_final_ts.isoformat()
-        })
+        }
+        if stop_reason:
+            final_message["is_stopped"] = True
+            end_frame["stopped"] = stop_reason
+        final_frames = [final_message, end_frame] if deliver_answer else [end_frame]
+        # Client kết nối lại trong thời gian chờ vẫn nhận được các frame kết thúc
+        ai_streams.finish(ai_msg_id, final_frames)
+
+        for frame in final_frames:
+            await send_ai_data(frame)
         
         await send_ai_data({"type": "typing", "room_id": room_id, "status": False})
 
     except Exception as e:
-        print(f"❌ Background AI Error: {e}")
-        # GHI LOG LỖI MỚI THEO MVP
-        try:
-            await db["ai_usage"].insert_one({
-                "timestamp": datetime.now(timezone.utc),
-                "user_id": user_id,
-                "room_id": room_id,
-                "status": "error",
-                "error_msg": str(e)
-            })
-        except: pass
+        log_sink.print_throttled("ai_error", f"❌ Background AI Error: {e}")
+        await ai_quota.refund(db, quota_reservation)
+        quota_reservation = None
+        if coalescer:
+            coalescer.discard()
+        ai_streams.finish(ai_msg_id, failed=True)
+        # GHI LOG LỖI (theo lô; khi quá tải các lỗi giống nhau được gộp bằng trường count)
+        error_key = str(e)[:200]
+        error_ts = datetime.now(timezone.utc)
+        log_sink.emit("ai_usage", {
+            "timestamp": error_ts,
+            "user_id": user_id,
+            "room_id": room_id,
+            "status": "error",
+            "error_msg": str(e)
+        }, coalesce_key=f"error:{error_key}")
+        record_ai_telemetry(current_model_name, "error", ai_scheduler.queue_wait_ms(ai_msg_id), started, first_token_at)
 
         # Log error to system
-        try:
-            await db["system_logs"].insert_one({
-                "type": "ai_error",
-                "message": str(e),
-                "room_id": room_id,
-                "user_id": user_id,
-                "timestamp": datetime.now(timezone.utc)
-            })
-        except: pass
+        log_sink.emit("system_logs", {
+            "type": "ai_error",
+            "message": str(e),
+            "room_id": room_id,
+            "user_id": user_id,
+            "timestamp": error_ts
+        }, coalesce_key=f"ai_error:{error_key}")
 
         await send_ai_data({"type": "typing", "room_id": room_id, "status": False})
         try:
@@ -391,3 +641,11 @@ async def run_ai_generation_task(
                 "timestamp": datetime.now(timezone.utc).isoformat()
             })
         except: pass
+    finally:
+        # Bị hủy/thoát sớm trước khi leader lưu kết quả: các request chờ cùng câu hỏi tự sinh (no-op nếu đã complete/fail)
+        if is_cache_leader:
+            ai_response_cache.abandon(cache_key)
+        # Lượt còn giữ chỗ (chưa dùng, chưa hoàn trả) nghĩa là task bị hủy (CancelledError: server tắt, scheduler bỏ)
+        # trước khi có câu trả lời - CancelledError không đi qua nhánh except Exception nên hoàn trả ở đây
+        if quota_reservation is not None:
+            await ai_quota.refund(db, quota_reservation)
@@ -0,0 +1,283 @@
+import asyncio
+import re
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from backend.app.db.session import db
+from backend.app.core.config import settings
+from backend.app.core.content_filter import fold_text
+from backend.app.core.log_sink import log_sink
+from .constants import SELF_ISOLATED_ROOMS
+from .partitions import partitions
+
+_NON_WORD = re.compile(r"[^\w]+")
+# Trọng số đặc trưng: từ đơn, cặp từ, n-gram ký tự (bền với lỗi gõ/biến thể từ)
+_WEIGHT_WORD = 1.0
+_WEIGHT_BIGRAM = 1.0
+_WEIGHT_CHAR = 0.5
+
+def _features(text: str):
+    words = _NON_WORD.sub(" ", fold_text(text or "")).split()
+    for i, word in enumerate(words):
+        yield word, _WEIGHT_WORD
+        if i:
+            yield f"{words[i - 1]} {word}", _WEIGHT_BIGRAM
+        if len(word) > 3:
+            padded = f"#{word}#"
+            for j in range(len(padded) - 2):
+                yield padded[j:j + 3], _WEIGHT_CHAR
+
+def embed_texts(texts: List[str], dim: int) -> np.ndarray:
+    """
+    Vector n-gram băm (hashing trick có dấu) - hoàn toàn offline, không cần model embedding.
+    Trả về ma trận float32 (len(texts), dim) đã chuẩn hóa L2 để tích vô hướng chính là cosine.
+    """
+    rows: List[int] = []
+    cols: List[int] = []
+    vals: List[float] = []
+    for r, text in enumerate(texts):
+        for feature, weight in _features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(r)
+            cols.append(h % dim)
+            vals.append(weight if h & 0x80000000 else -weight)
+
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def retrieval_key(room_id: str, user_id: Optional[str]) -> str:
+    # Phòng biệt lập (AI/Help): mỗi user một chỉ mục riêng, không bao giờ thấy hội thoại của người khác
+    return f"{room_id}:{user_id}" if room_id in SELF_ISOLATED_ROOMS and user_id else room_id
+
+class RoomVectorIndex:
+    """
+    Chỉ mục vector của một phòng: ma trận float32 tăng dần (gấp đôi dung lượng khi đầy),
+    thêm tin nhắn mới không cần dựng lại, tìm top-k cosine bằng một phép nhân ma trận.
+    """
+    def __init__(self, room_id: str, dim: int, capacity: int = 1024):
+        self.room_id = room_id
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.seqs = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.last_seq = 0
+        self.ids: List[str] = []
+        self.meta: List[dict] = []
+        self.row_of: Dict[str, int] = {}
+        # user_id -> các dòng user đã "xóa phía tôi"
+        self.hidden: Dict[str, Set[int]] = {}
+
+    def _grow(self, needed: int):
+        capacity = len(self.seqs)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("vectors", "seqs", "alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, messages: List[dict], vectors: Optional[np.ndarray] = None):
+        # Chỉ nhận tin mới hơn tin cuối đã có (tránh trùng khi nạp và thêm dần chạy đan xen)
+        keep = [i for i, m in enumerate(messages) if (m.get("seq") or 0) > self.last_seq]
+        if not keep:
+            return
+        messages = [messages[i] for i in keep]
+        if vectors is None:
+            vectors = embed_texts([m.get("content") or "" for m in messages], self.dim)
+        elif len(keep) != len(vectors):
+            vectors = vectors[keep]
+        start = self.size
+        self._grow(start + len(messages))
+        self.vectors[start:start + len(messages)] = vectors
+        for offset, msg in enumerate(messages):
+            row = start + offset
+            self.seqs[row] = msg.get("seq") or 0
+            self.alive[row] = not msg.get("is_recalled") and bool(msg.get("content"))
+            self.ids.append(msg.get("id"))
+            self.meta.append({
+                "sender_name": msg.get("sender_name") or "AI",
+                "timestamp": msg.get("timestamp"),
+                "content": (msg.get("content") or "")[:500]
+            })
+            if msg.get("id"):
+                self.row_of[msg["id"]] = row
+            for uid in msg.get("deleted_by_users") or []:
+                self.hidden.setdefault(uid, set()).add(row)
+        self.size = start + len(messages)
+        self.last_seq = max(self.last_seq, int(self.seqs[self.size - 1]))
+
+    def update(self, message_id: str, content: Optional[str] = None, removed: bool = False, hidden_for: Optional[str] = None):
+        row = self.row_of.get(message_id)
+        if row is None:
+            return
+        if removed:
+            self.alive[row] = False
+        if hidden_for:
+            self.hidden.setdefault(hidden_for, set()).add(row)
+        if content is not None and not removed:
+            self.vectors[row] = embed_texts([content], self.dim)[0]
+            self.meta[row]["content"] = content[:500]
+
+    def search(self, query_vector: np.ndarray, user_id: Optional[str], k: int, max_seq: Optional[int] = None, min_score: float = 0.0) -> List[dict]:
+        n = self.size
+        if not n:
+            return []
+        scores = self.vectors[:n] @ query_vector
+        visible = self.alive[:n].copy()
+        if max_seq is not None:
+            visible &= self.seqs[:n] <= max_seq
+        hidden_rows = self.hidden.get(user_id) if user_id else None
+        if hidden_rows:
+            visible[np.fromiter(hidden_rows, dtype=np.int64)] = False
+        scores = np.where(visible, scores, -np.inf)
+
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score < min_score:
+                break
+            results.append({"id": self.ids[row], "seq": int(self.seqs[row]), "score": round(score, 4), **self.meta[row]})
+        return results
+
+class RetrievalService:
+    """
+    Quản lý chỉ mục vector theo phòng: nạp nền từ MongoDB theo từng trang khi AI cần lần đầu (embedding chạy
+    trong thread), sau đó thêm dần từng tin mới. Yêu cầu gặp chỉ mục chưa nạp xong không chờ mà bỏ qua truy xuất,
+    nên token đầu tiên không bị trễ. Giữ tối đa AI_RETRIEVAL_MAX_INDEXES chỉ mục và AI_RETRIEVAL_MAX_MB bộ nhớ (LRU).
+    """
+    def __init__(self):
+        self._indexes: "OrderedDict[str, RoomVectorIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._load_slots: Optional[asyncio.Semaphore] = None
+        self.skipped_cold = 0
+
+    async def _load(self, room_id: str, user_id: Optional[str], key: str) -> RoomVectorIndex:
+        query = partitions.filter(room_id, user_id) if room_id in SELF_ISOLATED_ROOMS and user_id else {"room_id": room_id}
+        query["seq"] = {"$gt": 0}
+        projection = {"id": 1, "seq": 1, "content": 1, "sender_name": 1, "timestamp": 1, "is_recalled": 1, "deleted_by_users": 1}
+        limit = settings.AI_RETRIEVAL_MAX_MESSAGES
+        page = max(1, settings.AI_RETRIEVAL_PAGE_SIZE)
+        index = RoomVectorIndex(room_id, settings.AI_RETRIEVAL_DIM, capacity=min(1024, max(limit, 1)))
+
+        # Chỉ giữ AI_RETRIEVAL_MAX_MESSAGES tin mới nhất: bắt đầu từ seq của tin thứ `limit` tính từ cuối
+        floor = await db["messages"].find(query, {"seq": 1}).sort("seq", -1).skip(max(limit - 1, 0)).limit(1).to_list(length=1)
+        if floor:
+            index.last_seq = int(floor[0]["seq"]) - 1
+
+        # Nạp tăng dần theo seq từng trang (bộ nhớ tạm chỉ một trang); vòng lặp chạy tới khi bắt kịp
+        # cả các tin được ghi trong lúc đang nạp
+        while True:
+            query["seq"] = {"$gt": index.last_seq}
+            docs = await db["messages"].find(query, projection).sort("seq", 1).limit(page).to_list(length=page)
+            if not docs:
+                break
+            vectors = await asyncio.to_thread(embed_texts, [d.get("content") or "" for d in docs], index.dim)
+            index.add(docs, vectors)
+            if len(docs) < page:
+                break
+        return index
+
+    async def _build(self, room_id: str, user_id: Optional[str], key: str):
+        if self._load_slots is None:
+            self._load_slots = asyncio.Semaphore(2)
+        try:
+            async with self._load_slots:
+                index = await self._load(room_id, user_id, key)
+            self._indexes[key] = index
+            self._evict()
+        except Exception as e:
+            log_sink.print_throttled("ai_retrieval_load", f"⚠️ Retrieval index load failed for {key}: {e}")
+        finally:
+            self._loading.pop(key, None)
+
+    def _evict(self):
+        budget = settings.AI_RETRIEVAL_MAX_MB * 1_000_000
+        total = sum(idx.vectors.nbytes for idx in self._indexes.values())
+        while len(self._indexes) > 1 and (len(self._indexes) > settings.AI_RETRIEVAL_MAX_INDEXES or total > budget):
+            _, dropped = self._indexes.popitem(last=False)
+            total -= dropped.vectors.nbytes
+
+    def get_index(self, room_id: str, user_id: Optional[str]) -> Optional[RoomVectorIndex]:
+        """
+        Trả về chỉ mục nếu đã nạp; nếu chưa thì bắt đầu nạp nền và trả về None (không chờ).
+        """
+        key = retrieval_key(room_id, user_id)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            return index
+        if key not in self._loading:
+            self._loading[key] = asyncio.create_task(self._build(room_id, user_id, key))
+        return None
+
+    async def search(self, room_id: str, user_id: Optional[str], query: str, k: Optional[int] = None) -> List[dict]:
+        """
+        Tìm các tin nhắn cũ liên quan tới câu hỏi, chỉ trong phạm vi user được xem.
+        Bỏ qua AI_SUMMARY_KEEP_RECENT tin gần nhất của chính hội thoại (đã có nguyên văn trong ngữ cảnh).
+        """
+        if not query or not query.strip():
+            return []
+        index = self.get_index(room_id, user_id)
+        if index is None:
+            self.skipped_cold += 1
+            return []
+        keep_recent = settings.AI_SUMMARY_KEEP_RECENT
+        if index.size <= keep_recent:
+            return []
+        # Các dòng xếp theo seq tăng dần và mỗi chỉ mục là một hội thoại, nên mốc cắt lấy theo vị trí dòng
+        # (seq không liên tiếp trong hội thoại AI/Help và trong các phòng có tin bị lọc)
+        max_seq = int(index.seqs[index.size - keep_recent - 1])
+        query_vector = embed_texts([query], index.dim)[0]
+        k = k or settings.AI_RETRIEVAL_TOP_K
+        if index.size > 20000:
+            return await asyncio.to_thread(index.search, query_vector, user_id, k, max_seq, settings.AI_RETRIEVAL_MIN_SCORE)
+        return index.search(query_vector, user_id, k, max_seq, settings.AI_RETRIEVAL_MIN_SCORE)
+
+    def _loaded_for_room(self, room_id: str) -> Iterable[RoomVectorIndex]:
+        return [idx for idx in self._indexes.values() if idx.room_id == room_id]
+
+    def note_message(self, message: dict, user_id: Optional[str] = None):
+        """
+        Thêm tin mới vào chỉ mục nếu chỉ mục của phòng đã nạp (đang nạp nền thì vòng nạp sẽ bắt kịp, chưa nạp thì lần nạp sau sẽ có).
+        """
+        index = self._indexes.get(retrieval_key(message.get("room_id"), user_id))
+        if index is not None:
+            index.add([message])
+
+    def note_update(self, room_id: str, message_id: str, content: Optional[str] = None, removed: bool = False, hidden_for: Optional[str] = None):
+        for index in self._loaded_for_room(room_id):
+            index.update(message_id, content=content, removed=removed, hidden_for=hidden_for)
+
+    def stats(self) -> dict:
+        return {
+            "loading": list(self._loading),
+            "skipped_cold": self.skipped_cold,
+            "total_mb": round(sum(idx.vectors.nbytes for idx in self._indexes.values()) / 1e6, 1),
+            "indexes": [
+                {"key": key, "messages": idx.size, "last_seq": idx.last_seq, "mb": round(idx.vectors.nbytes / 1e6, 1)}
+                for key, idx in self._indexes.items()
+            ]
+        }
+
+def format_snippets(snippets: List[dict]) -> str:
+    lines = []
+    for s in snippets:
+        ts = s.get("timestamp")
+        when = ts.strftime("%Y-%m-%d %H:%M") if isinstance(ts, datetime) else str(ts or "")[:16]
+        lines.append(f"[{when}] [{s['sender_name']}]: {s['content']}")
+    return "\n".join(lines)
+
+retrieval_service = RetrievalService()
@@ -0,0 +1,268 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from backend.app.core.config import settings
+from backend.app.core.model_health import percentile
+from .manager import manager
+from .ai_generations import ai_generations
+from .constants import SELF_ISOLATED_ROOMS
+
+# Lớp ưu tiên (số nhỏ chạy trước)
+PRIORITY_AI_ROOM = 0   # Chat trực tiếp trong phòng AI / Help
+PRIORITY_MENTION = 1   # Gọi @ai trong phòng thường
+PRIORITY_CATCHUP = 2   # Tiếp quản hỗ trợ khi Admin offline
+PRIORITY_BACKGROUND = 3  # Việc nền không có người chờ (tóm tắt hội thoại): không gửi frame nào cho user
+PRIORITY_NAMES = {
+    PRIORITY_AI_ROOM: "ai_room", PRIORITY_MENTION: "mention", PRIORITY_CATCHUP: "catchup",
+    PRIORITY_BACKGROUND: "background"
+}
+
+class AIJob:
+    __slots__ = ("job_id", "user_id", "room_id", "room_key", "priority", "factory", "seq", "enqueued_at", "position", "wait_ms", "kind")
+
+    def __init__(self, job_id, user_id, room_id, priority, factory, seq, kind="reply"):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.room_id = room_id
+        # Phòng biệt lập (AI/Help) là hội thoại riêng của từng user nên giới hạn theo (phòng, user)
+        self.room_key = f"{room_id}:{user_id}" if room_id in SELF_ISOLATED_ROOMS else room_id
+        self.priority = priority
+        self.factory = factory
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.position: Optional[int] = None
+        self.wait_ms: Optional[float] = None
+        # "reply" hoặc "suggestion": yêu cầu mới chỉ thay thế yêu cầu cũ cùng loại
+        self.kind = kind
+
+class AIScheduler:
+    """
+    Bộ lập lịch cho các lượt sinh câu trả lời AI:
+    - Giới hạn số lượt chạy đồng thời toàn cục, theo user và theo phòng.
+    - Hàng đợi theo lớp ưu tiên; trong cùng lớp, các user được phục vụ xoay vòng để người dùng nặng không chiếm hết.
+    - Gửi vị trí trong hàng đợi (frame 'ai_queued') cho user khi vị trí thay đổi và thống kê thời gian chờ.
+    """
+    def __init__(self, max_concurrent: int, per_user: int, per_room: int, max_queue: int, max_queued_per_user: int):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.per_room = per_room
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        # priority -> user_id -> hàng đợi job của user
+        self._queues: Dict[int, Dict[str, Deque[AIJob]]] = {p: {} for p in PRIORITY_NAMES}
+        # priority -> thứ tự xoay vòng các user đang có job chờ
+        self._rotation: Dict[int, Deque[str]] = {p: deque() for p in PRIORITY_NAMES}
+        self._queued = 0
+        self._running: Dict[str, AIJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._user_inflight: Dict[str, int] = {}
+        self._room_inflight: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._waits: Dict[int, Deque[float]] = {p: deque(maxlen=500) for p in PRIORITY_NAMES}
+        self.completed = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def _queued_for_user(self, user_id: str) -> int:
+        return sum(len(q.get(user_id, ())) for q in self._queues.values())
+
+    async def submit(
+        self,
+        job_id: str,
+        user_id: str,
+        room_id: str,
+        priority: int,
+        factory: Callable[[], Awaitable[None]],
+        kind: str = "reply"
+    ) -> bool:
+        """
+        Đưa một lượt AI vào hàng đợi. factory chỉ được gọi khi job thực sự chạy.
+        Trả về False nếu hàng đợi đầy (đã báo lỗi cho user).
+        """
+        if self._queued >= self.max_queue or self._queued_for_user(user_id) >= self.max_queued_per_user:
+            self.rejected += 1
+            if priority == PRIORITY_BACKGROUND:
+                return False
+            await manager.send_to_user(user_id, {
+                "type": "message",
+                "room_id": room_id,
+                "content": "⚠️ LinkUp AI đang quá tải, vui lòng thử lại sau ít phút.",
+                "sender": "Hệ thống",
+                "is_error": True
+            })
+            return False
+
+        job = AIJob(job_id, user_id, room_id, priority, factory, next(self._seq), kind)
+        user_queue = self._queues[priority].setdefault(user_id, deque())
+        if not user_queue:
+            self._rotation[priority].append(user_id)
+        user_queue.append(job)
+        self._queued += 1
+        # Giữ chỗ ngay từ lúc vào hàng đợi để cancel_ai đến trước khi stream bắt đầu không bị bỏ qua
+        if priority != PRIORITY_BACKGROUND:
+            ai_generations.reserve(job_id, user_id, room_id, kind == "suggestion")
+
+        await self._pump()
+        return True
+
+    def _can_run(self, job: AIJob) -> bool:
+        return (
+            self._user_inflight.get(job.user_id, 0) < self.per_user and
+            self._room_inflight.get(job.room_key, 0) < self.per_room
+        )
+
+    def _next_job(self) -> Optional[AIJob]:
+        for priority in sorted(self._queues):
+            rotation = self._rotation[priority]
+            for _ in range(len(rotation)):
+                user_id = rotation[0]
+                rotation.rotate(-1)
+                user_queue = self._queues[priority][user_id]
+                job = user_queue[0]
+                if not self._can_run(job):
+                    continue
+                user_queue.popleft()
+                if not user_queue:
+                    del self._queues[priority][user_id]
+                    rotation.remove(user_id)
+                return job
+        return None
+
+    async def _pump(self):
+        while len(self._running) < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                break
+            self._queued -= 1
+            self._start(job)
+        await self._notify_positions()
+
+    def _start(self, job: AIJob):
+        job.wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+        self._waits[job.priority].append(job.wait_ms)
+        self._running[job.job_id] = job
+        self._user_inflight[job.user_id] = self._user_inflight.get(job.user_id, 0) + 1
+        self._room_inflight[job.room_key] = self._room_inflight.get(job.room_key, 0) + 1
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.job_id] = task
+
+    async def _run(self, job: AIJob):
+        try:
+            await job.factory()
+        except Exception as e:
+            print(f"Error in AI job {job.job_id}: {e}")
+        finally:
+            self._running.pop(job.job_id, None)
+            self._tasks.pop(job.job_id, None)
+            # Lượt thoát trước khi tự bỏ đăng ký (tắt AI, hết quota, lỗi)
+            ai_generations.unregister(job.job_id)
+            self._release(self._user_inflight, job.user_id)
+            self._release(self._room_inflight, job.room_key)
+            self.completed += 1
+            await self._pump()
+
+    async def drop_queued(
+        self,
+        user_id: str,
+        job_id: Optional[str] = None,
+        room_id: Optional[str] = None,
+        kind: Optional[str] = None
+    ) -> List[AIJob]:
+        """
+        Bỏ các job còn trong hàng đợi của user (theo job_id, hoặc theo phòng + loại). Job chưa chạy nên chưa giữ quota.
+        """
+        dropped = []
+        for priority, queues in self._queues.items():
+            user_queue = queues.get(user_id)
+            if not user_queue:
+                continue
+            for job in [
+                j for j in user_queue
+                if (job_id is None or j.job_id == job_id)
+                and (room_id is None or j.room_id == room_id)
+                and (kind is None or j.kind == kind)
+            ]:
+                user_queue.remove(job)
+                ai_generations.unregister(job.job_id)
+                dropped.append(job)
+            if not user_queue:
+                del queues[user_id]
+                self._rotation[priority].remove(user_id)
+        if dropped:
+            self._queued -= len(dropped)
+            self.dropped += len(dropped)
+            await self._pump()
+        return dropped
+
+    def queue_wait_ms(self, job_id: str) -> Optional[float]:
+        """Thời gian chờ trong hàng đợi của job đang chạy (None nếu job không đi qua bộ lập lịch)."""
+        job = self._running.get(job_id)
+        return job.wait_ms if job else None
+
+    @staticmethod
+    def _release(counter: Dict[str, int], key: str):
+        remaining = counter.get(key, 0) - 1
+        if remaining > 0:
+            counter[key] = remaining
+        else:
+            counter.pop(key, None)
+
+    def _queued_jobs(self) -> List[AIJob]:
+        jobs = [job for queues in self._queues.values() for q in queues.values() for job in q]
+        jobs.sort(key=lambda j: (j.priority, j.seq))
+        return jobs
+
+    async def _notify_positions(self):
+        """
+        Vị trí ước lượng theo (ưu tiên, thứ tự vào hàng); chỉ gửi khi vị trí của job thay đổi.
+        """
+        if not self._queued:
+            return
+        for position, job in enumerate(self._queued_jobs(), start=1):
+            if job.position == position or job.priority == PRIORITY_BACKGROUND:
+                continue
+            job.position = position
+            await manager.send_to_user(job.user_id, {
+                "type": "ai_queued",
+                "message_id": job.job_id,
+                "room_id": job.room_id,
+                "position": position
+            })
+
+    def stats(self) -> dict:
+        waits = {}
+        for priority, samples in self._waits.items():
+            values = list(samples)
+            waits[PRIORITY_NAMES[priority]] = {
+                "samples": len(values),
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+                "max_ms": round(max(values), 1) if values else None
+            }
+        return {
+            "running": len(self._running),
+            "queued": {
+                PRIORITY_NAMES[p]: sum(len(q) for q in queues.values())
+                for p, queues in self._queues.items()
+            },
+            "limits": {
+                "max_concurrent": self.max_concurrent,
+                "per_user": self.per_user,
+                "per_room": self.per_room,
+                "max_queue": self.max_queue
+            },
+            "wait_ms": waits,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "dropped": self.dropped
+        }
+
+ai_scheduler = AIScheduler(
+    max_concurrent=settings.AI_MAX_CONCURRENT,
+    per_user=settings.AI_MAX_PER_USER,
+    per_room=settings.AI_MAX_PER_ROOM,
+    max_queue=settings.AI_MAX_QUEUE,
+    max_queued_per_user=settings.AI_MAX_QUEUED_PER_USER
+)
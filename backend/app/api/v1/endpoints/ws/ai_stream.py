@@ -0,0 +1,215 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from backend.app.core.config import settings
+
+def utf16_len(text: str) -> int:
+    """
+    Độ dài theo đơn vị UTF-16 - trùng với String.length phía trình duyệt, dùng làm offset của stream.
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+def _utf16_slice(text: str, start: int) -> str:
+    return text.encode("utf-16-le")[start * 2:].decode("utf-16-le", errors="ignore")
+
+# Lượt sinh bị hủy mà không kịp gọi finish() vẫn được dọn sau khoảng này
+MAX_STREAM_AGE_SECONDS = 900
+
+class ChunkCoalescer:
+    """
+    Gộp các chunk AI nhỏ thành frame lớn hơn: flush khi bộ đệm đạt flush_chars ký tự
+    hoặc sau flush_ms kể từ chunk đầu tiên chưa gửi, tùy điều kiện nào đến trước.
+    Một câu trả lời 400 chunk vì thế chỉ tốn vài chục frame mà độ trễ hiển thị vẫn <= flush_ms.
+    """
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[None]],
+        message_id: str,
+        flush_ms: Optional[int] = None,
+        flush_chars: Optional[int] = None,
+        stream: Optional["AIStreamBuffer"] = None
+    ):
+        self.send = send
+        self.message_id = message_id
+        # Bộ đệm để client kết nối lại có thể nối tiếp stream (xem AIStreamRegistry)
+        self.stream = stream
+        self.offset = 0
+        self.flush_delay = (settings.AI_STREAM_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.flush_chars = settings.AI_STREAM_FLUSH_CHARS if flush_chars is None else flush_chars
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._timer: Optional[asyncio.Task] = None
+        # Giữ thứ tự frame giữa flush theo kích thước và flush theo thời gian
+        self._lock = asyncio.Lock()
+        self.frames = 0
+        self.chunks = 0
+
+    async def add(self, text: str):
+        if not text:
+            return
+        self.chunks += 1
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if self._buffered_chars >= self.flush_chars or self.flush_delay <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_delay)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error flushing AI chunks for {self.message_id}: {e}")
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            content = "".join(self._buffer)
+            self._buffer = []
+            self._buffered_chars = 0
+            self.frames += 1
+            offset = self.offset
+            self.offset += utf16_len(content)
+            if self.stream is not None:
+                self.stream.append(content)
+            await self.send({"type": "chunk", "message_id": self.message_id, "content": content, "offset": offset})
+
+    async def close(self):
+        """
+        Gửi phần còn lại trong bộ đệm (gọi trước frame 'message'/'end').
+        """
+        await self.flush()
+
+    def discard(self):
+        """
+        Bỏ phần đệm chưa gửi (generation lỗi) để không có chunk nào tới sau frame báo lỗi.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer = []
+        self._buffered_chars = 0
+
+class AIStreamBuffer:
+    """
+    Phần câu trả lời đã gửi của một lượt AI, để client mất kết nối giữa chừng nhận lại phần bị lỡ.
+    Giữ tối đa max_chars đơn vị cuối cùng; phần đầu bị bỏ thì base tăng tương ứng.
+    """
+    __slots__ = ("message_id", "room_id", "recipients", "parts", "base", "length", "max_chars", "status", "final_frames", "started_at", "finished_at")
+
+    def __init__(self, message_id: str, room_id: str, recipients: Set[str], max_chars: int):
+        self.message_id = message_id
+        self.room_id = room_id
+        self.recipients = recipients
+        # (offset bắt đầu, nội dung) theo thứ tự gửi
+        self.parts: List[tuple] = []
+        self.base = 0
+        self.length = 0
+        self.max_chars = max_chars
+        self.status = "streaming"
+        self.final_frames: List[dict] = []
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    def append(self, text: str):
+        self.parts.append((self.length, text))
+        self.length += utf16_len(text)
+        while len(self.parts) > 1 and self.length - self.parts[1][0] >= self.max_chars:
+            self.parts.pop(0)
+            self.base = self.parts[0][0]
+
+    def text_from(self, offset: int) -> str:
+        pieces = []
+        for start, text in self.parts:
+            end = start + utf16_len(text)
+            if end <= offset:
+                continue
+            pieces.append(_utf16_slice(text, offset - start) if start < offset else text)
+        return "".join(pieces)
+
+class AIStreamRegistry:
+    """
+    Bộ đệm các lượt AI đang stream, khóa theo ai_msg_id. Client kết nối lại gửi
+    {"type": "resume_ai", "message_id", "offset"} để nhận ngay phần đã lỡ rồi tiếp tục nhận live
+    (frame 'chunk' có offset nên client bỏ được phần trùng). Bộ đệm được giữ thêm
+    AI_RESUME_GRACE_SECONDS sau khi lượt trả lời kết thúc.
+    """
+    def __init__(self, grace_seconds: int, max_chars: int):
+        self.grace_seconds = grace_seconds
+        self.max_chars = max_chars
+        self._streams: Dict[str, AIStreamBuffer] = {}
+        self.resumed = 0
+
+    def start(self, message_id: str, room_id: str, recipients: List[str]) -> AIStreamBuffer:
+        self._expire()
+        stream = self._streams[message_id] = AIStreamBuffer(message_id, room_id, set(recipients), self.max_chars)
+        return stream
+
+    def finish(self, message_id: str, final_frames: Optional[List[dict]] = None, failed: bool = False):
+        stream = self._streams.get(message_id)
+        if stream is None:
+            return
+        stream.status = "failed" if failed else "done"
+        stream.final_frames = final_frames or []
+        stream.finished_at = time.monotonic()
+
+    def _expire(self):
+        now = time.monotonic()
+        for message_id in [
+            mid for mid, s in self._streams.items()
+            if (s.finished_at is not None and now - s.finished_at > self.grace_seconds)
+            or now - s.started_at > MAX_STREAM_AGE_SECONDS
+        ]:
+            del self._streams[message_id]
+
+    def resume(self, message_id: str, user_id: str, offset: int) -> List[dict]:
+        """
+        Các frame cần gửi lại cho client đã nhận được offset đơn vị đầu tiên của câu trả lời.
+        """
+        self._expire()
+        stream = self._streams.get(message_id)
+        if stream is None or user_id not in stream.recipients:
+            return [{"type": "ai_resume", "message_id": message_id, "status": "expired"}]
+
+        self.resumed += 1
+        frames = []
+        offset = max(0, offset or 0)
+        if offset < stream.base:
+            # Phần đầu đã bị cắt khỏi bộ đệm: client cần tải lại tin nhắn sau khi stream xong
+            frames.append({"type": "ai_resume", "message_id": message_id, "status": "truncated", "offset": stream.base})
+            offset = stream.base
+        missed = stream.text_from(offset)
+        if missed:
+            frames.append({
+                "type": "chunk",
+                "message_id": message_id,
+                "room_id": stream.room_id,
+                "content": missed,
+                "offset": offset,
+                "resumed": True
+            })
+        if stream.status == "failed":
+            frames.append({"type": "ai_resume", "message_id": message_id, "status": "failed"})
+        else:
+            frames.extend(stream.final_frames)
+        return frames
+
+    def stats(self) -> dict:
+        self._expire()
+        return {
+            "streaming": sum(1 for s in self._streams.values() if s.status == "streaming"),
+            "retained": sum(1 for s in self._streams.values() if s.status != "streaming"),
+            "buffered_chars": sum(s.length - s.base for s in self._streams.values()),
+            "resumed": self.resumed
+        }
+
+ai_streams = AIStreamRegistry(settings.AI_RESUME_GRACE_SECONDS, settings.AI_RESUME_MAX_CHARS)
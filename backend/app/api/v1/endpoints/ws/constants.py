@@ -83,3 +83,32 @@ MỤC TIÊU CUỐI CÙNG
 - Giữ cho trải nghiệm chat tự nhiên, không bị gián đoạn.
 - Làm cho AI trở thành trợ lý đáng tin cậy, không gây phiền.
 """
+
+# FAQ mặc định của phòng Help: dùng để khởi tạo collection faq_entries lần đầu
+# và làm phương án dự phòng trong prompt khi cơ sở tri thức FAQ trống/tắt
+DEFAULT_FAQ_ENTRIES = [
+    {
+        "question": "LinkUp là gì?",
+        "answer": "LinkUp là nền tảng chat thời gian thực kết nối cộng đồng.",
+        "keywords": ["giới thiệu", "linkup"]
+    },
+    {
+        "question": "Làm sao để tạo nhóm chat?",
+        "answer": "Bạn nhấn nút '+' ở danh sách phòng chat để tạo nhóm mới.",
+        "keywords": ["tạo nhóm", "nhóm mới", "tạo phòng"]
+    },
+    {
+        "question": "Làm sao để chat với AI?",
+        "answer": "Bạn gõ @ai trong bất kỳ phòng nào hoặc vào phòng 'LinkUp AI' để trò chuyện với trợ lý AI.",
+        "keywords": ["chat ai", "trợ lý ai", "@ai"]
+    },
+    {
+        "question": "LinkUp có những tính năng bảo mật nào?",
+        "answer": "LinkUp hỗ trợ thu hồi tin nhắn và chặn người dùng.",
+        "keywords": ["bảo mật", "thu hồi tin nhắn", "chặn người dùng"]
+    },
+]
+
+DEFAULT_HELP_FAQ = "HƯỚNG DẪN FAQ & Hỗ trợ (LinkUp FAQ):\n" + "".join(
+    f"- {entry['question']} {entry['answer']}\n" for entry in DEFAULT_FAQ_ENTRIES
+) + "\n"
@@ -1,18 +1,45 @@
 import uuid
 import asyncio
+from functools import partial
 from datetime import datetime, timezone
 from backend.app.db.session import db
+from backend.app.core.config import settings
+from backend.app.core.rate_limit import rate_limiter
+from backend.app.core.content_filter import content_filter, ACTION_BLOCK, ACTION_FLAG
+from backend.app.core.spam_detector import spam_detector
+from backend.app.core.smart_reply import smart_replies
+from backend.app.core.sentiment import sentiment_scorer, sentiment_rollups
+from backend.app.core.runtime_cache import runtime_cache
 from .manager import manager
 from .ai_logic import run_ai_generation_task
+from .ai_context import context_builder
+from .ai_retrieval import retrieval_service
+from .ai_scheduler import ai_scheduler, PRIORITY_AI_ROOM, PRIORITY_MENTION
+from .ai_generations import ai_generations, CANCEL_USER, CANCEL_SUPERSEDED
 from .constants import SELF_ISOLATED_ROOMS
+from .receipts import next_message_seq, next_conversation_seq, update_read_watermark, increment_unread, receipt_coalescer
+from .support_threads import note_user_message, note_reply, upsert_thread
+from .partitions import message_conversation_id
 
-async def handle_edit_message(user_id: str, data: dict):
+async def handle_edit_message(user_id: str, user, data: dict):
     msg_id = data.get("message_id")
     new_content = data.get("content") or data.get("new_content")
     room_id = data.get("room_id")
     
     if not msg_id or not new_content: return
 
+    # Nội dung sửa đi qua cùng bộ lọc như khi gửi (không thì gửi bản sạch rồi sửa thành nội dung bị chặn)
+    filter_result = None
+    if not (user.get("is_superuser") or user.get("role") == "admin"):
+        filter_result = content_filter.check(new_content)
+        if filter_result.action == ACTION_BLOCK:
+            await manager.send_to_user(user_id, {
+                "type": "error",
+                "message": "Tin nhắn chứa từ ngữ không phù hợp và đã bị chặn."
+            })
+            return
+        new_content = filter_result.content
+
     result = await db["messages"].update_one(
         {"id": msg_id, "sender_id": user_id},
         {"$set": {"content": new_content, "is_edited": True, "edited_at": datetime.now(timezone.utc).isoformat()}}
@@ -24,12 +51,19 @@ async def handle_edit_message(user_id: str, data: dict):
             {"reply_to_id": msg_id},
             {"$set": {"reply_to_content": new_content}}
         )
+        retrieval_service.note_update(room_id, msg_id, content=new_content)
         await manager.broadcast_to_room(room_id, {
             "type": "edit_message",
             "message_id": msg_id,
             "content": new_content,
             "room_id": room_id
         })
+        if filter_result and filter_result.action == ACTION_FLAG:
+            terms = ", ".join(sorted({m.term for m in filter_result.matches}))
+            await create_system_report(
+                {"id": msg_id, "sender_id": user_id, "room_id": room_id, "content": new_content},
+                user, "inappropriate", f"Bộ lọc tự động (tin đã sửa): {terms}", "content_filter"
+            )
 
 async def handle_recall_message(user_id: str, data: dict):
     msg_id = data.get("message_id")
@@ -48,6 +82,7 @@ async def handle_recall_message(user_id: str, data: dict):
             {"reply_to_id": msg_id},
             {"$set": {"reply_to_content": "Tin nhắn đã được thu hồi"}}
         )
+        retrieval_service.note_update(room_id, msg_id, removed=True)
         await manager.broadcast_to_room(room_id, {
             "type": "recall_message",
             "message_id": msg_id,
@@ -64,6 +99,7 @@ async def handle_delete_message(user_id: str, data: dict):
         {"id": msg_id},
         {"$addToSet": {"deleted_by_users": user_id}}
     )
+    retrieval_service.note_update(room_id, msg_id, hidden_for=user_id)
     
     await manager.send_to_user(user_id, {
         "type": "delete_for_me_success",
@@ -92,23 +128,18 @@ async def handle_read_receipt(user_id: str, data: dict):
     msg_id = data.get("message_id")
     if not room_id: return
     
-    if msg_id:
-        await db["messages"].update_one(
-            {"id": msg_id, "room_id": room_id},
-            {"$set": {"status": "seen"}}
-        )
-    else:
-        await db["messages"].update_many(
-            {"room_id": room_id, "sender_id": {"$ne": user_id}, "status": {"$ne": "seen"}},
-            {"$set": {"status": "seen"}}
-        )
+    # Watermark theo từng thành viên thay cho update_many status "seen" toàn cục
+    watermark = await update_read_watermark(room_id, user_id, msg_id)
+    if not watermark: return
     
     if room_id not in SELF_ISOLATED_ROOMS:
-        await manager.broadcast_to_room(room_id, {
+        await receipt_coalescer.submit(room_id, user_id, {
             "type": "read_receipt",
             "room_id": room_id,
             "user_id": user_id,
-            "message_id": msg_id
+            "message_id": msg_id,
+            "last_read_seq": watermark["last_read_seq"],
+            "last_read_at": watermark["last_read_at"].isoformat()
         })
 
 async def handle_reaction(user_id: str, data: dict):
@@ -151,6 +182,90 @@ async def handle_reaction(user_id: str, data: dict):
         "reactions": reactions
     })
 
+async def _notify_dropped_ai_jobs(user_id: str, jobs: list, reason: str):
+    # Job bị bỏ khi còn trong hàng đợi chưa gửi frame nào: báo để client bỏ trạng thái chờ
+    for job in jobs:
+        await manager.send_to_user(user_id, {
+            "type": "ai_cancelled",
+            "message_id": job.job_id,
+            "room_id": job.room_id,
+            "reason": reason
+        })
+
+async def supersede_ai_generations(user_id: str, room_id: str, kind: str = "reply"):
+    """
+    Yêu cầu AI mới của user trong một phòng thay thế các lượt cùng loại còn đang chạy/chờ của chính user đó.
+    """
+    dropped = await ai_scheduler.drop_queued(user_id, room_id=room_id, kind=kind)
+    await _notify_dropped_ai_jobs(user_id, dropped, CANCEL_SUPERSEDED)
+    for message_id in ai_generations.running_for(user_id, room_id, kind == "suggestion"):
+        ai_generations.cancel(message_id, user_id, CANCEL_SUPERSEDED)
+
+async def handle_cancel_ai(user_id: str, data: dict):
+    """
+    User dừng lượt trả lời AI của mình theo message_id (hoặc mọi lượt của mình trong room_id).
+    Đang stream: dừng provider, lưu phần đã sinh (is_stopped) và hoàn lượt quota. Đang chờ: bỏ khỏi hàng đợi.
+    Đã rời hàng đợi nhưng chưa stream (kiểm tra quota, dựng prompt): đánh dấu hủy, áp dụng trước khi gọi model.
+    """
+    message_id = data.get("message_id")
+    room_id = data.get("room_id")
+    if message_id:
+        dropped = await ai_scheduler.drop_queued(user_id, job_id=message_id)
+        if not dropped:
+            ai_generations.cancel(message_id, user_id, CANCEL_USER)
+    elif room_id:
+        dropped = await ai_scheduler.drop_queued(user_id, room_id=room_id)
+        for is_suggestion in (False, True):
+            for running_id in ai_generations.running_for(user_id, room_id, is_suggestion):
+                ai_generations.cancel(running_id, user_id, CANCEL_USER)
+    else:
+        return
+    await _notify_dropped_ai_jobs(user_id, dropped, CANCEL_USER)
+
+async def handle_ai_suggestion_request(user_id: str, user, data: dict):
+    """
+    User chủ động yêu cầu AI soạn câu trả lời cho một tin nhắn (gợi ý nhanh mặc định là cục bộ, không gọi model).
+    Kết quả chỉ gửi về cho người yêu cầu qua các frame ai_suggestion_*.
+    """
+    room_id = data.get("room_id")
+    if not room_id or room_id in SELF_ISOLATED_ROOMS: return
+
+    membership = await db["room_members"].find_one({"room_id": room_id, "user_id": user_id}, {"_id": 1})
+    if not membership: return
+
+    target_query = {"room_id": room_id, "is_recalled": {"$ne": True}, "sender_id": {"$ne": user_id}}
+    if data.get("message_id"):
+        target_query["id"] = data["message_id"]
+    target = await db["messages"].find_one(target_query, sort=[("timestamp", -1)])
+    if not target or not target.get("content"): return
+
+    ai_msg_id = str(uuid.uuid4())
+    chat_context = await context_builder.build(room_id, user_id)
+    prompt = (
+        f"Hãy soạn giúp tôi MỘT câu trả lời ngắn gọn, tự nhiên để đáp lại tin nhắn sau của "
+        f"{target.get('sender_name') or 'thành viên'}: \"{target['content']}\". Chỉ trả về nội dung câu trả lời."
+    )
+    await supersede_ai_generations(user_id, room_id, "suggestion")
+    await ai_scheduler.submit(
+        ai_msg_id, user_id, room_id, PRIORITY_MENTION,
+        partial(
+            run_ai_generation_task,
+            room_id=room_id,
+            prompt=prompt,
+            chat_context=chat_context,
+            user_id=user_id,
+            username=user.get("username"),
+            ai_msg_id=ai_msg_id,
+            ai_identity="LinkUp AI",
+            is_suggestion_mode=True,
+            is_ai_room=False,
+            user_prefs=user.get("ai_preferences"),
+            user_role=user.get("role", "member"),
+            user_permissions=user.get("permissions", [])
+        ),
+        kind="suggestion"
+    )
+
 async def handle_report_message(user_id: str, data: dict):
     msg_id = data.get("message_id")
     room_id = data.get("room_id")
@@ -199,6 +314,65 @@ async def handle_report_message(user_id: str, data: dict):
         "message": "Cảm ơn bạn! Báo cáo của bạn đã được gửi tới quản trị viên."
     })
 
+async def create_system_report(message: dict, sender: dict, report_type: str, detail: str, source: str):
+    """
+    Tạo báo cáo vi phạm tự động (bộ lọc/hệ thống phát hiện) vào hàng đợi reports của Admin.
+    """
+    report_data = {
+        "id": str(uuid.uuid4()),
+        "reporter_id": "system",
+        "reporter_name": "Hệ thống kiểm duyệt",
+        "reported_id": message.get("sender_id"),
+        "reported_name": sender.get("full_name") or sender.get("username") or "Unknown",
+        "message_id": message.get("id"),
+        "message_snippet": (message.get("content") or "No content")[:200],
+        "room_id": message.get("room_id"),
+        "type": report_type,
+        "content": detail,
+        "source": source,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "status": "pending"
+    }
+    await db["reports"].insert_one(report_data)
+
+    await manager.broadcast_to_admins({
+        "type": "new_report",
+        "report_id": report_data["id"],
+        "message_id": report_data["message_id"],
+        "reported_name": report_data["reported_name"]
+    })
+    return report_data
+
+async def report_spam(user_id: str, user, room_id: str, content: str, verdict):
+    """
+    Báo cáo spam tự động. Spam hàng loạt trong phòng được quy cho các tài khoản tạo nên cụm tin gần trùng lặp
+    (tài khoản gửi nhiều nhất là đối tượng chính), không phải người gửi tin cuối cùng.
+    """
+    if verdict.scope != "room" or not verdict.cluster_senders:
+        detail = f"Phát hiện spam tự động: {verdict.user_duplicates + 1} tin gần trùng lặp liên tiếp"
+        await create_system_report(
+            {"sender_id": user_id, "room_id": room_id, "content": content},
+            user, "spam", detail, "spam_detector"
+        )
+        return
+
+    senders = await db["users"].find(
+        {"id": {"$in": list(verdict.cluster_senders)}}, {"id": 1, "username": 1, "full_name": 1}
+    ).to_list(length=len(verdict.cluster_senders))
+    by_id = {u["id"]: u for u in senders}
+    names = ", ".join(
+        (by_id.get(uid) or {}).get("username") or uid for uid in verdict.cluster_senders
+    )
+    primary = verdict.cluster_senders[0]
+    detail = (
+        f"Phát hiện spam tự động: {verdict.room_duplicates} tin gần trùng lặp từ "
+        f"{len(verdict.cluster_senders)} tài khoản ({names})"
+    )
+    await create_system_report(
+        {"sender_id": primary, "room_id": room_id, "content": content},
+        by_id.get(primary) or {"username": primary}, "spam", detail, "spam_detector"
+    )
+
 async def handle_send_message(user_id: str, user, data: dict):
     room_id = data.get("room_id")
     content = data.get("content", "").strip()
@@ -215,8 +389,10 @@ async def handle_send_message(user_id: str, user, data: dict):
     from backend.app.core.admin_config import get_system_config
     sys_config = await get_system_config(db)
     
+    is_staff = user.get("is_superuser") or user.get("role") == "admin"
+
     # Check Maintenance Mode
-    if sys_config.get("maintenance_mode", False) and not (user.get("is_superuser") or user.get("role") == "admin"):
+    if sys_config.get("maintenance_mode", False) and not is_staff:
         await manager.send_to_user(user_id, {
             "type": "error", 
             "message": "Hệ thống đang bảo trì. Vui lòng quay lại sau."
@@ -232,10 +408,43 @@ async def handle_send_message(user_id: str, user, data: dict):
         })
         return
 
+    # Bộ lọc nội dung (Aho-Corasick trên từ điển do Admin quản lý), chạy trong bộ nhớ trước mọi thao tác DB
+    filter_result = None
+    if content and not is_staff:
+        filter_result = content_filter.check(content)
+        if filter_result.action == ACTION_BLOCK:
+            await manager.send_to_user(user_id, {
+                "type": "error",
+                "message": "Tin nhắn chứa từ ngữ không phù hợp và đã bị chặn."
+            })
+            return
+        content = filter_result.content
+
+    # Phát hiện spam gần trùng lặp (SimHash) trước khi ghi DB và fan-out. Phòng AI chỉ ảnh hưởng chính user nên bỏ qua.
+    # Fingerprint chỉ được ghi nhận (spam_detector.record) khi tin đã qua mọi bước kiểm tra bên dưới
+    spam_verdict = None
+    if content and not is_staff and room_id != "ai":
+        spam_verdict = spam_detector.check(user_id, room_id, content)
+        if spam_verdict.action:
+            if spam_verdict.action == "report":
+                await report_spam(user_id, user, room_id, content, spam_verdict)
+            await manager.send_to_user(user_id, {
+                "type": "rate_limited",
+                "op": "send_message",
+                "room_id": room_id,
+                "retry_after": settings.SPAM_WINDOW_SECONDS,
+                "message": (
+                    "Nội dung này đang bị gửi hàng loạt trong phòng và tạm thời bị chặn."
+                    if spam_verdict.scope == "room"
+                    else "Bạn đang gửi nhiều tin nhắn giống nhau. Vui lòng chờ trước khi gửi tiếp."
+                )
+            })
+            return
+
     now = datetime.now(timezone.utc)
 
     # Check Block - Improved room lookup
-    room_obj = await db["chat_rooms"].find_one({"$or": [{"id": room_id}, {"_id": room_id}]})
+    room_obj = await runtime_cache.room(db, room_id)
     if not room_obj and len(room_id) == 24: # Try as ObjectId
         try:
             from bson import ObjectId
@@ -243,6 +452,19 @@ async def handle_send_message(user_id: str, user, data: dict):
         except:
             pass
 
+    # Slow mode (phòng cộng đồng): cấu hình trên chat_rooms.slow_mode_seconds, Admin được miễn
+    if room_obj and room_obj.get("slow_mode_seconds") and not is_staff:
+        wait = rate_limiter.check_slow_mode(room_id, user_id, room_obj["slow_mode_seconds"])
+        if wait:
+            await manager.send_to_user(user_id, {
+                "type": "rate_limited",
+                "op": "send_message",
+                "room_id": room_id,
+                "retry_after": round(wait, 2),
+                "message": f"Phòng đang bật chế độ chậm. Vui lòng chờ {int(wait) + 1} giây."
+            })
+            return
+
     if room_obj and room_obj.get("type") == "direct":
         members = await db["room_members"].find({"room_id": room_id}).to_list(length=2)
         other_member_id = next((m["user_id"] for m in members if m["user_id"] != user_id), None)
@@ -255,10 +477,24 @@ async def handle_send_message(user_id: str, user, data: dict):
                 await manager.send_to_user(user_id, {"type": "error", "message": "Bạn đang chặn người này."})
                 return
 
-    # Auto join room
+    if spam_verdict:
+        spam_detector.record(user_id, room_id, spam_verdict)
+
+    # Cấp seq cho tin nhắn + cập nhật hoạt động cuối của phòng trong cùng một lệnh
+    # Sử dụng _id thật của room từ DB để update cho chính xác
+    room_filter = {"_id": room_obj["_id"]} if room_obj else {"id": room_id}
+    # Chủ hội thoại riêng AI/Help: Admin trả lời trong Help thì là user nhận, ngược lại là người gửi
+    conversation_user = receiver_id if room_id == "help" and is_staff and receiver_id else user_id
+    if room_id in SELF_ISOLATED_ROOMS:
+        # Hội thoại riêng AI/Help: bộ đếm seq theo hội thoại của chủ hội thoại (không phải bộ đếm riêng của Admin)
+        seq = await next_conversation_seq(room_id, conversation_user, now)
+    else:
+        seq = await next_message_seq(room_filter, now)
+
+    # Auto join room (người gửi coi như đã đọc tới tin nhắn của chính mình)
     await db["room_members"].update_one(
         {"room_id": room_id, "user_id": user_id},
-        {"$set": {"joined_at": now}},
+        {"$set": {"joined_at": now, "unread_count": 0}, "$max": {"last_read_seq": seq or 0}},
         upsert=True
     )
 
@@ -297,6 +533,7 @@ async def handle_send_message(user_id: str, user, data: dict):
         "file_name": file_name,
         "file_type": file_type,
         "timestamp": now,
+        "seq": seq,
         "is_bot": False,
         "is_edited": False,
         "is_recalled": False,
@@ -309,16 +546,32 @@ async def handle_send_message(user_id: str, user, data: dict):
         "receiver_id": receiver_id,
         "deleted_by_users": []
     }
+    # Điểm cảm xúc cục bộ [-1, 1] (chỉ tin nhắn văn bản)
+    if content and settings.SENTIMENT_ENABLED:
+        message_data["sentiment"] = sentiment_scorer.score(content)
+    # Phòng AI/Help: lưu theo hội thoại riêng của user (khóa phân vùng, xem partitions.py)
+    partition_key = message_conversation_id(message_data)
+    if partition_key:
+        message_data["conversation_id"] = partition_key
 
     await db["messages"].insert_one(message_data)
-    
-    # Update room last activity
-    if room_obj:
-        # Sử dụng _id thật của room từ DB để update cho chính xác
-        await db["chat_rooms"].update_one({"_id": room_obj["_id"]}, {"$set": {"updated_at": now}})
+
+    # Bộ đếm chưa đọc được duy trì tăng dần ngay khi ghi tin nhắn
+    if room_id == "help":
+        if not is_staff:
+            # Hộp thư hỗ trợ của Admin: cập nhật view support_threads (tin cuối, chờ trả lời, chưa đọc)
+            await note_user_message(user, message_data)
+        elif receiver_id:
+            await increment_unread("help", receiver_id=receiver_id, seq=message_data["seq"])
+            await note_reply(receiver_id, message_data, "staff")
     else:
-        # Fallback
-        await db["chat_rooms"].update_one({"id": room_id}, {"$set": {"updated_at": now}})
+        await increment_unread(room_id, sender_id=user_id)
+    if "sentiment" in message_data:
+        sentiment_rollups.record("room", room_id, message_data["sentiment"])
+        if room_id == "help" and not is_staff:
+            sentiment_rollups.record("support", user_id, message_data["sentiment"])
+    context_builder.note_message(room_id, conversation_user)
+    retrieval_service.note_message(message_data, conversation_user)
     
     # Broadcast
     metadata = message_data.copy()
@@ -326,12 +579,15 @@ async def handle_send_message(user_id: str, user, data: dict):
     metadata["type"] = "message"
     metadata["message_id"] = message_id 
 
+    # Gợi ý trả lời nhanh cho người nhận, tính cục bộ (không gọi model AI)
+    if content and not file_url and room_id not in SELF_ISOLATED_ROOMS and not (room_obj and room_obj.get("type") in ["bot", "support"]):
+        metadata["suggestions"] = smart_replies.suggest(content)
+
     if room_id == "help" or (room_obj and room_obj.get("type") == "support"):
         # Always send to the sender
         await manager.send_to_user(user_id, metadata)
         
         # If user sent, notify admins. If admin sent, notify targeted user + other admins.
-        is_staff = user.get("is_superuser") or user.get("role") == "admin"
         if not is_staff:
             await manager.broadcast_to_admins(metadata)
         else:
@@ -352,6 +608,11 @@ async def handle_send_message(user_id: str, user, data: dict):
         # This includes the sender because they were upserted into room_members above
         await manager.broadcast_to_room(room_id, metadata)
 
+    # Tin nhắn bị gắn cờ bởi bộ lọc nội dung -> tự động gửi báo cáo cho Admin
+    if filter_result and filter_result.action == ACTION_FLAG:
+        terms = ", ".join(sorted({m.term for m in filter_result.matches}))
+        await create_system_report(message_data, user, "inappropriate", f"Bộ lọc tự động: {terms}", "content_filter")
+
     # AI Triggers
     is_ai_room = (room_obj and (room_obj.get("type") in ["bot", "support"] or room_obj.get("is_ai_room", False))) or room_id in SELF_ISOLATED_ROOMS
     content_lower = content.lower() if content else ""
@@ -381,15 +642,11 @@ async def handle_send_message(user_id: str, user, data: dict):
             if not user.get("is_superuser") and thread_status == "resolved":
                 # Tự động mở lại hội thoại nếu người dùng nhắn tin sau khi đã giải quyết
                 new_status = "ai_processing"
-                await db["support_threads"].update_one(
-                    {"user_id": user_id},
-                    {"$set": {
-                        "status": new_status,
-                        "username": user.get("username"),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }},
-                    upsert=True
-                )
+                await upsert_thread(user_id, {"$set": {
+                    "status": new_status,
+                    "username": user.get("username"),
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                }})
                 # Thông báo thời gian thực
                 await manager.send_to_user(user_id, {
                     "type": "support_status_update",
@@ -409,15 +666,11 @@ async def handle_send_message(user_id: str, user, data: dict):
                 should_ai_respond = True
                 # Automatically switch to waiting status if user asks for admin
                 new_status = "waiting"
-                await db["support_threads"].update_one(
-                    {"user_id": user_id},
-                    {"$set": {
-                        "status": new_status, 
-                        "username": user.get("username"),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }},
-                    upsert=True
-                )
+                await upsert_thread(user_id, {"$set": {
+                    "status": new_status, 
+                    "username": user.get("username"),
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                }})
                 # Thông báo thời gian thực
                 await manager.send_to_user(user_id, {
                     "type": "support_status_update",
@@ -463,26 +716,29 @@ async def handle_send_message(user_id: str, user, data: dict):
             for trigger in ["@ai", "/ai", "@ ai", "bot ai"]:
                 prompt_clean = re.sub(re.escape(trigger), '', prompt_clean, flags=re.IGNORECASE).strip()
         
-        chat_context = f"--- Lịch sử chat gần đây ---\n"
-        recent_msgs = await db["messages"].find({"room_id": room_id}).sort("timestamp", -1).limit(5).to_list(length=5)
-        recent_msgs.reverse()
-        for m in recent_msgs:
-            if m.get("id") == message_id: continue
-            sender = m.get("sender_name") or "AI"
-            chat_context += f"[{sender}]: {m.get('content')}\n"
-
-        asyncio.create_task(run_ai_generation_task(
-            room_id=room_id,
-            prompt=prompt_clean or "Chào bạn!",
-            chat_context=chat_context,
-            user_id=user_id,
-            username=user.get("username"),
-            ai_msg_id=ai_msg_id,
-            ai_identity="LinkUp Support" if room_id == "help" else "LinkUp AI",
-            is_suggestion_mode=False,
-            is_ai_room=is_ai_room or is_explicit_call,
-            user_prefs=user.get("ai_preferences"),
-            user_role=user.get("role", "member"),
-            user_permissions=user.get("permissions", [])
-        ))
+        # Ngữ cảnh trong ngân sách token: tin gần nhất nguyên văn + bản tóm tắt cuốn chiếu phần cũ hơn
+        chat_context = await context_builder.build(room_id, user_id, exclude_message_id=message_id)
+
+        # Câu hỏi mới thay thế câu trả lời trước đó của AI cho chính user này trong phòng (nếu còn đang sinh)
+        await supersede_ai_generations(user_id, room_id)
+        # Đưa vào bộ lập lịch AI (giới hạn đồng thời, ưu tiên phòng AI trực tiếp hơn lời gọi @ai)
+        await ai_scheduler.submit(
+            ai_msg_id, user_id, room_id,
+            PRIORITY_AI_ROOM if is_ai_room else PRIORITY_MENTION,
+            partial(
+                run_ai_generation_task,
+                room_id=room_id,
+                prompt=prompt_clean or "Chào bạn!",
+                chat_context=chat_context,
+                user_id=user_id,
+                username=user.get("username"),
+                ai_msg_id=ai_msg_id,
+                ai_identity="LinkUp Support" if room_id == "help" else "LinkUp AI",
+                is_suggestion_mode=False,
+                is_ai_room=is_ai_room or is_explicit_call,
+                user_prefs=user.get("ai_preferences"),
+                user_role=user.get("role", "member"),
+                user_permissions=user.get("permissions", [])
+            )
+        )
 
@@ -1,6 +1,7 @@
 from typing import Dict, List
 from fastapi import WebSocket
 from backend.app.db.session import db
+from backend.app.core.runtime_cache import runtime_cache
 
 class ConnectionManager:
     def __init__(self):
@@ -87,12 +88,12 @@ class ConnectionManager:
             if user_id in self.user_connections:
                 del self.user_connections[user_id]
 
-    async def broadcast_to_room(self, room_id: str, message: dict):
+    async def get_room_member_ids(self, room_id: str) -> List[str]:
         """
-        Tìm tất cả thành viên của phòng và gửi cho họ.
+        Lấy danh sách user_id thành viên của phòng (một truy vấn duy nhất).
         """
         if not room_id:
-            return
+            return []
 
         # Đảm bảo room_id luôn được xử lý đúng định dạng (cả string và ObjectId)
         search_query = {"room_id": {"$in": [str(room_id)]}}
@@ -103,13 +104,26 @@ class ConnectionManager:
         except:
             pass
 
-        members = await db["room_members"].find(search_query).to_list(length=1000)
-        
+        members = await db["room_members"].find(search_query, {"user_id": 1}).to_list(length=1000)
+        return [str(m["user_id"]) for m in members if m.get("user_id")]
+
+    async def send_to_users(self, user_ids: List[str], message: dict):
+        """
+        Gửi cùng một message cho danh sách người dùng đã được xác định trước.
+        """
+        for u_id in user_ids:
+            await self.send_to_user(u_id, message)
+
+    async def broadcast_to_room(self, room_id: str, message: dict):
+        """
+        Tìm tất cả thành viên của phòng và gửi cho họ.
+        """
+        if not room_id:
+            return
+
         # Gửi đến tất cả thành viên (bao gồm cả sender để sync UI nếu cần)
-        for member in members:
-            u_id = member.get("user_id")
-            if u_id:
-                await self.send_to_user(str(u_id), message)
+        member_ids = await self.get_room_member_ids(room_id)
+        await self.send_to_users(member_ids, message)
 
     async def broadcast_to_admins(self, message: dict):
         """
@@ -117,12 +131,8 @@ class ConnectionManager:
         """
         # Thay vì dựa vào "is_online" trong DB, ta kiểm tra trực tiếp các kết nối đang active
         # và lọc ra những user có quyền admin/superuser
-        admins = await db["users"].find({
-            "$or": [{"is_superuser": True}, {"role": "admin"}]
-        }).to_list(length=100)
-        
-        for admin in admins:
-            admin_id = str(admin.get("id") or admin.get("_id"))
+        # Danh sách Admin lấy từ cache nóng thay vì truy vấn users cho mỗi lần phát
+        for admin_id in await runtime_cache.admin_ids(db):
             await self.send_to_user(admin_id, message)
 
 manager = ConnectionManager()
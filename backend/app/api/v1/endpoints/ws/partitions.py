@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+from pymongo import UpdateOne
+from backend.app.db.session import db
+from backend.app.core.config import settings
+from .constants import SELF_ISOLATED_ROOMS
+
+MIGRATION_NAME = "conversation_ids_v1"
+
+def conversation_id(room_id: str, user_id: Optional[str]) -> str:
+    """
+    Khóa lưu trữ của hội thoại: phòng biệt lập (AI/Help) là hội thoại riêng "<room>:<user>",
+    phòng thường dùng chính room_id. API vẫn trả về room_id như cũ.
+    """
+    if room_id in SELF_ISOLATED_ROOMS:
+        return f"{room_id}:{user_id or ''}"
+    return room_id
+
+def message_conversation_id(message: dict) -> Optional[str]:
+    """
+    conversation_id của một tin nhắn trong phòng biệt lập: chủ hội thoại là người nhận (phản hồi của AI/Admin)
+    hoặc người gửi (tin của user). Phòng thường trả về None (không cần trường này).
+    """
+    room_id = message.get("room_id")
+    if room_id not in SELF_ISOLATED_ROOMS:
+        return None
+    return conversation_id(room_id, message.get("receiver_id") or message.get("sender_id"))
+
+class ConversationPartitions:
+    """
+    Phân vùng tin nhắn AI/Help theo user (trường messages.conversation_id, index conversation_id + timestamp/seq)
+    thay cho lọc $or sender_id/receiver_id trên cả phòng dùng chung.
+    Tin nhắn mới luôn được ghi kèm conversation_id; dữ liệu cũ được backfill theo lô trong nền.
+    Trước khi backfill xong, truy vấn vẫn dùng bộ lọc cũ để không thiếu tin nhắn.
+    """
+    def __init__(self):
+        self.ready = False
+        self.migrated = 0
+
+    def filter(self, room_id: str, user_id: str) -> dict:
+        """
+        Bộ lọc tin nhắn của hội thoại riêng (room_id phải là phòng biệt lập).
+        """
+        if self.ready:
+            return {"conversation_id": conversation_id(room_id, user_id)}
+        return {"room_id": room_id, "$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}
+
+    def search_isolation(self, user_id: str) -> dict:
+        """
+        Điều kiện cho tìm kiếm toàn hệ thống: không lộ tin AI/Help của người khác.
+        """
+        if self.ready:
+            return {"$or": [
+                {"room_id": {"$nin": SELF_ISOLATED_ROOMS}},
+                {"conversation_id": {"$in": [conversation_id(r, user_id) for r in SELF_ISOLATED_ROOMS]}}
+            ]}
+        return {"$or": [
+            {"room_id": {"$nin": SELF_ISOLATED_ROOMS}},
+            {"sender_id": user_id},
+            {"receiver_id": user_id}
+        ]}
+
+    async def run_migration(self):
+        """
+        Backfill conversation_id cho tin nhắn cũ theo lô (PARTITION_MIGRATION_BATCH), nghỉ giữa các lô.
+        An toàn khi nhiều worker cùng chạy; xong thì ghi dấu vào system_configs để lần khởi động sau bỏ qua.
+        """
+        try:
+            marker = {"type": "migration", "name": MIGRATION_NAME}
+            if await db["system_configs"].find_one({**marker, "done": True}):
+                self.ready = True
+                return
+
+            batch_size = settings.PARTITION_MIGRATION_BATCH
+            pause = settings.PARTITION_MIGRATION_PAUSE_MS / 1000
+            while True:
+                batch = await db["messages"].find(
+                    {"room_id": {"$in": SELF_ISOLATED_ROOMS}, "conversation_id": {"$exists": False}},
+                    {"_id": 1, "room_id": 1, "sender_id": 1, "receiver_id": 1}
+                ).limit(batch_size).to_list(length=batch_size)
+                if not batch:
+                    break
+                await db["messages"].bulk_write([
+                    UpdateOne({"_id": m["_id"]}, {"$set": {"conversation_id": message_conversation_id(m)}})
+                    for m in batch
+                ], ordered=False)
+                self.migrated += len(batch)
+                await asyncio.sleep(pause)
+
+            await db["system_configs"].update_one(
+                marker,
+                {"$set": {"done": True, "completed_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            self.ready = True
+            if self.migrated:
+                print(f"🔧 Backfilled conversation_id on {self.migrated} AI/Help messages")
+        except Exception as e:
+            print(f"⚠️ Conversation partition migration failed: {e}")
+
+partitions = ConversationPartitions()
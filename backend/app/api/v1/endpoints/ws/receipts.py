@@ -0,0 +1,421 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from backend.app.db.session import db
+from backend.app.core.config import settings
+from .manager import manager
+from .constants import SELF_ISOLATED_ROOMS
+from .partitions import partitions, conversation_id, message_conversation_id
+
+async def next_message_seq(room_filter: dict, now: datetime) -> Optional[int]:
+    """
+    Cấp số thứ tự (seq) tăng dần cho tin nhắn mới trong phòng, đồng thời cập nhật updated_at.
+    Thay thế cho lệnh update_one updated_at trước đây nên không tốn thêm round trip.
+    """
+    room = await db["chat_rooms"].find_one_and_update(
+        room_filter,
+        {"$set": {"updated_at": now}, "$inc": {"last_seq": 1}},
+        projection={"last_seq": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return room.get("last_seq") if room else None
+
+async def next_conversation_seq(room_id: str, user_id: str, now: datetime) -> int:
+    """
+    Cấp seq cho tin nhắn trong hội thoại riêng AI/Help của user_id. Mỗi hội thoại có bộ đếm riêng trên
+    room_members của chủ hội thoại (last_seq) thay vì dùng chung một document chat_rooms cho mọi user,
+    nên watermark đã đọc cũng so sánh trong phạm vi hội thoại.
+    Lần đầu bộ đếm bắt đầu từ last_seq hiện tại của phòng để tin mới luôn xếp sau tin cũ của hội thoại.
+    """
+    member_filter = {"room_id": room_id, "user_id": user_id}
+    while True:
+        member = await db["room_members"].find_one_and_update(
+            {**member_filter, "last_seq": {"$exists": True}},
+            {"$inc": {"last_seq": 1}, "$set": {"updated_at": now}},
+            projection={"last_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if member:
+            return member["last_seq"]
+        room = await db["chat_rooms"].find_one({"id": room_id}, {"last_seq": 1})
+        try:
+            await db["room_members"].update_one(
+                {**member_filter, "last_seq": {"$exists": False}},
+                {"$set": {"last_seq": (room or {}).get("last_seq", 0)}, "$setOnInsert": {"joined_at": now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Request khác vừa khởi tạo bộ đếm: thử tăng lại
+            pass
+
+async def update_read_watermark(room_id: str, user_id: str, message_id: Optional[str] = None) -> Optional[dict]:
+    """
+    Đẩy watermark đã đọc (last_read_seq/last_read_at) của một thành viên lên và đặt lại bộ đếm chưa đọc.
+    Chi phí O(1): đọc seq + một lần ghi vào room_members, bất kể số tin chưa đọc.
+    Chỉ khi đọc một tin cũ hơn tin mới nhất mà user nhận được (hoặc bộ đếm vừa bị increment_unread đổi)
+    mới cần đếm lại unread từ watermark.
+    """
+    member_filter = {"room_id": room_id, "user_id": user_id}
+    if room_id in SELF_ISOLATED_ROOMS:
+        # Hội thoại riêng: seq cuối và seq của tin cuối gửi tới user nằm trên chính membership của user
+        # (xem next_conversation_seq, increment_unread). Tin do chính user gửi sau đó không làm đọc "chưa hết".
+        member = await db["room_members"].find_one(
+            member_filter,
+            {"last_seq": 1, "last_received_seq": 1, "unread_count": 1}
+        ) or {}
+        last_seq = member.get("last_seq", 0)
+        unread_after = member.get("last_received_seq", last_seq)
+    else:
+        room, member = await asyncio.gather(
+            db["chat_rooms"].find_one({"id": room_id}, {"last_seq": 1}),
+            db["room_members"].find_one(member_filter, {"unread_count": 1})
+        )
+        member = member or {}
+        last_seq = unread_after = room.get("last_seq", 0) if room else 0
+
+    if message_id:
+        msg = await db["messages"].find_one({"id": message_id, "room_id": room_id}, {"seq": 1})
+        if not msg:
+            return None
+        # Tin nhắn cũ (trước khi có seq) luôn nằm trước mọi tin có seq
+        seq = msg.get("seq") or 0
+    else:
+        seq = last_seq
+
+    now = datetime.now(timezone.utc)
+    # $max: receipt đến trễ/không theo thứ tự không bao giờ kéo watermark lùi lại
+    update = {"$max": {"last_read_seq": seq}, "$set": {"last_read_at": now}}
+    updated = None
+    if seq >= unread_after:
+        # Đã đọc hết: chỉ đặt về 0 nếu bộ đếm vẫn là giá trị vừa đọc. increment_unread chen vào giữa
+        # (tin mới tới) thì điều kiện không khớp và bộ đếm được đếm lại bên dưới thay vì bị ghi đè mất
+        updated = await db["room_members"].find_one_and_update(
+            {**member_filter, "unread_count": member.get("unread_count")},
+            {**update, "$set": {**update["$set"], "unread_count": 0}},
+            projection={"last_read_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    if updated is not None:
+        return {"last_read_seq": updated.get("last_read_seq", seq), "last_read_at": now}
+
+    updated = await db["room_members"].find_one_and_update(
+        member_filter,
+        update,
+        projection={"last_read_seq": 1, "unread_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        return None
+
+    watermark = updated.get("last_read_seq", seq)
+    unread = await count_unread(room_id, user_id, watermark)
+    if unread != updated.get("unread_count"):
+        # Ghi có điều kiện: bộ đếm đổi trong lúc đếm thì để lần đọc sau / job đối soát sửa
+        await db["room_members"].update_one(
+            {**member_filter, "unread_count": updated.get("unread_count")},
+            {"$set": {"unread_count": unread}}
+        )
+    return {"last_read_seq": watermark, "last_read_at": now}
+
+def _unread_filter(room_id: str, user_id: str) -> dict:
+    # Phòng biệt lập (AI, Help): chỉ tin nhắn gửi tới chính user mới tính là chưa đọc
+    if room_id in SELF_ISOLATED_ROOMS:
+        if partitions.ready:
+            return {"conversation_id": conversation_id(room_id, user_id), "receiver_id": user_id}
+        return {"room_id": room_id, "receiver_id": user_id}
+    return {"room_id": room_id, "sender_id": {"$ne": user_id}}
+
+async def count_unread(room_id: str, user_id: str, watermark: int) -> int:
+    """
+    Đếm lại số tin chưa đọc sau watermark (dùng index room_id + seq).
+    """
+    query = _unread_filter(room_id, user_id)
+    query["seq"] = {"$gt": watermark}
+    return await db["messages"].count_documents(query)
+
+async def increment_unread(
+    room_id: str,
+    sender_id: Optional[str] = None,
+    receiver_id: Optional[str] = None,
+    seq: Optional[int] = None
+):
+    """
+    Tăng bộ đếm chưa đọc khi có tin nhắn mới được ghi:
+    - Có receiver_id (phòng biệt lập AI/Help): chỉ tăng cho người nhận, kèm seq của tin cuối gửi tới họ
+      (last_received_seq) để update_read_watermark biết khi nào đọc hết mà không phải đếm lại.
+    - Ngược lại: tăng cho mọi thành viên khác người gửi, trong một lệnh update_many.
+    """
+    if receiver_id:
+        update = {"$inc": {"unread_count": 1}}
+        if seq:
+            update["$max"] = {"last_received_seq": seq}
+        await db["room_members"].update_one({"room_id": room_id, "user_id": receiver_id}, update)
+    elif room_id not in SELF_ISOLATED_ROOMS:
+        query = {"room_id": room_id}
+        if sender_id:
+            query["user_id"] = {"$ne": sender_id}
+        await db["room_members"].update_many(query, {"$inc": {"unread_count": 1}})
+
+async def get_read_watermarks(room_id: str, viewer_id: str) -> Tuple[Dict[str, int], bool]:
+    """
+    Lấy watermark đã đọc của các thành viên: ({user_id: last_read_seq}, đầy_đủ).
+    - Phòng biệt lập (AI, Help): chỉ watermark của chính người xem (seq tính theo hội thoại), không đầy đủ.
+    - Phòng tối đa SEEN_BY_MAX_MEMBERS thành viên: watermark của tất cả thành viên.
+    - Phòng đông hơn: chỉ người xem và thành viên khác có watermark cao nhất (đủ để suy ra 'seen'),
+      trả về đầy_đủ=False để bên gọi không dựng seen_by.
+    """
+    if room_id in SELF_ISOLATED_ROOMS:
+        member = await db["room_members"].find_one({"room_id": room_id, "user_id": viewer_id}, {"last_read_seq": 1})
+        return {viewer_id: (member or {}).get("last_read_seq", 0)}, False
+
+    limit = settings.SEEN_BY_MAX_MEMBERS
+    members = await db["room_members"].find(
+        {"room_id": room_id},
+        {"user_id": 1, "last_read_seq": 1}
+    ).limit(limit + 1).to_list(length=limit + 1)
+    if len(members) <= limit:
+        return {m["user_id"]: m.get("last_read_seq", 0) for m in members if m.get("user_id")}, True
+
+    top, viewer = await asyncio.gather(
+        db["room_members"].find(
+            {"room_id": room_id, "user_id": {"$ne": viewer_id}},
+            {"user_id": 1, "last_read_seq": 1}
+        ).sort("last_read_seq", -1).limit(1).to_list(length=1),
+        db["room_members"].find_one({"room_id": room_id, "user_id": viewer_id}, {"last_read_seq": 1})
+    )
+    watermarks = {m["user_id"]: m.get("last_read_seq", 0) for m in top if m.get("user_id")}
+    watermarks[viewer_id] = (viewer or {}).get("last_read_seq", 0)
+    return watermarks, False
+
+def apply_seen_status(
+    messages: List[dict],
+    watermarks: Dict[str, int],
+    viewer_id: str,
+    include_seen_by: bool = True,
+    outgoing: bool = True
+):
+    """
+    Suy ra trạng thái "đã xem" từ watermark thay vì trường status toàn cục:
+    - Tin của người xem: 'seen' nếu có thành viên khác đã đọc tới seq của tin đó (kèm danh sách seen_by).
+      outgoing=False (phòng biệt lập, không có watermark của người khác): giữ nguyên status đã lưu.
+    - Tin của người khác: 'seen' nếu watermark của chính người xem đã vượt qua tin đó.
+    Tin nhắn cũ không có seq giữ nguyên status đã lưu.
+    """
+    viewer_wm = watermarks.get(viewer_id, 0)
+    for msg in messages:
+        seq = msg.get("seq")
+        if not seq:
+            continue
+        sender_id = msg.get("sender_id")
+        if sender_id == viewer_id:
+            if not outgoing:
+                continue
+            seen_by = [uid for uid, wm in watermarks.items() if uid != sender_id and wm >= seq]
+            if include_seen_by:
+                msg["seen_by"] = seen_by
+            msg["status"] = "seen" if seen_by else "sent"
+        else:
+            msg["status"] = "seen" if viewer_wm >= seq else "sent"
+    return messages
+
+async def apply_conversation_seen_status(room_id: str, messages: List[dict]):
+    """
+    Trạng thái "đã xem" trong phòng biệt lập (AI, Help): tin gửi tới chủ hội thoại là 'seen' khi watermark của
+    chủ hội thoại (room_members.last_read_seq, seq tính theo hội thoại) đã vượt qua tin đó.
+    Dùng được cả khi Admin xem toàn bộ phòng Help (nhiều hội thoại, một truy vấn cho mọi chủ hội thoại)
+    và khi chưa backfill phân vùng. Tin do chủ hội thoại gửi giữ nguyên status đã lưu.
+    """
+    owners = {}
+    for msg in messages:
+        receiver_id = msg.get("receiver_id")
+        if not msg.get("seq") or not receiver_id or receiver_id == msg.get("sender_id"):
+            continue
+        key = msg.get("conversation_id") or message_conversation_id(msg)
+        if key == conversation_id(room_id, receiver_id):
+            owners.setdefault(receiver_id, []).append(msg)
+    if not owners:
+        return messages
+
+    members = await db["room_members"].find(
+        {"room_id": room_id, "user_id": {"$in": list(owners)}},
+        {"user_id": 1, "last_read_seq": 1}
+    ).to_list(length=len(owners))
+    watermarks = {m["user_id"]: m.get("last_read_seq", 0) for m in members}
+    for owner, owned in owners.items():
+        watermark = watermarks.get(owner, 0)
+        for msg in owned:
+            msg["status"] = "seen" if watermark >= msg["seq"] else "sent"
+    return messages
+
+class ReadReceiptCoalescer:
+    """
+    Gộp read receipt theo phòng. Receipt đầu tiên được broadcast ngay (phòng ít tương tác không bị trễ),
+    các receipt tiếp theo trong cùng cửa sổ chỉ giữ lại watermark cao nhất của mỗi user và được gửi một lần khi hết cửa sổ.
+    """
+    def __init__(self, window_ms: int):
+        self.window = window_ms / 1000
+        # room_id -> {user_id -> payload có watermark cao nhất}
+        self._pending: Dict[str, Dict[str, dict]] = {}
+        self._last_flush: Dict[str, float] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, room_id: str, user_id: str, payload: dict):
+        now = time.monotonic()
+        last = self._last_flush.get(room_id, 0.0)
+
+        if room_id not in self._pending and now - last >= self.window:
+            self._last_flush[room_id] = now
+            await manager.broadcast_to_room(room_id, payload)
+            return
+
+        pending = self._pending.setdefault(room_id, {})
+        prev = pending.get(user_id)
+        if prev is None or payload["last_read_seq"] >= prev["last_read_seq"]:
+            pending[user_id] = payload
+
+        if room_id not in self._flush_tasks:
+            delay = max(0.0, self.window - (now - last))
+            self._flush_tasks[room_id] = asyncio.create_task(self._flush_later(room_id, delay))
+
+    async def _flush_later(self, room_id: str, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flush_tasks.pop(room_id, None)
+            pending = self._pending.pop(room_id, {})
+            self._last_flush[room_id] = time.monotonic()
+
+        if not pending:
+            return
+        try:
+            # Chỉ tra cứu thành viên một lần cho cả lô receipt
+            member_ids = await manager.get_room_member_ids(room_id)
+            for payload in pending.values():
+                await manager.send_to_users(member_ids, payload)
+        except Exception as e:
+            print(f"Error flushing read receipts for room {room_id}: {e}")
+
+receipt_coalescer = ReadReceiptCoalescer(settings.READ_RECEIPT_COALESCE_MS)
+
+async def _isolated_unread(room_id: str, members: List[dict]) -> Dict[str, dict]:
+    """
+    Số tin chưa đọc của một lô thành viên phòng biệt lập trong một aggregation: mỗi thành viên một nhánh $or
+    (hội thoại + watermark riêng, dùng index theo hội thoại), gom theo receiver_id.
+    """
+    branches = []
+    for m in members:
+        branch = _unread_filter(room_id, m["user_id"])
+        branch["seq"] = {"$gt": m.get("last_read_seq", 0)}
+        branches.append(branch)
+    rows = await db["messages"].aggregate([
+        {"$match": {"$or": branches}},
+        {"$group": {"_id": "$receiver_id", "unread": {"$sum": 1}, "last_seq": {"$max": "$seq"}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row for row in rows}
+
+async def _shared_unread(room_id: str, members: List[dict]) -> Dict[str, int]:
+    """
+    Số tin chưa đọc của một lô thành viên phòng chung trong một aggregation: một lần quét các tin sau
+    watermark thấp nhất của lô, mỗi thành viên một trường $sum có điều kiện.
+    """
+    fields = {
+        f"m{i}": {"$sum": {"$cond": [
+            {"$and": [{"$gt": ["$seq", m.get("last_read_seq", 0)]}, {"$ne": ["$sender_id", m["user_id"]]}]}, 1, 0
+        ]}}
+        for i, m in enumerate(members)
+    }
+    min_wm = min(m.get("last_read_seq", 0) for m in members)
+    rows = await db["messages"].aggregate([
+        {"$match": {"room_id": room_id, "seq": {"$gt": min_wm}}},
+        {"$group": {"_id": None, **fields}}
+    ]).to_list(length=1)
+    row = rows[0] if rows else {}
+    return {m["user_id"]: row.get(f"m{i}", 0) for i, m in enumerate(members)}
+
+async def repair_unread_counters(batch_size: int = 200, max_scan: int = 20000) -> int:
+    """
+    Đối soát bộ đếm chưa đọc với watermark để sửa sai lệch (tin bị xóa, lỗi ghi giữa chừng...).
+    - Phòng biệt lập (AI/Help): một aggregation cho mỗi lô batch_size thành viên (xem _isolated_unread),
+      đồng thời bổ sung last_received_seq còn thiếu.
+    - Phòng chung: danh sách thành viên và các tin sau watermark thấp nhất (tối đa max_scan tin) đếm trong bộ nhớ;
+      thành viên có watermark cũ hơn thế được đếm bằng một aggregation cho mỗi lô (xem _shared_unread).
+    Trả về số membership đã được sửa.
+    """
+    from pymongo import UpdateOne
+
+    repaired = 0
+    room_ids = await db["room_members"].distinct("room_id")
+    for room_id in room_ids:
+        members = await db["room_members"].find(
+            {"room_id": room_id, "user_id": {"$ne": None}},
+            {"user_id": 1, "last_read_seq": 1, "unread_count": 1, "last_received_seq": 1}
+        ).to_list(length=None)
+        if not members:
+            continue
+
+        expected: Dict[str, int] = {}
+        received: Dict[str, int] = {}
+        if room_id in SELF_ISOLATED_ROOMS:
+            for i in range(0, len(members), batch_size):
+                chunk = members[i:i + batch_size]
+                counts = await _isolated_unread(room_id, chunk)
+                for m in chunk:
+                    row = counts.get(m["user_id"])
+                    expected[m["user_id"]] = row["unread"] if row else 0
+                    if "last_received_seq" not in m:
+                        # Không còn tin chưa đọc thì tin cuối nhận được nằm trong watermark (giá trị chặn trên an toàn)
+                        received[m["user_id"]] = row["last_seq"] if row else m.get("last_read_seq", 0)
+        else:
+            min_wm = min(m.get("last_read_seq", 0) for m in members)
+            recent = await db["messages"].find(
+                {"room_id": room_id, "seq": {"$gt": min_wm}},
+                {"seq": 1, "sender_id": 1}
+            ).sort("seq", -1).limit(max_scan).to_list(length=max_scan)
+            # Nếu bị cắt bởi max_scan, chỉ các watermark >= floor mới đếm được trong bộ nhớ
+            floor = recent[-1]["seq"] - 1 if len(recent) == max_scan else min_wm
+
+            lagging = []
+            for m in members:
+                wm = m.get("last_read_seq", 0)
+                if wm < floor:
+                    lagging.append(m)
+                else:
+                    expected[m["user_id"]] = sum(1 for msg in recent if msg["seq"] > wm and msg.get("sender_id") != m["user_id"])
+            for i in range(0, len(lagging), batch_size):
+                expected.update(await _shared_unread(room_id, lagging[i:i + batch_size]))
+
+        ops = []
+        for m in members:
+            uid = m["user_id"]
+            update = {}
+            if m.get("unread_count", 0) != expected[uid]:
+                update["$set"] = {"unread_count": expected[uid]}
+            if uid in received:
+                # $max: increment_unread có thể vừa ghi giá trị mới hơn
+                update["$max"] = {"last_received_seq": received[uid]}
+            if update:
+                # Chỉ ghi nếu bộ đếm chưa đổi kể từ lúc đọc: increment_unread chen vào giữa thì để lượt sau đối soát
+                ops.append(UpdateOne({"_id": m["_id"], "unread_count": m.get("unread_count")}, update))
+
+        for i in range(0, len(ops), batch_size):
+            await db["room_members"].bulk_write(ops[i:i + batch_size], ordered=False)
+        repaired += len(ops)
+        # Nhường event loop giữa các phòng để job nền không chiếm tài nguyên
+        await asyncio.sleep(0)
+    return repaired
+
+async def run_unread_repair_loop():
+    """
+    Job định kỳ sửa sai lệch bộ đếm chưa đọc.
+    """
+    while True:
+        await asyncio.sleep(settings.UNREAD_REPAIR_INTERVAL_SECONDS)
+        try:
+            repaired = await repair_unread_counters()
+            if repaired:
+                print(f"🔧 Unread counters repaired: {repaired}")
+        except Exception as e:
+            print(f"Error repairing unread counters: {e}")
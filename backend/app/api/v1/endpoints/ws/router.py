@@ -4,7 +4,9 @@ from typing import Optional
 from datetime import datetime, timezone
 from backend.app.api.deps import get_current_user_ws
 from backend.app.db.session import db
+from backend.app.core.rate_limit import rate_limiter, WS_OPERATION_CLASSES, SILENT_CLASSES
 from .manager import manager
+from .ai_stream import ai_streams
 from .utils import notify_user_status_change, handle_admin_offline_catchup
 from .handlers import (
     handle_edit_message, 
@@ -14,7 +16,9 @@ from .handlers import (
     handle_pin_message,
     handle_read_receipt,
     handle_reaction,
-    handle_report_message
+    handle_report_message,
+    handle_ai_suggestion_request,
+    handle_cancel_ai
 )
 
 router = APIRouter()
@@ -38,6 +42,7 @@ async def websocket_endpoint(
 
     await websocket.accept()
     manager.connect(websocket, user_id)
+    client_ip = websocket.client.host if websocket.client else None
     
     # Cập nhật trạng thái online
     await db["users"].update_one(
@@ -56,12 +61,27 @@ async def websocket_endpoint(
                 
                 # Kiểm tra loại message
                 msg_type = data.get("type")
+
+                # Rate limit: từ chối sớm trong bộ nhớ, trước mọi thao tác DB
+                op_class = WS_OPERATION_CLASSES.get(msg_type)
+                if op_class:
+                    retry_after = rate_limiter.hit(op_class, user_id=user_id, ip=client_ip)
+                    if retry_after:
+                        if op_class not in SILENT_CLASSES:
+                            await websocket.send_json({
+                                "type": "rate_limited",
+                                "op": msg_type,
+                                "room_id": data.get("room_id"),
+                                "retry_after": round(retry_after, 2),
+                                "message": "Bạn thao tác quá nhanh. Vui lòng chậm lại."
+                            })
+                        continue
                 
                 if msg_type == "send_message" or msg_type == "message":
                     await handle_send_message(user_id, user, data)
                 
                 elif msg_type == "edit_message" or msg_type == "edit":
-                    await handle_edit_message(user_id, data)
+                    await handle_edit_message(user_id, user, data)
                     
                 elif msg_type == "recall_message" or msg_type == "recall":
                     await handle_recall_message(user_id, data)
@@ -81,6 +101,21 @@ async def websocket_endpoint(
                 elif msg_type == "report":
                     await handle_report_message(user_id, data)
                     
+                elif msg_type == "request_ai_suggestion":
+                    await handle_ai_suggestion_request(user_id, user, data)
+
+                elif msg_type == "cancel_ai":
+                    await handle_cancel_ai(user_id, data)
+
+                elif msg_type == "resume_ai":
+                    # Kết nối lại giữa lượt trả lời AI: chỉ gửi phần đã lỡ cho đúng socket này
+                    try:
+                        offset = int(data.get("offset") or 0)
+                    except (TypeError, ValueError):
+                        offset = 0
+                    for frame in ai_streams.resume(data.get("message_id"), user_id, offset):
+                        await websocket.send_json(frame)
+                
                 elif msg_type == "typing":
                     await manager.broadcast_to_room(data.get("room_id"), {
                         "type": "typing",
@@ -0,0 +1,150 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from backend.app.db.session import db
+
+# Mã lỗi trùng khóa của MongoDB (index unique trên support_threads.user_id, xem db/migrations.py v7)
+_DUPLICATE_KEY = 11000
+
+# support_threads là view được duy trì (materialized) của phòng 'help', mỗi user một document:
+# - last_user_message / last_reply ({id, content, timestamp[, by]}): tin cuối của user và phản hồi cuối (staff/bot)
+# - pending: tin cuối cùng của hội thoại là của user (chưa ai trả lời)
+# - unread_count, last_message, last_activity_at, last_sentiment và thẻ user (username, full_name, avatar_url)
+# Được cập nhật ngay khi ghi tin nhắn vào phòng help nên hộp thư hỗ trợ và tiếp quản khi Admin offline
+# chỉ cần một truy vấn có index thay vì gom toàn bộ lịch sử.
+
+async def upsert_thread(user_id: str, update: dict):
+    """
+    Cập nhật (hoặc tạo) document support_threads của user. Hai upsert đồng thời cho một user chưa có thread
+    thì một bên gặp DuplicateKeyError do index unique: thử lại một lần, lần này khớp document bên kia vừa tạo.
+    """
+    try:
+        await db["support_threads"].update_one({"user_id": user_id}, update, upsert=True)
+    except DuplicateKeyError:
+        await db["support_threads"].update_one({"user_id": user_id}, update, upsert=True)
+
+def _snapshot(message: dict) -> dict:
+    return {
+        "id": message.get("id"),
+        "content": message.get("content") or ("[Tệp đính kèm]" if message.get("file_url") else ""),
+        "timestamp": message.get("timestamp")
+    }
+
+def _user_card(user: dict) -> dict:
+    return {
+        "username": user.get("username"),
+        "full_name": user.get("full_name"),
+        "avatar_url": user.get("avatar") or user.get("avatar_url")
+    }
+
+async def note_user_message(user: dict, message: dict):
+    """
+    User gửi tin vào phòng help: hội thoại chuyển sang chờ trả lời, tăng bộ đếm chưa đọc của hộp thư Admin.
+    """
+    snapshot = _snapshot(message)
+    fields = {
+        **_user_card(user),
+        "last_user_message": snapshot,
+        "last_message": snapshot["content"],
+        "last_activity_at": snapshot["timestamp"],
+        "pending": True
+    }
+    if "sentiment" in message:
+        fields["last_sentiment"] = message["sentiment"]
+    await upsert_thread(user["id"], {
+        "$inc": {"unread_count": 1},
+        "$set": fields,
+        "$setOnInsert": {"status": "ai_processing"}
+    })
+
+async def note_reply(user_id: str, message: dict, by: str, extra: Optional[dict] = None):
+    """
+    Phản hồi cho user trong phòng help (by: 'staff' hoặc 'bot'). Staff trả lời thì hộp thư coi như đã đọc.
+    """
+    snapshot = _snapshot(message)
+    fields = {
+        "last_reply": {**snapshot, "by": by},
+        "last_message": snapshot["content"],
+        "last_activity_at": snapshot["timestamp"],
+        "pending": False,
+        **(extra or {})
+    }
+    if by == "staff":
+        fields["unread_count"] = 0
+    await upsert_thread(user_id, {"$set": fields})
+
+async def rebuild_support_threads() -> int:
+    """
+    Dựng lại các trường của view từ lịch sử phòng help (dữ liệu có trước khi view được duy trì).
+    Quét một lần theo thứ tự thời gian; giữ nguyên status, internal_note và unread_count hiện có.
+    """
+    staff = await db["users"].find(
+        {"$or": [{"is_superuser": True}, {"role": "admin"}]}, {"id": 1}
+    ).to_list(length=1000)
+    staff_ids = {u["id"] for u in staff}
+
+    threads: Dict[str, dict] = {}
+    cursor = db["messages"].find(
+        {"room_id": "help"},
+        {"id": 1, "content": 1, "file_url": 1, "timestamp": 1, "sender_id": 1, "receiver_id": 1, "is_bot": 1}
+    ).sort("timestamp", 1)
+    async for msg in cursor:
+        customer_id = msg.get("receiver_id") or msg.get("sender_id")
+        if not customer_id or customer_id in staff_ids:
+            continue
+        thread = threads.setdefault(customer_id, {})
+        snapshot = _snapshot(msg)
+        if msg.get("sender_id") == customer_id and not msg.get("is_bot"):
+            thread["last_user_message"] = snapshot
+            thread["pending"] = True
+        else:
+            thread["last_reply"] = {**snapshot, "by": "bot" if msg.get("is_bot") else "staff"}
+            thread["pending"] = False
+        thread["last_message"] = snapshot["content"]
+        thread["last_activity_at"] = snapshot["timestamp"]
+
+    if not threads:
+        return 0
+    users = await db["users"].find(
+        {"id": {"$in": list(threads)}}, {"id": 1, "username": 1, "full_name": 1, "avatar": 1, "avatar_url": 1}
+    ).to_list(length=len(threads))
+    for user in users:
+        threads[user["id"]].update(_user_card(user))
+
+    ops = [
+        UpdateOne(
+            {"user_id": user_id},
+            {"$set": fields, "$setOnInsert": {"status": "ai_processing", "unread_count": 0}},
+            upsert=True
+        )
+        for user_id, fields in threads.items()
+    ]
+    try:
+        await db["support_threads"].bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Worker khác (hoặc tin nhắn mới) vừa tạo thread cho cùng user: chạy lại các thao tác đó, lần này là update
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != _DUPLICATE_KEY for err in errors):
+            raise
+        await db["support_threads"].bulk_write([ops[err["index"]] for err in errors], ordered=False)
+    print(f"🔧 Rebuilt {len(threads)} support threads from help history")
+    return len(threads)
+
+async def ensure_support_threads():
+    """
+    Gọi khi khởi động: chỉ dựng lại khi view chưa từng được duy trì (chưa document nào có last_activity_at).
+    """
+    if await db["support_threads"].find_one({"last_activity_at": {"$exists": True}}, {"_id": 1}):
+        return
+    if await db["messages"].find_one({"room_id": "help"}, {"_id": 1}):
+        await rebuild_support_threads()
+
+async def pending_threads(limit: int = 100) -> List[dict]:
+    """
+    Các hội thoại có tin cuối của user chưa được trả lời, cũ nhất trước.
+    """
+    return await db["support_threads"].find({"pending": True}).sort("last_activity_at", 1).limit(limit).to_list(length=limit)
+
+def serialize_timestamp(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
@@ -1,9 +1,14 @@
 import uuid
 import asyncio
+from functools import partial
 from datetime import datetime, timezone
 from backend.app.db.session import db
+from backend.app.core.config import settings
 from .manager import manager
 from .ai_logic import run_ai_generation_task
+from .ai_context import context_builder
+from .ai_scheduler import ai_scheduler, PRIORITY_CATCHUP
+from .support_threads import pending_threads
 
 async def notify_user_status_change(user_id: str, is_online: bool):
     """
@@ -58,44 +63,38 @@ async def handle_admin_offline_catchup(admin_id: str):
         })
 
         if active_admins_count == 0:
-            help_messages = await db["messages"].aggregate([
-                {"$match": {"room_id": "help", "is_bot": False}},
-                {"$group": {"_id": "$sender_id", "last_msg": {"$last": "$$ROOT"}}}
-            ]).to_list(length=100)
+            # Hội thoại chờ trả lời lấy từ view support_threads (một truy vấn có index theo pending)
+            threads = [t for t in await pending_threads() if (t.get("last_user_message") or {}).get("content")]
+            user_ids = [t["user_id"] for t in threads]
+            users = await db["users"].find(
+                {"id": {"$in": user_ids}}, {"id": 1, "username": 1, "role": 1, "permissions": 1}
+            ).to_list(length=len(user_ids) or 1)
+            users_by_id = {u["id"]: u for u in users}
 
-            for entry in help_messages:
-                user_id = entry["_id"]
-                last_msg = entry["last_msg"]
-                
-                has_reply = await db["messages"].find_one({
-                    "room_id": "help",
-                    "timestamp": {"$gt": last_msg["timestamp"]},
-                    "$or": [
-                        {"receiver_id": user_id},
-                        {"is_bot": True}
-                    ]
-                })
+            threads = [t for t in threads if t["user_id"] in users_by_id]
+
+            # Dựng ngữ cảnh song song (giới hạn số truy vấn đồng thời) thay vì lần lượt từng hội thoại
+            slots = asyncio.Semaphore(max(1, settings.AI_CATCHUP_CONTEXT_CONCURRENCY))
+            async def build_context(user_id: str) -> str:
+                async with slots:
+                    return await context_builder.build(
+                        "help", user_id,
+                        header="Hệ thống: Admin vừa ngoại tuyến. AI đang tiếp quản hỗ trợ.\n"
+                    )
+            contexts = await asyncio.gather(*[build_context(t["user_id"]) for t in threads])
 
-                if not has_reply:
-                    ai_msg_id = str(uuid.uuid4())
-                    user_obj = await db["users"].find_one({"id": user_id})
-                    if not user_obj: continue
-                    username = user_obj.get("username", "Người dùng")
-                    
-                    chat_context = f"Hệ thống: Admin vừa ngoại tuyến. AI đang tiếp quản hỗ trợ.\n--- Lịch sử chat gần đây ---\n"
-                    recent_msgs = await db["messages"].find({
-                        "room_id": "help",
-                        "$or": [{"sender_id": user_id}, {"receiver_id": user_id}, {"is_bot": True}]
-                    }).sort("timestamp", -1).limit(5).to_list(length=5)
-                    recent_msgs.reverse()
-                    
-                    for m in recent_msgs:
-                        sender = m.get("sender_name") or "AI"
-                        chat_context += f"[{sender}]: {m.get('content')}\n"
+            for thread, chat_context in zip(threads, contexts):
+                user_id = thread["user_id"]
+                user_obj = users_by_id[user_id]
+                ai_msg_id = str(uuid.uuid4())
+                username = user_obj.get("username", "Người dùng")
 
-                    asyncio.create_task(run_ai_generation_task(
+                await ai_scheduler.submit(
+                    ai_msg_id, user_id, "help", PRIORITY_CATCHUP,
+                    partial(
+                        run_ai_generation_task,
                         room_id="help",
-                        prompt=last_msg["content"],
+                        prompt=thread["last_user_message"]["content"],
                         chat_context=chat_context,
                         user_id=user_id,
                         username=username,
@@ -105,7 +104,8 @@ async def handle_admin_offline_catchup(admin_id: str):
                         is_ai_room=True,
                         user_role=user_obj.get("role", "member"),
                         user_permissions=user_obj.get("permissions", [])
-                    ))
+                    )
+                )
     except Exception as e:
         print(f"Error in admin catchup: {e}")
 
@@ -1,12 +1,13 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from backend.app.core.config import settings
+from backend.app.core.runtime_cache import runtime_cache
 
 async def get_system_api_key(db: AsyncIOMotorDatabase, provider: str = "google") -> str:
     """
     Lấy API key từ database, nếu không có thì lấy từ settings (env).
     provider: 'google' hoặc 'openai'
     """
-    config = await db["system_configs"].find_one({"type": "api_keys"})
+    config = await runtime_cache.system_config(db)
     if not config:
         if provider == "google":
             return settings.GOOGLE_API_KEY
@@ -21,9 +22,9 @@ async def get_system_api_key(db: AsyncIOMotorDatabase, provider: str = "google")
 
 async def get_system_config(db: AsyncIOMotorDatabase) -> dict:
     """
-    Lấy toàn bộ cấu hình hệ thống.
+    Lấy toàn bộ cấu hình hệ thống (qua cache nóng, xem core/runtime_cache.py).
     """
-    config = await db["system_configs"].find_one({"type": "api_keys"})
+    config = await runtime_cache.system_config(db)
     if not config:
         return {
             "ai_enabled": True,
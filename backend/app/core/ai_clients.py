@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import time
+import importlib
+from typing import Dict, Optional, Tuple
+import httpx
+from backend.app.core.admin_config import get_system_api_key
+
+# Client cũ vẫn có thể đang stream dở khi key đổi, nên chỉ đóng sau khoảng chờ này
+RETIRE_GRACE_SECONDS = 120
+# Key được cache trong bộ nhớ; update_admin_config làm mới ngay trong process hiện tại,
+# các worker khác tự đọc lại sau TTL này
+KEY_CACHE_TTL_SECONDS = 300
+
+# SDK nặng (google-genai, LangChain) chỉ được import khi dùng lần đầu hoặc khi nạp sẵn sau khởi động,
+# để worker nhận kết nối mà không phải chờ tải LangChain
+_SDK_MODULES = {"google": "google.genai", "openai": "langchain_openai"}
+_sdk_loaded: Dict[str, object] = {}
+sdk_import_ms: Dict[str, float] = {}
+
+def load_sdk(provider: str):
+    """
+    Import (một lần) SDK của nhà cung cấp và trả về module. An toàn khi gọi từ thread (khóa import của Python).
+    """
+    module = _sdk_loaded.get(provider)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(_SDK_MODULES[provider])
+        sdk_import_ms.setdefault(provider, round((time.perf_counter() - start) * 1000, 1))
+        _sdk_loaded[provider] = module
+    return module
+
+async def ensure_sdk(provider: str):
+    """Import SDK trong thread nếu chưa có, để không chặn event loop ở lượt AI đầu tiên."""
+    if provider not in _sdk_loaded:
+        await asyncio.to_thread(load_sdk, provider)
+    return _sdk_loaded[provider]
+
+def key_fingerprint(api_key: str) -> str:
+    """
+    Định danh ngắn của API key (không lộ key trong thống kê/log).
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+class AIClientPool:
+    """
+    Pool client của các nhà cung cấp AI, khóa theo (provider, API key).
+    Client được tạo một lần và dùng lại cho mọi request nên kết nối HTTP (keep-alive, TLS)
+    được giữ giữa các lần trả lời thay vì tạo mới cho từng lần thử model.
+    """
+    def __init__(self):
+        self._keys: Dict[str, str] = {}
+        self._keys_loaded_at = 0.0
+        self._keys_lock = asyncio.Lock()
+        # (provider, fingerprint) -> client gốc (genai.Client / httpx.AsyncClient cho OpenAI)
+        self._clients: Dict[Tuple[str, str], object] = {}
+        # (fingerprint, model) -> ChatOpenAI dùng chung httpx.AsyncClient của key
+        self._chat_models: Dict[Tuple[str, str], object] = {}
+        self._created_at: Dict[Tuple[str, str], float] = {}
+        self._uses: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.build_ms = 0.0
+        self.key_loads = 0
+        self.retired = 0
+
+    async def get_api_key(self, db, provider: str) -> str:
+        if time.monotonic() - self._keys_loaded_at > KEY_CACHE_TTL_SECONDS:
+            async with self._keys_lock:
+                if time.monotonic() - self._keys_loaded_at > KEY_CACHE_TTL_SECONDS:
+                    self._keys = {
+                        "google": await get_system_api_key(db, "google"),
+                        "openai": await get_system_api_key(db, "openai")
+                    }
+                    self._keys_loaded_at = time.monotonic()
+                    self.key_loads += 1
+                    self._retire_stale()
+        return self._keys.get(provider, "")
+
+    def _get_or_build(self, provider: str, api_key: str, builder):
+        key = (provider, key_fingerprint(api_key))
+        client = self._clients.get(key)
+        if client is None:
+            self.misses += 1
+            start = time.perf_counter()
+            client = self._clients[key] = builder()
+            self.build_ms += (time.perf_counter() - start) * 1000
+            self._created_at[key] = time.time()
+        else:
+            self.hits += 1
+        self._uses[key] = self._uses.get(key, 0) + 1
+        return client
+
+    async def get_google_client(self, db):
+        """genai.Client của key hiện tại (None nếu chưa cấu hình key)."""
+        api_key = await self.get_api_key(db, "google")
+        if not api_key:
+            return None
+        genai = await ensure_sdk("google")
+        return self._get_or_build("google", api_key, lambda: genai.Client(api_key=api_key))
+
+    async def get_openai_model(self, db, model_name: str):
+        """ChatOpenAI của key hiện tại cho model_name (None nếu chưa cấu hình key)."""
+        api_key = await self.get_api_key(db, "openai")
+        if not api_key:
+            return None
+        http_client = self._get_or_build(
+            "openai", api_key,
+            lambda: httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=120))
+        )
+        model_key = (key_fingerprint(api_key), model_name)
+        llm = self._chat_models.get(model_key)
+        if llm is None:
+            langchain_openai = await ensure_sdk("openai")
+            llm = self._chat_models[model_key] = langchain_openai.ChatOpenAI(
+                model=model_name,
+                openai_api_key=api_key,
+                streaming=True,
+                http_async_client=http_client
+            )
+        return llm
+
+    def invalidate(self):
+        """
+        Gọi khi Admin đổi API key: lần dùng tiếp theo sẽ đọc lại key, client của key cũ được đóng sau khoảng chờ.
+        Client của key không đổi vẫn được giữ nguyên.
+        """
+        self._keys_loaded_at = 0.0
+
+    def _retire_stale(self):
+        current = {(p, key_fingerprint(k)) for p, k in self._keys.items() if k}
+        for key in [k for k in self._clients if k not in current]:
+            client = self._clients.pop(key)
+            self._created_at.pop(key, None)
+            self._uses.pop(key, None)
+            self._chat_models = {mk: m for mk, m in self._chat_models.items() if mk[0] != key[1]}
+            self.retired += 1
+            try:
+                asyncio.get_running_loop().create_task(self._close_later(client))
+            except RuntimeError:
+                pass
+
+    @staticmethod
+    async def _close_later(client):
+        await asyncio.sleep(RETIRE_GRACE_SECONDS)
+        try:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                await client.aio.aclose()
+        except Exception as e:
+            print(f"Error closing retired AI client: {e}")
+
+    async def prewarm(self, db):
+        """
+        Nạp sẵn trong thread nền SDK của các nhà cung cấp đã có API key, để lượt AI đầu tiên
+        không phải chịu thời gian import.
+        """
+        for provider in _SDK_MODULES:
+            if provider in _sdk_loaded or not await self.get_api_key(db, provider):
+                continue
+            try:
+                await ensure_sdk(provider)
+            except Exception as e:
+                print(f"⚠️ Prewarm {provider} SDK failed: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "clients": [
+                {
+                    "provider": provider,
+                    "key": fingerprint,
+                    "created_at": self._created_at.get((provider, fingerprint)),
+                    "uses": self._uses.get((provider, fingerprint), 0)
+                }
+                for provider, fingerprint in self._clients
+            ],
+            "chat_models": len(self._chat_models),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reuse_ratio": round(self.hits / total, 3) if total else 0.0,
+            "build_ms_total": round(self.build_ms, 2),
+            "key_loads": self.key_loads,
+            "retired": self.retired,
+            "sdk_loaded": sorted(_sdk_loaded),
+            "sdk_import_ms": dict(sdk_import_ms)
+        }
+
+ai_client_pool = AIClientPool()
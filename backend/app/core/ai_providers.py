@@ -0,0 +1,179 @@
+import asyncio
+import random
+import zlib
+from typing import AsyncIterator, Iterable, List, Optional
+from backend.app.core.config import settings
+from backend.app.core.ai_clients import ai_client_pool
+
+class AIProviderNotConfigured(Exception):
+    """Thiếu API key của nhà cung cấp: lỗi cấu hình, không tính vào sức khỏe model."""
+
+class AIProvider:
+    """
+    Giao diện nhà cung cấp model. Mỗi provider nhận một nhóm tên model (matches) và stream câu trả lời
+    dưới dạng các đoạn văn bản. Thêm nhà cung cấp mới: kế thừa lớp này rồi đăng ký vào ai_providers.
+    """
+    name = "base"
+
+    def matches(self, model_name: str) -> bool:
+        raise NotImplementedError
+
+    async def is_configured(self, db) -> bool:
+        return True
+
+    def stream(self, db, model_name: str, system_prompt: str, prompt: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+class GoogleProvider(AIProvider):
+    name = "google"
+
+    def matches(self, model_name: str) -> bool:
+        return model_name.lower().startswith("gemini")
+
+    async def is_configured(self, db) -> bool:
+        return bool(await ai_client_pool.get_api_key(db, "google"))
+
+    async def stream(self, db, model_name: str, system_prompt: str, prompt: str):
+        client = await ai_client_pool.get_google_client(db)
+        if not client:
+            raise AIProviderNotConfigured(f"No API key configured for {model_name}")
+        from google.genai import types
+        response_stream = await client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=system_prompt,
+                tools=[types.Tool(google_search=types.GoogleSearchRetrieval())]
+            )
+        )
+        async for chunk in response_stream:
+            if chunk.text:
+                yield chunk.text
+
+class OpenAIProvider(AIProvider):
+    name = "openai"
+
+    def matches(self, model_name: str) -> bool:
+        return "gpt" in model_name.lower()
+
+    async def is_configured(self, db) -> bool:
+        return bool(await ai_client_pool.get_api_key(db, "openai"))
+
+    async def stream(self, db, model_name: str, system_prompt: str, prompt: str):
+        llm = await ai_client_pool.get_openai_model(db, model_name)
+        if not llm:
+            raise AIProviderNotConfigured(f"No API key configured for {model_name}")
+        from langchain_core.messages import SystemMessage, HumanMessage
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=prompt)]
+        async for chunk in llm.astream(messages):
+            chunk_text = chunk.content
+            if isinstance(chunk_text, list):
+                chunk_text = "".join([str(p.get("text", p)) if isinstance(p, dict) else str(p) for p in chunk_text])
+            if chunk_text:
+                yield chunk_text
+
+class FakeProviderError(Exception):
+    """Lỗi được tiêm có chủ đích bởi FakeProvider."""
+
+class FakeProvider(AIProvider):
+    """
+    Provider giả lập cho kiểm thử offline và benchmark (model có tiền tố 'fake', ví dụ 'fake-fast').
+    Không gọi mạng; hành vi hoàn toàn xác định theo seed và thứ tự request:
+    - responses: danh sách câu trả lời kịch bản, chọn theo crc32 của prompt (cùng prompt -> cùng câu trả lời).
+    - ttft_ms / chunk_delay_ms / chunk_chars: độ trễ token đầu tiên, giữa các chunk và kích thước chunk.
+    - failure_rate: xác suất lỗi trước token đầu tiên; midstream_failure_rate: lỗi sau khi đã stream một nửa.
+    - failing_models: các model luôn lỗi (để thử failover/circuit breaker).
+    """
+    name = "fake"
+
+    DEFAULT_RESPONSES = [
+        "Chào bạn! Đây là câu trả lời mô phỏng từ LinkUp AI. Hệ thống đang chạy với provider giả lập nên "
+        "nội dung này được sinh cố định để đo hiệu năng đường truyền WebSocket, không phải câu trả lời thật.",
+        "Để tạo nhóm, bạn nhấn nút '+' ở danh sách phòng chat, đặt tên nhóm và chọn thành viên. "
+        "Sau đó mọi người có thể gọi @ai trong nhóm để nhờ trợ lý hỗ trợ.",
+        "Mình đã ghi nhận câu hỏi của bạn. Đây là phản hồi giả lập dài hơn một chút để benchmark có nhiều chunk: "
+        "LinkUp hỗ trợ chat thời gian thực, thu hồi tin nhắn, ghim tin, phản ứng biểu tượng cảm xúc và trợ lý AI."
+    ]
+
+    def __init__(
+        self,
+        responses: Optional[List[str]] = None,
+        ttft_ms: float = 0.0,
+        chunk_delay_ms: float = 0.0,
+        chunk_chars: int = 8,
+        failure_rate: float = 0.0,
+        midstream_failure_rate: float = 0.0,
+        failing_models: Iterable[str] = (),
+        seed: int = 0
+    ):
+        self.configure(
+            responses=responses, ttft_ms=ttft_ms, chunk_delay_ms=chunk_delay_ms, chunk_chars=chunk_chars,
+            failure_rate=failure_rate, midstream_failure_rate=midstream_failure_rate,
+            failing_models=failing_models, seed=seed
+        )
+
+    def configure(self, **options):
+        """
+        Đổi kịch bản lúc chạy (benchmark/kiểm thử); đặt lại bộ đếm để kết quả lặp lại được.
+        """
+        for name, value in options.items():
+            if name == "responses":
+                value = list(value or self.DEFAULT_RESPONSES)
+            elif name == "failing_models":
+                value = set(value or ())
+            setattr(self, name, value)
+        self.requests = 0
+        self.failures = 0
+
+    def matches(self, model_name: str) -> bool:
+        return model_name.lower().startswith("fake")
+
+    async def stream(self, db, model_name: str, system_prompt: str, prompt: str):
+        self.requests += 1
+        rng = random.Random(f"{self.seed}:{self.requests}")
+        response = self.responses[zlib.crc32(prompt.encode("utf-8")) % len(self.responses)]
+        chunks = [response[i:i + self.chunk_chars] for i in range(0, len(response), max(1, self.chunk_chars))]
+
+        await asyncio.sleep(self.ttft_ms / 1000)
+        if model_name in self.failing_models or rng.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeProviderError(f"Injected failure on {model_name}")
+        fail_at = len(chunks) // 2 if rng.random() < self.midstream_failure_rate else None
+
+        for i, chunk in enumerate(chunks):
+            if i == fail_at:
+                self.failures += 1
+                raise FakeProviderError(f"Injected mid-stream failure on {model_name}")
+            if i:
+                await asyncio.sleep(self.chunk_delay_ms / 1000)
+            yield chunk
+
+class ProviderRegistry:
+    """
+    Chọn provider theo tên model; provider đăng ký sau được ưu tiên hơn.
+    """
+    def __init__(self, providers: List[AIProvider]):
+        self._providers: List[AIProvider] = list(providers)
+
+    def register(self, provider: AIProvider):
+        self._providers.insert(0, provider)
+
+    def get(self, name: str) -> Optional[AIProvider]:
+        return next((p for p in self._providers if p.name == name), None)
+
+    def resolve(self, model_name: str) -> AIProvider:
+        for provider in self._providers:
+            if provider.matches(model_name):
+                return provider
+        # Mặc định: model không rõ nhà cung cấp đi qua Google như trước đây
+        return self.get("google")
+
+fake_provider = FakeProvider(
+    ttft_ms=settings.AI_FAKE_TTFT_MS,
+    chunk_delay_ms=settings.AI_FAKE_CHUNK_DELAY_MS,
+    chunk_chars=settings.AI_FAKE_CHUNK_CHARS,
+    failure_rate=settings.AI_FAKE_FAILURE_RATE,
+    seed=settings.AI_FAKE_SEED
+)
+
+ai_providers = ProviderRegistry([fake_provider, OpenAIProvider(), GoogleProvider()])
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Bộ đếm đã chạm hạn mức được nhớ trong bộ nhớ trong khoảng này để từ chối ngay không cần truy vấn DB
+# (ngắn để lượt được hoàn trả từ worker khác hoặc Admin nâng hạn mức sớm có hiệu lực)
+EXHAUSTED_CACHE_SECONDS = 60
+
+class QuotaReservation(NamedTuple):
+    keys: List[str]
+
+def quota_day(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+def quota_key(subject: str, day: str) -> str:
+    # subject: "user:<id>" hoặc "room:<id>"
+    return f"{subject}:{day}"
+
+class AIQuota:
+    """
+    Hạn mức AI theo ngày bằng bộ đếm (subject, ngày) trong collection ai_quota_counters.
+    Lượt được giữ chỗ nguyên tử bằng find_one_and_update có điều kiện count < limit + $inc,
+    nên các request đồng thời không thể cùng vượt qua kiểm tra; hoàn trả ($inc -1) khi sinh câu trả lời thất bại.
+    """
+    def __init__(self):
+        # key -> (count đã biết, thời điểm ghi nhận); mục quá EXHAUSTED_CACHE_SECONDS được dọn định kỳ trong reserve()
+        self._cache: Dict[str, Tuple[int, float]] = {}
+        self._last_prune = time.monotonic()
+        self.db_reservations = 0
+        self.cache_rejections = 0
+
+    def _known_exhausted(self, key: str, limit: int) -> bool:
+        cached = self._cache.get(key)
+        if not cached:
+            return False
+        count, at = cached
+        if time.monotonic() - at > EXHAUSTED_CACHE_SECONDS:
+            self._cache.pop(key, None)
+            return False
+        return count >= limit
+
+    def _prune(self):
+        """
+        Bỏ các mục đã quá hạn (gồm bộ đếm của các ngày trước), tối đa một lần mỗi EXHAUSTED_CACHE_SECONDS,
+        để cache chỉ giữ các subject vừa dùng AI thay vì tăng theo số subject x số ngày.
+        """
+        now = time.monotonic()
+        if now - self._last_prune < EXHAUSTED_CACHE_SECONDS:
+            return
+        self._last_prune = now
+        self._cache = {key: cached for key, cached in self._cache.items() if now - cached[1] <= EXHAUSTED_CACHE_SECONDS}
+
+    async def _reserve_one(self, db: AsyncIOMotorDatabase, subject: str, day: str, limit: int) -> bool:
+        key = quota_key(subject, day)
+        if self._known_exhausted(key, limit):
+            self.cache_rejections += 1
+            return False
+
+        self.db_reservations += 1
+        day_start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        try:
+            doc = await db["ai_quota_counters"].find_one_and_update(
+                {"_id": key, "count": {"$lt": limit}},
+                {
+                    "$inc": {"count": 1},
+                    "$setOnInsert": {
+                        "subject": subject,
+                        "day": day,
+                        # TTL index dọn bộ đếm cũ
+                        "expires_at": day_start + timedelta(days=2)
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Bộ đếm đã tồn tại và count >= limit nên điều kiện không khớp, upsert đụng _id: hết lượt
+            self._cache[key] = (limit, time.monotonic())
+            return False
+
+        self._cache[key] = (doc.get("count", 1), time.monotonic())
+        return True
+
+    async def reserve(
+        self,
+        db: AsyncIOMotorDatabase,
+        limits: List[Tuple[str, int]]
+    ) -> Tuple[Optional[QuotaReservation], Optional[str]]:
+        """
+        Giữ chỗ một lượt cho từng (subject, limit) theo thứ tự.
+        Trả về (reservation, None) nếu thành công, hoặc (None, subject đã hết lượt) - các lượt đã giữ trước đó được hoàn trả.
+        """
+        self._prune()
+        day = quota_day()
+        held: List[str] = []
+        for subject, limit in limits:
+            if not await self._reserve_one(db, subject, day, limit):
+                await self.refund(db, QuotaReservation(held))
+                return None, subject
+            held.append(quota_key(subject, day))
+        return QuotaReservation(held), None
+
+    async def refund(self, db: AsyncIOMotorDatabase, reservation: Optional[QuotaReservation]):
+        if not reservation or not reservation.keys:
+            return
+        for key in reservation.keys:
+            try:
+                await db["ai_quota_counters"].update_one(
+                    {"_id": key, "count": {"$gt": 0}},
+                    {"$inc": {"count": -1}}
+                )
+                self._cache.pop(key, None)
+            except Exception as e:
+                print(f"Error refunding AI quota {key}: {e}")
+
+    async def get_usage(self, db: AsyncIOMotorDatabase, subject: str) -> int:
+        doc = await db["ai_quota_counters"].find_one({"_id": quota_key(subject, quota_day())}, {"count": 1})
+        return doc.get("count", 0) if doc else 0
+
+    def stats(self) -> dict:
+        return {
+            "cached_counters": len(self._cache),
+            "db_reservations": self.db_reservations,
+            "cache_rejections": self.cache_rejections
+        }
+
+ai_quota = AIQuota()
@@ -0,0 +1,199 @@
+import asyncio
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from backend.app.core.config import settings
+
+# Cận trên các bucket histogram (bucket cuối là "lớn hơn cận cuối")
+LATENCY_BOUNDS_MS = [
+    5, 10, 25, 50, 75, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000,
+    7500, 10000, 15000, 20000, 30000, 60000
+]
+RATE_BOUNDS = [1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500]
+METRIC_BOUNDS = {
+    "queue_ms": LATENCY_BOUNDS_MS,
+    "ttft_ms": LATENCY_BOUNDS_MS,
+    "total_ms": LATENCY_BOUNDS_MS,
+    "tokens_per_s": RATE_BOUNDS
+}
+# Thời gian stream tối thiểu để tốc độ token/s có ý nghĩa (câu trả lời một chunk thì bỏ qua)
+_MIN_DECODE_MS = 50
+
+def bucket_index(bounds: List[float], value: float) -> int:
+    return bisect.bisect_left(bounds, value)
+
+def histogram_percentile(bounds: List[float], hist: Dict[str, int], p: float) -> Optional[float]:
+    """
+    Percentile ước lượng từ histogram (nội suy tuyến tính trong bucket chứa percentile).
+    """
+    counts = [int(hist.get(str(i), 0)) for i in range(len(bounds) + 1)]
+    total = sum(counts)
+    if not total:
+        return None
+    rank = p * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if not count or seen + count < rank:
+            seen += count
+            continue
+        if i == len(bounds):
+            return float(bounds[-1])
+        lower = bounds[i - 1] if i else 0
+        return round(lower + (bounds[i] - lower) * (rank - seen) / count, 1)
+    return float(bounds[-1])
+
+def _merge_counts(target: dict, source: dict):
+    for key, value in (source or {}).items():
+        if isinstance(value, dict):
+            _merge_counts(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+class AITelemetry:
+    """
+    Đo hiệu năng từng lượt trả lời AI: thời gian chờ hàng đợi, TTFT, tổng thời gian, số token đầu ra, token/s,
+    model/provider và mức fallback đã phục vụ (0 = model chính).
+    Không lưu từng lượt: cộng dồn histogram theo phút và (model, mức fallback) trong bộ nhớ rồi ghi theo lô
+    ($inc, an toàn khi nhiều worker) vào ai_telemetry; bucket cũ tự xóa bằng TTL index.
+    """
+    def __init__(self):
+        # (minute, model, provider, level) -> tài liệu $inc
+        self._pending: Dict[Tuple[datetime, str, str, Optional[int]], dict] = {}
+
+    def record(
+        self,
+        model: Optional[str],
+        provider: Optional[str],
+        level: Optional[int],
+        status: str = "ok",
+        queue_ms: Optional[float] = None,
+        ttft_ms: Optional[float] = None,
+        total_ms: Optional[float] = None,
+        output_tokens: int = 0,
+        output_chars: int = 0
+    ):
+        if not settings.AI_TELEMETRY_ENABLED:
+            return
+        minute = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        key = (minute, model or "none", provider or "-", level)
+        inc = self._pending.setdefault(key, {})
+
+        def add(field: str, value):
+            inc[field] = inc.get(field, 0) + value
+
+        add("count", 1)
+        if status == "cancelled":
+            add("cancelled", 1)
+        elif status != "ok":
+            add("errors", 1)
+        add("output_tokens", output_tokens)
+        add("output_chars", output_chars)
+
+        tokens_per_s = None
+        if ttft_ms is not None and total_ms is not None and output_tokens and total_ms - ttft_ms >= _MIN_DECODE_MS:
+            tokens_per_s = output_tokens / ((total_ms - ttft_ms) / 1000)
+        for metric, value in (("queue_ms", queue_ms), ("ttft_ms", ttft_ms), ("total_ms", total_ms), ("tokens_per_s", tokens_per_s)):
+            if value is None:
+                continue
+            add(f"n.{metric}", 1)
+            add(f"sum.{metric}", round(value, 2))
+            add(f"hist.{metric}.{bucket_index(METRIC_BOUNDS[metric], value)}", 1)
+
+    async def flush(self, db) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        retention = timedelta(days=settings.AI_TELEMETRY_RETENTION_DAYS)
+        ops = [
+            UpdateOne(
+                {"_id": f"{minute.strftime('%Y%m%d%H%M')}|{model}|{'-' if level is None else level}"},
+                {
+                    "$inc": inc,
+                    "$setOnInsert": {
+                        "minute": minute, "model": model, "provider": provider, "level": level,
+                        "expires_at": minute + retention
+                    }
+                },
+                upsert=True
+            )
+            for (minute, model, provider, level), inc in pending.items()
+        ]
+        try:
+            await db["ai_telemetry"].bulk_write(ops, ordered=False)
+        except Exception:
+            # Giữ lại số liệu chưa ghi để lần sau thử lại
+            for bucket, inc in pending.items():
+                merged = self._pending.setdefault(bucket, {})
+                for field, value in inc.items():
+                    merged[field] = merged.get(field, 0) + value
+            raise
+        return len(ops)
+
+    async def run_flush_loop(self, db):
+        while True:
+            await asyncio.sleep(settings.AI_TELEMETRY_FLUSH_SECONDS)
+            try:
+                await self.flush(db)
+            except Exception as e:
+                print(f"Error flushing AI telemetry: {e}")
+
+    async def summary(self, db, minutes: int = 60, group_by: str = "model") -> dict:
+        """
+        Gộp các bucket phút trong `minutes` phút gần nhất theo model (hoặc provider):
+        số lượt, tỉ lệ lỗi, phân bố mức fallback, token đầu ra và p50/p90/p99 + histogram từng chỉ số.
+        """
+        since = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=minutes - 1)
+        docs = await db["ai_telemetry"].find({"minute": {"$gte": since}}).to_list(length=None)
+
+        groups: Dict[str, dict] = {}
+        overall: dict = {}
+        for doc in docs:
+            name = doc.get("provider") if group_by == "provider" else doc.get("model")
+            group = groups.setdefault(name, {"model": doc.get("model"), "provider": doc.get("provider"), "levels": {}})
+            if group_by == "provider":
+                group.pop("model", None)
+            counts = {k: doc[k] for k in ("count", "errors", "cancelled", "output_tokens", "output_chars", "n", "sum", "hist") if k in doc}
+            level = "local" if doc.get("level") is None else str(doc["level"])
+            group["levels"][level] = group["levels"].get(level, 0) + doc.get("count", 0)
+            _merge_counts(group, counts)
+            _merge_counts(overall, counts)
+
+        rows = [self._describe(group) for group in groups.values()]
+        rows.sort(key=lambda r: r["requests"], reverse=True)
+        return {
+            "minutes": minutes,
+            "group_by": group_by,
+            "bounds": {"latency_ms": LATENCY_BOUNDS_MS, "tokens_per_s": RATE_BOUNDS},
+            "overall": self._describe(overall),
+            "groups": rows
+        }
+
+    @staticmethod
+    def _describe(group: dict) -> dict:
+        requests = group.get("count", 0)
+        metrics = {}
+        for metric, bounds in METRIC_BOUNDS.items():
+            hist = (group.get("hist") or {}).get(metric) or {}
+            samples = (group.get("n") or {}).get(metric, 0)
+            metrics[metric] = {
+                "samples": samples,
+                "avg": round((group.get("sum") or {}).get(metric, 0) / samples, 1) if samples else None,
+                "p50": histogram_percentile(bounds, hist, 0.5),
+                "p90": histogram_percentile(bounds, hist, 0.9),
+                "p99": histogram_percentile(bounds, hist, 0.99),
+                "histogram": [int(hist.get(str(i), 0)) for i in range(len(bounds) + 1)]
+            }
+        result = {key: group[key] for key in ("model", "provider", "levels") if key in group}
+        result.update({
+            "requests": requests,
+            "errors": group.get("errors", 0),
+            "error_rate": round(group.get("errors", 0) / requests, 3) if requests else 0.0,
+            "cancelled": group.get("cancelled", 0),
+            "output_tokens": group.get("output_tokens", 0),
+            "avg_output_tokens": round(group.get("output_tokens", 0) / requests, 1) if requests else None,
+            "metrics": metrics
+        })
+        return result
+
+ai_telemetry = AITelemetry()
@@ -30,6 +30,146 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 
+    # Read receipts: cửa sổ gộp (ms) - chỉ broadcast watermark cao nhất của mỗi user trong cửa sổ
+    READ_RECEIPT_COALESCE_MS: int = int(os.getenv("READ_RECEIPT_COALESCE_MS", "1000"))
+    # Phòng có nhiều thành viên hơn ngưỡng này: không trả danh sách seen_by, chỉ trạng thái đã xem
+    SEEN_BY_MAX_MEMBERS: int = int(os.getenv("SEEN_BY_MAX_MEMBERS", "200"))
+    # Chu kỳ (giây) của job đối soát bộ đếm chưa đọc
+    UNREAD_REPAIR_INTERVAL_SECONDS: int = int(os.getenv("UNREAD_REPAIR_INTERVAL_SECONDS", "1800"))
+
+    # Rate limiting (token bucket theo user/IP). Ghi đè hạn mức từng nhóm thao tác bằng JSON, xem core/rate_limit.py
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_RULES: str = os.getenv("RATE_LIMIT_RULES", "")
+
+    # Phát hiện spam gần trùng lặp (SimHash): cửa sổ trượt, khoảng cách Hamming tối đa (<= 3 để banding 4x16 bit đảm bảo tìm thấy),
+    # số tin gần trùng của một user để bị chặn (gấp đôi thì tự động báo cáo), số tin trong phòng từ nhiều tài khoản để báo cáo
+    SPAM_WINDOW_SECONDS: int = int(os.getenv("SPAM_WINDOW_SECONDS", "120"))
+    SPAM_MAX_HAMMING_DISTANCE: int = int(os.getenv("SPAM_MAX_HAMMING_DISTANCE", "3"))
+    SPAM_USER_BURST: int = int(os.getenv("SPAM_USER_BURST", "3"))
+    SPAM_ROOM_BURST: int = int(os.getenv("SPAM_ROOM_BURST", "5"))
+    SPAM_MIN_CHARS: int = int(os.getenv("SPAM_MIN_CHARS", "12"))
+
+    # Sức khỏe model AI & circuit breaker: cửa sổ kết quả gần nhất, số lỗi liên tiếp / tỉ lệ lỗi để mở circuit,
+    # thời gian chờ trước khi thăm dò lại (half-open)
+    AI_HEALTH_WINDOW: int = int(os.getenv("AI_HEALTH_WINDOW", "50"))
+    AI_CIRCUIT_FAILURES: int = int(os.getenv("AI_CIRCUIT_FAILURES", "3"))
+    AI_CIRCUIT_ERROR_RATE: float = float(os.getenv("AI_CIRCUIT_ERROR_RATE", "0.5"))
+    AI_CIRCUIT_MIN_SAMPLES: int = int(os.getenv("AI_CIRCUIT_MIN_SAMPLES", "10"))
+    AI_CIRCUIT_OPEN_SECONDS: int = int(os.getenv("AI_CIRCUIT_OPEN_SECONDS", "30"))
+    # Hedged request: nếu model chưa trả token đầu tiên sau AI_HEDGE_DELAY_MS thì chạy song song model kế tiếp
+    AI_HEDGE_ENABLED: bool = os.getenv("AI_HEDGE_ENABLED", "false").lower() == "true"
+    AI_HEDGE_DELAY_MS: int = int(os.getenv("AI_HEDGE_DELAY_MS", "2500"))
+
+    # Streaming AI: gộp chunk và gửi mỗi AI_STREAM_FLUSH_MS ms hoặc khi đủ AI_STREAM_FLUSH_CHARS ký tự
+    AI_STREAM_FLUSH_MS: int = int(os.getenv("AI_STREAM_FLUSH_MS", "50"))
+    AI_STREAM_FLUSH_CHARS: int = int(os.getenv("AI_STREAM_FLUSH_CHARS", "200"))
+    # Nối tiếp stream AI sau khi kết nối lại: giữ bộ đệm thêm AI_RESUME_GRACE_SECONDS giây sau khi trả lời xong,
+    # tối đa AI_RESUME_MAX_CHARS ký tự cuối mỗi câu trả lời
+    AI_RESUME_GRACE_SECONDS: int = int(os.getenv("AI_RESUME_GRACE_SECONDS", "60"))
+    AI_RESUME_MAX_CHARS: int = int(os.getenv("AI_RESUME_MAX_CHARS", "20000"))
+
+    # Bộ lập lịch AI: số lượt chạy đồng thời toàn cục / mỗi user / mỗi phòng, kích thước hàng đợi,
+    # số ngữ cảnh dựng song song khi AI tiếp quản các hội thoại chờ lúc Admin offline
+    AI_MAX_CONCURRENT: int = int(os.getenv("AI_MAX_CONCURRENT", "8"))
+    AI_MAX_PER_USER: int = int(os.getenv("AI_MAX_PER_USER", "1"))
+    AI_MAX_PER_ROOM: int = int(os.getenv("AI_MAX_PER_ROOM", "2"))
+    AI_MAX_QUEUE: int = int(os.getenv("AI_MAX_QUEUE", "200"))
+    AI_MAX_QUEUED_PER_USER: int = int(os.getenv("AI_MAX_QUEUED_PER_USER", "5"))
+    AI_CATCHUP_CONTEXT_CONCURRENCY: int = int(os.getenv("AI_CATCHUP_CONTEXT_CONCURRENCY", "4"))
+
+    # Cache câu trả lời AI phòng Help: số mục tối đa (LRU), thời gian sống, độ dài câu hỏi được cache (sau chuẩn hóa)
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "500"))
+    AI_CACHE_TTL_SECONDS: int = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+    AI_CACHE_MIN_CHARS: int = int(os.getenv("AI_CACHE_MIN_CHARS", "6"))
+    AI_CACHE_MAX_CHARS: int = int(os.getenv("AI_CACHE_MAX_CHARS", "200"))
+    # Request chờ lượt sinh cùng câu hỏi quá thời gian này thì tự sinh câu trả lời
+    AI_CACHE_WAIT_SECONDS: float = float(os.getenv("AI_CACHE_WAIT_SECONDS", "30"))
+
+    # Ngữ cảnh AI: ngân sách token, số tin tối đa được xét, độ dài tối đa mỗi tin;
+    # bản tóm tắt cuốn chiếu cập nhật mỗi AI_SUMMARY_BATCH tin, không tóm tắt AI_SUMMARY_KEEP_RECENT tin mới nhất
+    AI_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("AI_CONTEXT_TOKEN_BUDGET", "1500"))
+    AI_CONTEXT_MAX_MESSAGES: int = int(os.getenv("AI_CONTEXT_MAX_MESSAGES", "60"))
+    AI_CONTEXT_MAX_MESSAGE_CHARS: int = int(os.getenv("AI_CONTEXT_MAX_MESSAGE_CHARS", "1000"))
+    AI_SUMMARY_BATCH: int = int(os.getenv("AI_SUMMARY_BATCH", "20"))
+    AI_SUMMARY_KEEP_RECENT: int = int(os.getenv("AI_SUMMARY_KEEP_RECENT", "20"))
+    AI_SUMMARY_MAX_TOKENS: int = int(os.getenv("AI_SUMMARY_MAX_TOKENS", "400"))
+    # Mỗi hội thoại được xét cập nhật tóm tắt tối đa một lần trong khoảng này (giây)
+    AI_SUMMARY_DEBOUNCE_SECONDS: int = int(os.getenv("AI_SUMMARY_DEBOUNCE_SECONDS", "60"))
+
+    # Truy xuất tin nhắn cũ cho AI (chỉ mục vector n-gram băm cục bộ, NumPy): số chiều, số tin tối đa mỗi chỉ mục,
+    # số tin mỗi trang khi nạp nền, số chỉ mục và tổng bộ nhớ (MB) giữ trong RAM, số đoạn trích và điểm cosine tối thiểu
+    AI_RETRIEVAL_ENABLED: bool = os.getenv("AI_RETRIEVAL_ENABLED", "true").lower() == "true"
+    AI_RETRIEVAL_DIM: int = int(os.getenv("AI_RETRIEVAL_DIM", "256"))
+    AI_RETRIEVAL_MAX_MESSAGES: int = int(os.getenv("AI_RETRIEVAL_MAX_MESSAGES", "10000"))
+    AI_RETRIEVAL_PAGE_SIZE: int = int(os.getenv("AI_RETRIEVAL_PAGE_SIZE", "1000"))
+    AI_RETRIEVAL_MAX_INDEXES: int = int(os.getenv("AI_RETRIEVAL_MAX_INDEXES", "16"))
+    AI_RETRIEVAL_MAX_MB: int = int(os.getenv("AI_RETRIEVAL_MAX_MB", "128"))
+    AI_RETRIEVAL_TOP_K: int = int(os.getenv("AI_RETRIEVAL_TOP_K", "5"))
+    AI_RETRIEVAL_MIN_SCORE: float = float(os.getenv("AI_RETRIEVAL_MIN_SCORE", "0.25"))
+
+    # Backfill conversation_id (phân vùng hội thoại AI/Help theo user): số tin mỗi lô, thời gian nghỉ giữa các lô
+    PARTITION_MIGRATION_BATCH: int = int(os.getenv("PARTITION_MIGRATION_BATCH", "1000"))
+    PARTITION_MIGRATION_PAUSE_MS: int = int(os.getenv("PARTITION_MIGRATION_PAUSE_MS", "50"))
+
+    # Nhà cung cấp AI: danh sách model fallback (phân tách bằng dấu phẩy, để trống = mặc định trong ai_logic).
+    # Model có tiền tố "fake" dùng provider giả lập (kiểm thử offline/benchmark, không tốn quota)
+    AI_FALLBACK_MODELS: str = os.getenv("AI_FALLBACK_MODELS", "")
+    AI_FAKE_TTFT_MS: float = float(os.getenv("AI_FAKE_TTFT_MS", "300"))
+    AI_FAKE_CHUNK_DELAY_MS: float = float(os.getenv("AI_FAKE_CHUNK_DELAY_MS", "20"))
+    AI_FAKE_CHUNK_CHARS: int = int(os.getenv("AI_FAKE_CHUNK_CHARS", "8"))
+    AI_FAKE_FAILURE_RATE: float = float(os.getenv("AI_FAKE_FAILURE_RATE", "0"))
+    AI_FAKE_SEED: int = int(os.getenv("AI_FAKE_SEED", "0"))
+
+    # FAQ phòng Help (BM25): độ tin cậy >= HIGH trả lời ngay không gọi model, >= MEDIUM đưa vào prompt làm ngữ cảnh
+    FAQ_ENABLED: bool = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+    FAQ_HIGH_CONFIDENCE: float = float(os.getenv("FAQ_HIGH_CONFIDENCE", "0.8"))
+    FAQ_MEDIUM_CONFIDENCE: float = float(os.getenv("FAQ_MEDIUM_CONFIDENCE", "0.4"))
+    FAQ_CONTEXT_ENTRIES: int = int(os.getenv("FAQ_CONTEXT_ENTRIES", "3"))
+
+    # Gợi ý trả lời nhanh cục bộ (MessageRead.suggestions): huấn luyện định kỳ từ lịch sử phòng cộng đồng/nhóm.
+    # Một câu trả lời chỉ được gợi ý khi ít nhất SMART_REPLY_MIN_USERS người khác nhau từng dùng
+    SMART_REPLY_ENABLED: bool = os.getenv("SMART_REPLY_ENABLED", "true").lower() == "true"
+    SMART_REPLY_REFRESH_MINUTES: int = int(os.getenv("SMART_REPLY_REFRESH_MINUTES", "60"))
+    SMART_REPLY_HISTORY_DAYS: int = int(os.getenv("SMART_REPLY_HISTORY_DAYS", "30"))
+    SMART_REPLY_MAX_MESSAGES: int = int(os.getenv("SMART_REPLY_MAX_MESSAGES", "200000"))
+    SMART_REPLY_MAX_GAP_SECONDS: int = int(os.getenv("SMART_REPLY_MAX_GAP_SECONDS", "600"))
+    SMART_REPLY_MAX_CHARS: int = int(os.getenv("SMART_REPLY_MAX_CHARS", "40"))
+    SMART_REPLY_MIN_USERS: int = int(os.getenv("SMART_REPLY_MIN_USERS", "3"))
+    SMART_REPLY_TRAIN_IN_PROCESS: bool = os.getenv("SMART_REPLY_TRAIN_IN_PROCESS", "true").lower() == "true"
+
+    # Chấm điểm cảm xúc cục bộ trên luồng gửi tin: |điểm| >= ngưỡng là tích cực/tiêu cực,
+    # tổng hợp theo giờ (phòng, hội thoại hỗ trợ) được ghi theo lô và giữ SENTIMENT_RETENTION_DAYS ngày
+    SENTIMENT_ENABLED: bool = os.getenv("SENTIMENT_ENABLED", "true").lower() == "true"
+    SENTIMENT_LABEL_THRESHOLD: float = float(os.getenv("SENTIMENT_LABEL_THRESHOLD", "0.3"))
+    SENTIMENT_FLUSH_SECONDS: int = int(os.getenv("SENTIMENT_FLUSH_SECONDS", "10"))
+    SENTIMENT_RETENTION_DAYS: int = int(os.getenv("SENTIMENT_RETENTION_DAYS", "14"))
+
+    # Đo hiệu năng AI (chờ hàng đợi, TTFT, tổng thời gian, token/s theo model và mức fallback):
+    # histogram theo phút được ghi theo lô mỗi AI_TELEMETRY_FLUSH_SECONDS, giữ AI_TELEMETRY_RETENTION_DAYS ngày
+    AI_TELEMETRY_ENABLED: bool = os.getenv("AI_TELEMETRY_ENABLED", "true").lower() == "true"
+    AI_TELEMETRY_FLUSH_SECONDS: int = int(os.getenv("AI_TELEMETRY_FLUSH_SECONDS", "10"))
+    AI_TELEMETRY_RETENTION_DAYS: int = int(os.getenv("AI_TELEMETRY_RETENTION_DAYS", "7"))
+
+    # Ghi log theo lô (ai_usage, system_logs): flush khi đủ LOG_SINK_BATCH_SIZE bản ghi hoặc sau LOG_SINK_FLUSH_MS;
+    # bộ đệm vượt LOG_SINK_COALESCE_RATIO thì gộp lỗi trùng, đầy LOG_SINK_MAX_BUFFER thì bỏ (có đếm)
+    LOG_SINK_BATCH_SIZE: int = int(os.getenv("LOG_SINK_BATCH_SIZE", "200"))
+    LOG_SINK_FLUSH_MS: int = int(os.getenv("LOG_SINK_FLUSH_MS", "1000"))
+    LOG_SINK_MAX_BUFFER: int = int(os.getenv("LOG_SINK_MAX_BUFFER", "5000"))
+    LOG_SINK_COALESCE_RATIO: float = float(os.getenv("LOG_SINK_COALESCE_RATIO", "0.5"))
+    LOG_PRINT_INTERVAL_SECONDS: int = int(os.getenv("LOG_PRINT_INTERVAL_SECONDS", "10"))
+    # Thời hạn lưu log (TTL trên expires_at)
+    AI_USAGE_RETENTION_DAYS: int = int(os.getenv("AI_USAGE_RETENTION_DAYS", "90"))
+    SYSTEM_LOG_RETENTION_DAYS: int = int(os.getenv("SYSTEM_LOG_RETENTION_DAYS", "30"))
+
+    # Khởi động nhanh: cache nóng (cấu hình hệ thống, danh sách Admin, phòng hay dùng) được nạp song song sau khi
+    # migration xong; worker khác thấy thay đổi sau tối đa *_TTL_SECONDS. Nạp sẵn SDK AI sau khi sẵn sàng.
+    CONFIG_CACHE_TTL_SECONDS: int = int(os.getenv("CONFIG_CACHE_TTL_SECONDS", "30"))
+    ADMIN_CACHE_TTL_SECONDS: int = int(os.getenv("ADMIN_CACHE_TTL_SECONDS", "60"))
+    ROOM_CACHE_TTL_SECONDS: int = int(os.getenv("ROOM_CACHE_TTL_SECONDS", "30"))
+    ROOM_CACHE_MAX_ENTRIES: int = int(os.getenv("ROOM_CACHE_MAX_ENTRIES", "2000"))
+    ROOM_CACHE_WARM_COUNT: int = int(os.getenv("ROOM_CACHE_WARM_COUNT", "200"))
+    AI_SDK_PREWARM: bool = os.getenv("AI_SDK_PREWARM", "true").lower() == "true"
+
     class Config:
         case_sensitive = True
 
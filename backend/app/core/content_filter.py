@@ -0,0 +1,208 @@
+import asyncio
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Mức độ xử lý khi khớp từ cấm (số càng lớn càng nghiêm trọng)
+ACTION_FLAG = "flag"    # Vẫn gửi, tự động tạo báo cáo cho Admin
+ACTION_MASK = "mask"    # Vẫn gửi nhưng che từ cấm bằng '*'
+ACTION_BLOCK = "block"  # Từ chối tin nhắn
+ACTION_SEVERITY = {ACTION_FLAG: 1, ACTION_MASK: 2, ACTION_BLOCK: 3}
+
+def _build_fold_table() -> Dict[int, str]:
+    """
+    Bảng chuyển đổi 1-1 ký tự: chữ thường + bỏ dấu tiếng Việt (đ -> d).
+    Giữ nguyên độ dài chuỗi để vị trí khớp trên chuỗi đã fold dùng được cho chuỗi gốc (che từ).
+    """
+    table = {}
+    ranges = [(0x41, 0x5A), (0xC0, 0x24F), (0x1E00, 0x1EFF)]
+    for start, end in ranges:
+        for cp in range(start, end + 1):
+            ch = chr(cp)
+            lowered = ch.lower()
+            if len(lowered) != 1:
+                continue
+            base = "".join(c for c in unicodedata.normalize("NFD", lowered) if not unicodedata.combining(c))
+            if lowered == "đ":
+                base = "d"
+            if len(base) == 1 and base != ch:
+                table[cp] = base
+    return table
+
+_FOLD_TABLE = _build_fold_table()
+
+def fold_text(text: str) -> str:
+    """
+    Chuẩn hóa văn bản để so khớp: chữ thường, bỏ dấu tiếng Việt. Độ dài không đổi so với dạng NFC.
+    Bảng fold chỉ chứa ký tự dựng sẵn nên văn bản dạng tổ hợp (NFD, dấu tách rời) được chuẩn hóa NFC trước.
+    """
+    return unicodedata.normalize("NFC", text).translate(_FOLD_TABLE)
+
+class FilterMatch(NamedTuple):
+    start: int
+    end: int
+    term: str
+    action: str
+
+class FilterResult(NamedTuple):
+    action: Optional[str]
+    content: str
+    matches: List[FilterMatch]
+
+class AhoCorasickAutomaton:
+    """
+    Automaton Aho-Corasick: khớp đồng thời toàn bộ từ điển trong một lần duyệt văn bản,
+    chi phí O(độ dài văn bản + số lần khớp), không phụ thuộc kích thước từ điển.
+    """
+    __slots__ = ("goto", "fail", "out", "terms")
+
+    def __init__(self, entries: Iterable[Tuple[str, str, bool]]):
+        # entries: (term, action, whole_word)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # node -> danh sách index term kết thúc tại node (đã gộp theo fail link)
+        self.out: List[Tuple[int, ...]] = [()]
+        self.terms: List[Tuple[str, str, bool]] = []
+
+        own_out: List[List[int]] = [[]]
+        for term, action, whole_word in entries:
+            folded = fold_text(term.strip())
+            if not folded:
+                continue
+            node = 0
+            for ch in folded:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    own_out.append([])
+                node = nxt
+            own_out[node].append(len(self.terms))
+            self.terms.append((folded, action, whole_word))
+
+        # BFS dựng fail link
+        self.out = [tuple(o) for o in own_out]
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                if self.out[self.fail[nxt]]:
+                    self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def find(self, folded: str) -> List[FilterMatch]:
+        goto, fail, out, terms = self.goto, self.fail, self.out, self.terms
+        matches = []
+        node = 0
+        text_len = len(folded)
+        for i, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for idx in out[node]:
+                    term, action, whole_word = terms[idx]
+                    start = i - len(term) + 1
+                    end = i + 1
+                    if whole_word and (
+                        (start > 0 and folded[start - 1].isalnum()) or
+                        (end < text_len and folded[end].isalnum())
+                    ):
+                        continue
+                    matches.append(FilterMatch(start, end, term, action))
+        return matches
+
+class ContentFilter:
+    """
+    Bộ lọc nội dung chạy trực tiếp trên luồng gửi tin.
+    Từ điển do Admin quản lý (collection moderation_lexicon), automaton được dựng lại trong nền
+    và hoán đổi nguyên tử khi từ điển thay đổi, nên luồng gửi tin không bao giờ phải chờ.
+    """
+    def __init__(self):
+        self.automaton = AhoCorasickAutomaton([])
+        self.version = 0
+        self.built_at: Optional[float] = None
+        self.build_ms = 0.0
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_pending = False
+
+    def check(self, content: str) -> FilterResult:
+        if not content or not len(self.automaton):
+            return FilterResult(None, content, [])
+
+        # Vị trí khớp tính trên dạng NFC nên che (mask) cũng làm trên dạng đó
+        content = unicodedata.normalize("NFC", content)
+        matches = self.automaton.find(fold_text(content))
+        if not matches:
+            return FilterResult(None, content, [])
+
+        action = max((m.action for m in matches), key=lambda a: ACTION_SEVERITY.get(a, 0))
+        if action == ACTION_MASK:
+            chars = list(content)
+            for m in matches:
+                if m.action == ACTION_MASK:
+                    chars[m.start:m.end] = "*" * (m.end - m.start)
+            content = "".join(chars)
+        return FilterResult(action, content, matches)
+
+    async def rebuild(self, db) -> int:
+        """
+        Tải từ điển từ DB và dựng automaton trong thread riêng, sau đó hoán đổi.
+        """
+        docs = await db["moderation_lexicon"].find(
+            {}, {"term": 1, "action": 1, "whole_word": 1}
+        ).to_list(length=None)
+        entries = [
+            (d["term"], d.get("action", ACTION_BLOCK), d.get("whole_word", True))
+            for d in docs if d.get("term")
+        ]
+
+        start = time.perf_counter()
+        automaton = await asyncio.to_thread(AhoCorasickAutomaton, entries)
+        self.build_ms = (time.perf_counter() - start) * 1000
+        self.automaton = automaton
+        self.version += 1
+        self.built_at = time.time()
+        return len(automaton)
+
+    def schedule_rebuild(self, db):
+        """
+        Yêu cầu dựng lại automaton trong nền. Nhiều thay đổi liên tiếp được gộp thành một lần dựng.
+        """
+        if self._rebuild_task and not self._rebuild_task.done():
+            self._rebuild_pending = True
+            return
+        self._rebuild_task = asyncio.create_task(self._rebuild_loop(db))
+
+    async def _rebuild_loop(self, db):
+        while True:
+            self._rebuild_pending = False
+            try:
+                count = await self.rebuild(db)
+                print(f"🛡️ Content filter rebuilt: {count} terms in {round(self.build_ms, 1)}ms")
+            except Exception as e:
+                print(f"Error rebuilding content filter: {e}")
+            if not self._rebuild_pending:
+                break
+
+    def stats(self) -> dict:
+        return {
+            "terms": len(self.automaton),
+            "states": len(self.automaton.goto),
+            "version": self.version,
+            "build_ms": round(self.build_ms, 2),
+            "built_at": self.built_at
+        }
+
+content_filter = ContentFilter()
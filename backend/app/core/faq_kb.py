@@ -0,0 +1,194 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter, deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.content_filter import fold_text
+from backend.app.core.model_health import percentile
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Hư từ/từ hỏi phổ biến (đã bỏ dấu) - không mang nội dung nên không đưa vào chỉ mục
+STOPWORDS = {
+    "la", "cua", "va", "cho", "toi", "minh", "ban", "the", "nao", "lam", "sao", "de", "co", "thi", "ma",
+    "voi", "a", "ah", "nhe", "oi", "vay", "gi", "nhu", "duoc", "mot", "cac", "nhung", "em", "anh", "chi",
+    "hay", "giup", "cach", "o", "khi", "nay", "do", "ve", "muon", "can", "phai", "di", "len", "ra", "vao",
+    "ak", "nha", "j", "dc", "vs", "how", "to", "is", "an", "i"
+}
+
+# Trọng số trường: câu hỏi/từ khóa quan trọng hơn nội dung câu trả lời
+_WEIGHT_QUESTION = 2
+_WEIGHT_ANSWER = 1
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách từ tiếng Việt: bỏ dấu (người dùng hay gõ không dấu), chữ thường, bỏ hư từ.
+    Tiếng Việt ghép từ bằng nhiều âm tiết nên thêm cặp âm tiết liền kề ("tao nhom", "thu hoi").
+    """
+    syllables = [w for w in _NON_WORD.sub(" ", fold_text(text or "")).split() if w not in STOPWORDS]
+    return syllables + [f"{a} {b}" for a, b in zip(syllables, syllables[1:])]
+
+class FAQMatch(NamedTuple):
+    entry: dict
+    score: float
+    confidence: float
+
+class BM25Index:
+    """
+    Chỉ mục BM25 trong bộ nhớ (posting list theo term). Dựng một lần khi FAQ thay đổi,
+    truy vấn chỉ duyệt posting của các term có trong câu hỏi.
+    """
+    def __init__(self, entries: List[dict], k1: float = 1.2, b: float = 0.75):
+        self.entries = entries
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        for i, entry in enumerate(entries):
+            tf = Counter()
+            for term in tokenize(entry.get("question", "") + " " + " ".join(entry.get("keywords") or [])):
+                tf[term] += _WEIGHT_QUESTION
+            for term in tokenize(entry.get("answer", "")):
+                tf[term] += _WEIGHT_ANSWER
+            for term, count in tf.items():
+                self.postings.setdefault(term, []).append((i, count))
+            self.lengths.append(sum(tf.values()))
+        n = len(entries)
+        self.avgdl = (sum(self.lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        # idf của term chưa từng xuất hiện (dùng để tính độ phủ của câu hỏi)
+        self.unseen_idf = math.log(1 + (n + 0.5) / 0.5) if n else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query: str, k: int = 3) -> List[FAQMatch]:
+        """
+        Trả về top-k theo BM25 kèm độ tin cậy 0..1 = tỉ lệ "khối lượng idf" của câu hỏi mà mục FAQ phủ được
+        (câu hỏi có nhiều từ lạ/không liên quan thì độ tin cậy thấp dù điểm BM25 cao).
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.entries:
+            return []
+        scores: Dict[int, float] = {}
+        matched_idf: Dict[int, float] = {}
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for i, tf in docs:
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avgdl))
+                scores[i] = scores.get(i, 0.0) + idf * norm
+                matched_idf[i] = matched_idf.get(i, 0.0) + idf
+        total_idf = sum(self.idf.get(t, self.unseen_idf) for t in terms)
+        top = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [
+            FAQMatch(self.entries[i], round(scores[i], 3), round(matched_idf[i] / total_idf, 3))
+            for i in top
+        ]
+
+class FAQKnowledgeBase:
+    """
+    Cơ sở tri thức FAQ của phòng Help (collection faq_entries do Admin quản lý), tìm kiếm BM25 trong process.
+    - Độ tin cậy >= FAQ_HIGH_CONFIDENCE: trả lời ngay bằng câu trả lời FAQ, không gọi model.
+    - Độ tin cậy >= FAQ_MEDIUM_CONFIDENCE: đưa vài mục liên quan vào prompt làm ngữ cảnh gọn.
+    Chỉ mục được dựng lại trong nền và hoán đổi khi FAQ thay đổi (như bộ lọc nội dung).
+    """
+    def __init__(self):
+        self.index = BM25Index([])
+        self.version = 0
+        self.build_ms = 0.0
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_pending = False
+        self.lookups = 0
+        self.answered = 0
+        self.contextual = 0
+        self.misses = 0
+        self._latency_us = deque(maxlen=500)
+        self._entry_hits: Counter = Counter()
+
+    def lookup(self, query: str) -> Tuple[Optional[FAQMatch], List[FAQMatch]]:
+        """
+        Trả về (mục trả lời trực tiếp hoặc None, các mục làm ngữ cảnh) và ghi nhận thống kê.
+        """
+        if not len(self.index):
+            return None, []
+        start = time.perf_counter()
+        matches = self.index.search(query, k=max(1, settings.FAQ_CONTEXT_ENTRIES))
+        self._latency_us.append((time.perf_counter() - start) * 1_000_000)
+        self.lookups += 1
+
+        if matches and matches[0].confidence >= settings.FAQ_HIGH_CONFIDENCE:
+            self.answered += 1
+            self._entry_hits[matches[0].entry["id"]] += 1
+            return matches[0], []
+        context = [m for m in matches if m.confidence >= settings.FAQ_MEDIUM_CONFIDENCE]
+        if context:
+            self.contextual += 1
+            for m in context:
+                self._entry_hits[m.entry["id"]] += 1
+        else:
+            self.misses += 1
+        return None, context
+
+    async def rebuild(self, db) -> int:
+        docs = await db["faq_entries"].find(
+            {"enabled": {"$ne": False}}, {"_id": 0, "id": 1, "question": 1, "answer": 1, "keywords": 1}
+        ).to_list(length=None)
+        entries = [d for d in docs if d.get("question") and d.get("answer")]
+        start = time.perf_counter()
+        index = await asyncio.to_thread(BM25Index, entries)
+        self.build_ms = (time.perf_counter() - start) * 1000
+        self.index = index
+        self.version += 1
+        return len(index)
+
+    def schedule_rebuild(self, db):
+        """
+        Yêu cầu dựng lại chỉ mục trong nền. Nhiều thay đổi liên tiếp được gộp thành một lần dựng.
+        """
+        if self._rebuild_task and not self._rebuild_task.done():
+            self._rebuild_pending = True
+            return
+        self._rebuild_task = asyncio.create_task(self._rebuild_loop(db))
+
+    async def _rebuild_loop(self, db):
+        while True:
+            self._rebuild_pending = False
+            try:
+                count = await self.rebuild(db)
+                print(f"📚 FAQ index rebuilt: {count} entries in {round(self.build_ms, 1)}ms")
+            except Exception as e:
+                print(f"Error rebuilding FAQ index: {e}")
+            if not self._rebuild_pending:
+                break
+
+    def stats(self) -> dict:
+        latencies = list(self._latency_us)
+        return {
+            "entries": len(self.index),
+            "terms": len(self.index.postings),
+            "version": self.version,
+            "build_ms": round(self.build_ms, 2),
+            "lookups": self.lookups,
+            "answered": self.answered,
+            "contextual": self.contextual,
+            "misses": self.misses,
+            "answer_rate": round(self.answered / self.lookups, 3) if self.lookups else 0.0,
+            "hit_rate": round((self.answered + self.contextual) / self.lookups, 3) if self.lookups else 0.0,
+            "lookup_p50_us": percentile(latencies, 0.5),
+            "lookup_p95_us": percentile(latencies, 0.95),
+            "top_entries": self._entry_hits.most_common(10),
+            "thresholds": {"high": settings.FAQ_HIGH_CONFIDENCE, "medium": settings.FAQ_MEDIUM_CONFIDENCE}
+        }
+
+def format_faq_context(matches: List[FAQMatch]) -> str:
+    return "\n".join(f"- Hỏi: {m.entry['question']}\n  Đáp: {m.entry['answer']}" for m in matches)
+
+faq_kb = FAQKnowledgeBase()
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from backend.app.core.config import settings
+
+# Mã lỗi trùng khóa của MongoDB: bản ghi (đã có _id) được ghi ở một lần flush lỗi dở dang trước đó
+_DUPLICATE_KEY = 11000
+
+class LogSink:
+    """
+    Ghi log (ai_usage, system_logs) theo lô, không chặn luồng trả lời:
+    - emit() chỉ thêm bản ghi vào bộ đệm trong bộ nhớ; insert_many khi đủ batch_size hoặc sau flush_ms.
+    - Quá tải (bộ đệm vượt coalesce_ratio * max_buffer): các bản ghi lỗi giống nhau (cùng coalesce_key) được gộp
+      vào bản ghi đang chờ bằng trường "count" thay vì thêm bản ghi mới; bộ đệm đầy thì bỏ và đếm số bị bỏ
+      (ghi lại một bản ghi "log_sink_dropped" ở lần flush sau).
+    - Mỗi bản ghi có expires_at theo thời hạn lưu của collection (TTL index) nên log không tăng vô hạn.
+    """
+    def __init__(
+        self,
+        batch_size: int,
+        flush_ms: int,
+        max_buffer: int,
+        coalesce_ratio: float,
+        retention_days: Dict[str, int]
+    ):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_buffer = max_buffer
+        self.coalesce_ratio = coalesce_ratio
+        self.retention_days = retention_days
+        self._buffers: Dict[str, List[dict]] = defaultdict(list)
+        self._coalesce: Dict[Tuple[str, str], dict] = {}
+        self._size = 0
+        self._wakeup = asyncio.Event()
+        self._unreported_drops: Counter = Counter()
+        self._prints: Dict[str, Tuple[float, int]] = {}
+        self.written: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.coalesced: Counter = Counter()
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+
+    def emit(self, collection: str, doc: dict, coalesce_key: Optional[str] = None) -> bool:
+        """
+        Đưa một bản ghi vào bộ đệm (không await). Trả về False nếu bị bỏ do quá tải.
+        """
+        if coalesce_key and self._size >= self.max_buffer * self.coalesce_ratio:
+            pending = self._coalesce.get((collection, coalesce_key))
+            if pending is not None:
+                pending["count"] = pending.get("count", 1) + 1
+                pending["last_timestamp"] = doc.get("timestamp")
+                self.coalesced[collection] += 1
+                return True
+        if self._size >= self.max_buffer:
+            self.dropped[collection] += 1
+            self._unreported_drops[collection] += 1
+            return False
+
+        days = self.retention_days.get(collection)
+        timestamp = doc.get("timestamp")
+        if days and isinstance(timestamp, datetime):
+            doc.setdefault("expires_at", timestamp + timedelta(days=days))
+        self._buffers[collection].append(doc)
+        if coalesce_key:
+            self._coalesce[(collection, coalesce_key)] = doc
+        self._size += 1
+        if self._size >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self, db) -> int:
+        if self._unreported_drops:
+            drops, self._unreported_drops = dict(self._unreported_drops), Counter()
+            now = datetime.now(timezone.utc)
+            self._buffers["system_logs"].append({
+                "type": "log_sink_dropped",
+                "message": f"Bỏ {sum(drops.values())} bản ghi log do quá tải",
+                "counts": drops,
+                "timestamp": now,
+                "expires_at": now + timedelta(days=self.retention_days.get("system_logs", 30))
+            })
+            self._size += 1
+        if not self._size:
+            return 0
+
+        buffers, self._buffers = self._buffers, defaultdict(list)
+        self._coalesce = {}
+        self._size = 0
+        start = time.perf_counter()
+        written = 0
+        for collection, docs in buffers.items():
+            if not docs:
+                continue
+            try:
+                await db[collection].insert_many(docs, ordered=False)
+                written += len(docs)
+                self.written[collection] += len(docs)
+            except BulkWriteError as e:
+                # Lỗi một phần: bản ghi đã ghi được và bản ghi trùng khóa (đã ghi ở lần trước) không ghi lại,
+                # chỉ xếp lại các bản ghi lỗi thật
+                errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != _DUPLICATE_KEY]
+                failed = sorted({err["index"] for err in errors})
+                stored = len(docs) - len(failed)
+                written += stored
+                self.written[collection] += stored
+                if failed:
+                    self.failures += 1
+                    self._requeue(collection, [docs[i] for i in failed])
+                    self.print_throttled(
+                        f"log_sink:{collection}",
+                        f"⚠️ Log sink flush to {collection}: {len(failed)} records failed: {errors[0].get('errmsg')}"
+                    )
+            except Exception as e:
+                # Lỗi kết nối: ghi lại cả lô ở lần sau (bản ghi đã có _id nên phần đã ghi được sẽ chỉ báo trùng khóa)
+                self.failures += 1
+                self._requeue(collection, docs)
+                self.print_throttled(f"log_sink:{collection}", f"⚠️ Log sink flush to {collection} failed: {e}")
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return written
+
+    def _requeue(self, collection: str, docs: List[dict]):
+        """Xếp lại các bản ghi chưa ghi được lên đầu bộ đệm, phần vượt max_buffer bị bỏ và đếm."""
+        keep = docs[:max(0, self.max_buffer - self._size)]
+        self._buffers[collection][:0] = keep
+        self._size += len(keep)
+        if len(docs) > len(keep):
+            self.dropped[collection] += len(docs) - len(keep)
+            self._unreported_drops[collection] += len(docs) - len(keep)
+
+    async def run_flush_loop(self, db):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush(db)
+            except Exception as e:
+                print(f"Error flushing log sink: {e}")
+
+    def print_throttled(self, key: str, text: str):
+        """
+        In ra stdout tối đa một lần mỗi LOG_PRINT_INTERVAL_SECONDS cho mỗi key (ví dụ lỗi của cùng một model),
+        kèm số lần bị gộp, để sự cố hàng loạt không biến thành bão log.
+        """
+        now = time.monotonic()
+        last, suppressed = self._prints.get(key, (0.0, 0))
+        if now - last < settings.LOG_PRINT_INTERVAL_SECONDS:
+            self._prints[key] = (last, suppressed + 1)
+            return
+        print(f"{text} (+{suppressed} lần tương tự)" if suppressed else text)
+        self._prints[key] = (now, 0)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self._size,
+            "max_buffer": self.max_buffer,
+            "written": dict(self.written),
+            "coalesced": dict(self.coalesced),
+            "dropped": dict(self.dropped),
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_ms, 2)
+        }
+
+log_sink = LogSink(
+    batch_size=settings.LOG_SINK_BATCH_SIZE,
+    flush_ms=settings.LOG_SINK_FLUSH_MS,
+    max_buffer=settings.LOG_SINK_MAX_BUFFER,
+    coalesce_ratio=settings.LOG_SINK_COALESCE_RATIO,
+    retention_days={
+        "ai_usage": settings.AI_USAGE_RETENTION_DAYS,
+        "system_logs": settings.SYSTEM_LOG_RETENTION_DAYS
+    }
+)
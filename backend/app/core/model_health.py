@@ -0,0 +1,138 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from backend.app.core.config import settings
+
+STATE_CLOSED = "closed"        # Hoạt động bình thường
+STATE_OPEN = "open"            # Đang lỗi liên tục, bỏ qua model
+STATE_HALF_OPEN = "half_open"  # Hết thời gian chờ, cho phép một request thăm dò
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1)
+
+class ModelHealth:
+    """
+    Trạng thái sức khỏe của một model: cửa sổ kết quả gần nhất (lỗi/thành công, TTFT) và circuit breaker.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        # (thời điểm, thành công?, ttft_ms)
+        self.samples: Deque[Tuple[float, bool, Optional[float]]] = deque(maxlen=settings.AI_HEALTH_WINDOW)
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_seconds = settings.AI_CIRCUIT_OPEN_SECONDS
+        self.probe_in_flight = False
+        self.last_error: Optional[str] = None
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok, _ in self.samples if not ok) / len(self.samples)
+
+    def ttft_values(self) -> List[float]:
+        return [ttft for _, ok, ttft in self.samples if ok and ttft is not None]
+
+class ModelHealthRegistry:
+    """
+    Theo dõi sức khỏe các model AI để bỏ qua model đang chết thay vì bắt mọi request chờ nó lỗi.
+    - Mở circuit khi lỗi liên tiếp >= AI_CIRCUIT_FAILURES, hoặc tỉ lệ lỗi trong cửa sổ >= AI_CIRCUIT_ERROR_RATE.
+    - Sau AI_CIRCUIT_OPEN_SECONDS chuyển sang half-open: đúng một request được thử (probe).
+      Probe thành công thì đóng circuit, thất bại thì mở lại với thời gian chờ gấp đôi (tối đa 10 phút).
+    """
+    MAX_OPEN_SECONDS = 600
+
+    def __init__(self):
+        self._models: Dict[str, ModelHealth] = {}
+
+    def get(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = ModelHealth(model)
+        return health
+
+    def candidates(self, models: List[str]) -> List[str]:
+        """
+        Thứ tự model nên thử cho một request: model khỏe theo thứ tự ưu tiên, model half-open chỉ
+        được đưa vào nếu request này giành được lượt probe. Nếu mọi circuit đều mở, vẫn trả về model
+        sắp hết thời gian chờ nhất để request không thất bại ngay lập tức.
+        """
+        now = time.monotonic()
+        result = []
+        for model in models:
+            health = self.get(model)
+            if health.state == STATE_OPEN and now - health.opened_at >= health.open_seconds:
+                health.state = STATE_HALF_OPEN
+            if health.state == STATE_CLOSED:
+                result.append(model)
+            elif health.state == STATE_HALF_OPEN and not health.probe_in_flight:
+                health.probe_in_flight = True
+                result.append(model)
+
+        if not result and models:
+            result.append(min(
+                models,
+                key=lambda m: self.get(m).opened_at + self.get(m).open_seconds
+            ))
+        return result
+
+    def record_success(self, model: str, ttft_ms: Optional[float]):
+        health = self.get(model)
+        health.samples.append((time.time(), True, ttft_ms))
+        health.consecutive_failures = 0
+        health.probe_in_flight = False
+        if health.state != STATE_CLOSED:
+            print(f"✅ AI model {model} recovered, circuit closed")
+        health.state = STATE_CLOSED
+        health.open_seconds = settings.AI_CIRCUIT_OPEN_SECONDS
+
+    def record_failure(self, model: str, error: Optional[str] = None):
+        health = self.get(model)
+        health.samples.append((time.time(), False, None))
+        health.consecutive_failures += 1
+        health.last_error = (error or "")[:300]
+        was_probe = health.state == STATE_HALF_OPEN
+        health.probe_in_flight = False
+
+        sustained = (
+            health.consecutive_failures >= settings.AI_CIRCUIT_FAILURES or
+            (len(health.samples) >= settings.AI_CIRCUIT_MIN_SAMPLES and health.error_rate() >= settings.AI_CIRCUIT_ERROR_RATE)
+        )
+        if was_probe:
+            health.open_seconds = min(health.open_seconds * 2, self.MAX_OPEN_SECONDS)
+        if was_probe or (health.state == STATE_CLOSED and sustained):
+            health.state = STATE_OPEN
+            health.opened_at = time.monotonic()
+            print(f"⛔ AI model {model} circuit opened for {health.open_seconds}s: {health.last_error}")
+
+    def release_probe(self, model: str):
+        """
+        Request giữ lượt probe kết thúc mà không có kết quả (ví dụ bị hủy khi hedge thua): trả lại lượt probe.
+        """
+        self.get(model).probe_in_flight = False
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        result = []
+        for model, health in self._models.items():
+            ttfts = health.ttft_values()
+            result.append({
+                "model": model,
+                "state": health.state,
+                "samples": len(health.samples),
+                "error_rate": round(health.error_rate(), 3),
+                "consecutive_failures": health.consecutive_failures,
+                "ttft_p50_ms": percentile(ttfts, 0.5),
+                "ttft_p95_ms": percentile(ttfts, 0.95),
+                "retry_in_seconds": (
+                    round(max(0.0, health.opened_at + health.open_seconds - now), 1)
+                    if health.state == STATE_OPEN else None
+                ),
+                "last_error": health.last_error
+            })
+        return result
+
+model_health = ModelHealthRegistry()
@@ -0,0 +1,150 @@
+import json
+import time
+from typing import Dict, Optional, Tuple
+from backend.app.core.config import settings
+
+# Hạn mức mặc định theo nhóm thao tác: {"user": (token/giây, burst), "ip": (token/giây, burst)}
+# Bucket theo IP rộng hơn bucket theo user vì nhiều người dùng có thể chung một IP (NAT, văn phòng).
+DEFAULT_RULES: Dict[str, Dict[str, Tuple[float, int]]] = {
+    "message":      {"user": (1.0, 8),   "ip": (5.0, 40)},
+    "edit":         {"user": (1.0, 5),   "ip": (5.0, 25)},
+    "reaction":     {"user": (3.0, 10),  "ip": (10.0, 50)},
+    "typing":       {"user": (2.0, 4),   "ip": (10.0, 20)},
+    "read_receipt": {"user": (5.0, 15),  "ip": (20.0, 60)},
+    "report":       {"user": (0.1, 3),   "ip": (0.5, 10)},
+    "search":       {"user": (0.5, 5),   "ip": (2.0, 20)},
+    "admin_stats":  {"user": (0.2, 3),   "ip": (1.0, 10)},
+}
+
+# Các loại frame WebSocket -> nhóm thao tác
+WS_OPERATION_CLASSES = {
+    "send_message": "message",
+    "message": "message",
+    "edit_message": "edit",
+    "edit": "edit",
+    "recall_message": "edit",
+    "recall": "edit",
+    "delete_message": "edit",
+    "delete_for_me": "edit",
+    "pin_message": "edit",
+    "pin": "edit",
+    "reaction": "reaction",
+    "typing": "typing",
+    "read_receipt": "read_receipt",
+    "resume_ai": "read_receipt",
+    "request_ai_suggestion": "message",
+    "cancel_ai": "edit",
+    "report": "report",
+}
+
+# Nhóm thao tác bị loại bỏ im lặng khi vượt hạn mức (không gửi lỗi về client)
+SILENT_CLASSES = {"typing", "read_receipt"}
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: int, now: float):
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, rate: float, capacity: int, now: float) -> float:
+        """
+        Lấy 1 token. Trả về 0 nếu được phép, ngược lại là số giây cần chờ.
+        """
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else 60.0
+
+class RateLimiter:
+    """
+    Bộ giới hạn tốc độ trong bộ nhớ (token bucket) theo user và theo IP, cấu hình theo nhóm thao tác.
+    Mọi kiểm tra đều thuần CPU nên có thể chặn request lạm dụng trước khi chạm tới MongoDB.
+    """
+    def __init__(self, rules: Dict[str, Dict[str, Tuple[float, int]]], idle_ttl: float = 600.0):
+        self.rules = rules
+        self.idle_ttl = idle_ttl
+        self._buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        # (room_id, user_id) -> thời điểm gửi tin gần nhất, dùng cho slow mode
+        self._slow_mode_last: Dict[Tuple[str, str], float] = {}
+        self._last_prune = time.monotonic()
+        self.rejected: Dict[str, int] = {}
+
+    def _take(self, op_class: str, scope: str, key: str, now: float) -> float:
+        rate, capacity = self.rules[op_class][scope]
+        bucket_key = (op_class, scope, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = TokenBucket(capacity, now)
+        return bucket.take(rate, capacity, now)
+
+    def hit(self, op_class: str, user_id: Optional[str] = None, ip: Optional[str] = None) -> float:
+        """
+        Ghi nhận một thao tác. Trả về 0 nếu được phép, ngược lại là số giây client nên chờ.
+        """
+        if not settings.RATE_LIMIT_ENABLED or op_class not in self.rules:
+            return 0.0
+
+        now = time.monotonic()
+        if now - self._last_prune > 60:
+            self._prune(now)
+
+        retry_after = 0.0
+        if user_id:
+            retry_after = self._take(op_class, "user", user_id, now)
+        if not retry_after and ip:
+            retry_after = self._take(op_class, "ip", ip, now)
+
+        if retry_after:
+            self.rejected[op_class] = self.rejected.get(op_class, 0) + 1
+        return retry_after
+
+    def check_slow_mode(self, room_id: str, user_id: str, interval_seconds: float) -> float:
+        """
+        Slow mode cho phòng cộng đồng: mỗi user chỉ được gửi 1 tin trong mỗi khoảng interval_seconds.
+        """
+        if not interval_seconds or interval_seconds <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        key = (room_id, user_id)
+        last = self._slow_mode_last.get(key)
+        if last is not None and now - last < interval_seconds:
+            self.rejected["slow_mode"] = self.rejected.get("slow_mode", 0) + 1
+            return interval_seconds - (now - last)
+        self._slow_mode_last[key] = now
+        return 0.0
+
+    def _prune(self, now: float):
+        # Bucket không hoạt động lâu đã được nạp đầy, xóa đi cũng không đổi hành vi
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b.updated < self.idle_ttl}
+        self._slow_mode_last = {k: t for k, t in self._slow_mode_last.items() if now - t < self.idle_ttl}
+        self._last_prune = now
+
+    def stats(self) -> dict:
+        return {
+            "active_buckets": len(self._buckets),
+            "slow_mode_entries": len(self._slow_mode_last),
+            "rejected": dict(self.rejected)
+        }
+
+def load_rules() -> Dict[str, Dict[str, Tuple[float, int]]]:
+    """
+    Hạn mức mặc định, có thể ghi đè từng nhóm bằng biến môi trường RATE_LIMIT_RULES (JSON), ví dụ:
+    {"message": {"user": [2, 10]}, "search": {"ip": [1, 5]}}
+    """
+    rules = {op: dict(scopes) for op, scopes in DEFAULT_RULES.items()}
+    if settings.RATE_LIMIT_RULES:
+        try:
+            overrides = json.loads(settings.RATE_LIMIT_RULES)
+            for op, scopes in overrides.items():
+                rules.setdefault(op, {"user": (1.0, 5), "ip": (5.0, 25)})
+                for scope, (rate, burst) in scopes.items():
+                    rules[op][scope] = (float(rate), int(burst))
+        except Exception as e:
+            print(f"⚠️ RATE_LIMIT_RULES không hợp lệ, dùng hạn mức mặc định: {e}")
+    return rules
+
+rate_limiter = RateLimiter(load_rules())
@@ -0,0 +1,40 @@
+import time
+from typing import Dict, Optional
+
+class Readiness:
+    """
+    Trạng thái khởi động của worker cho endpoint /ready: worker nhận kết nối ngay, các bước khởi động
+    (migration, dữ liệu mặc định, nạp cache) chạy nền và được đo thời gian từng bước.
+    """
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.ready = False
+        self.ready_after_ms: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+
+    async def phase(self, name: str, coro):
+        start = time.perf_counter()
+        result = await coro
+        self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def fail(self, error: Exception):
+        self.attempts += 1
+        self.last_error = str(error)
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after_ms = round((time.perf_counter() - self._started) * 1000, 1)
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "ready_after_ms": self.ready_after_ms,
+            "phases": dict(self.phases),
+            "failed_attempts": self.attempts,
+            "last_error": self.last_error
+        }
+
+readiness = Readiness()
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from backend.app.core.config import settings
+
+class RuntimeCache:
+    """
+    Cache nóng trong bộ nhớ cho dữ liệu được đọc trên mọi tin nhắn/lượt AI:
+    - Cấu hình hệ thống (system_configs, type "api_keys").
+    - Danh sách id Admin (broadcast_to_admins).
+    - Thông tin phòng (chat_rooms) theo room_id, LRU giới hạn ROOM_CACHE_MAX_ENTRIES; không cache phòng không tồn tại.
+    Ghi trong process hiện tại thì invalidate ngay; worker khác thấy thay đổi sau TTL tương ứng.
+    warm() nạp cả ba song song khi khởi động.
+    """
+    def __init__(self):
+        self._config: Optional[Tuple[dict, float]] = None
+        self._admin_ids: Optional[Tuple[List[str], float]] = None
+        self._rooms: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.warm_ms: Dict[str, float] = {}
+
+    @staticmethod
+    def _fresh(entry, ttl: int) -> bool:
+        return entry is not None and time.monotonic() - entry[1] < ttl
+
+    async def system_config(self, db) -> Optional[dict]:
+        """
+        Document cấu hình hệ thống (None nếu chưa có trong DB). Không sửa dict trả về.
+        """
+        if self._fresh(self._config, settings.CONFIG_CACHE_TTL_SECONDS):
+            self.hits["config"] += 1
+            return self._config[0]
+        self.misses["config"] += 1
+        config = await db["system_configs"].find_one({"type": "api_keys"})
+        self._config = (config, time.monotonic())
+        return config
+
+    async def admin_ids(self, db) -> List[str]:
+        if self._fresh(self._admin_ids, settings.ADMIN_CACHE_TTL_SECONDS):
+            self.hits["admins"] += 1
+            return self._admin_ids[0]
+        self.misses["admins"] += 1
+        admins = await db["users"].find(
+            {"$or": [{"is_superuser": True}, {"role": "admin"}]}, {"id": 1}
+        ).to_list(length=100)
+        ids = [str(a.get("id") or a.get("_id")) for a in admins]
+        self._admin_ids = (ids, time.monotonic())
+        return ids
+
+    async def room(self, db, room_id: str) -> Optional[dict]:
+        """
+        Phòng theo id (hoặc _id dạng chuỗi). Bỏ last_seq vì trường này đổi theo từng tin nhắn.
+        """
+        entry = self._rooms.get(room_id)
+        if self._fresh(entry, settings.ROOM_CACHE_TTL_SECONDS):
+            self._rooms.move_to_end(room_id)
+            self.hits["rooms"] += 1
+            return entry[0]
+        self.misses["rooms"] += 1
+        room = await db["chat_rooms"].find_one({"$or": [{"id": room_id}, {"_id": room_id}]}, {"last_seq": 0})
+        if room is None:
+            self._rooms.pop(room_id, None)
+            return None
+        self._put_room(room_id, room)
+        return room
+
+    def _put_room(self, room_id: str, room: dict):
+        self._rooms[room_id] = (room, time.monotonic())
+        self._rooms.move_to_end(room_id)
+        while len(self._rooms) > settings.ROOM_CACHE_MAX_ENTRIES:
+            self._rooms.popitem(last=False)
+
+    def invalidate_config(self):
+        self._config = None
+
+    def invalidate_admins(self):
+        self._admin_ids = None
+
+    def invalidate_room(self, room_id: str):
+        for key in [k for k, (room, _) in self._rooms.items() if k == room_id or room.get("id") == room_id]:
+            self._rooms.pop(key, None)
+
+    async def warm(self, db):
+        """
+        Nạp song song cấu hình, danh sách Admin và ROOM_CACHE_WARM_COUNT phòng hoạt động gần nhất.
+        """
+        async def timed(name: str, coro):
+            start = time.perf_counter()
+            await coro
+            self.warm_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+
+        async def warm_rooms():
+            rooms = await db["chat_rooms"].find({}, {"last_seq": 0}).sort("updated_at", -1).limit(
+                settings.ROOM_CACHE_WARM_COUNT
+            ).to_list(length=settings.ROOM_CACHE_WARM_COUNT)
+            for room in reversed(rooms):
+                if room.get("id"):
+                    self._put_room(room["id"], room)
+
+        await asyncio.gather(
+            timed("config", self.system_config(db)),
+            timed("admins", self.admin_ids(db)),
+            timed("rooms", warm_rooms())
+        )
+
+    def stats(self) -> dict:
+        return {
+            "config_cached": self._config is not None,
+            "admins_cached": len(self._admin_ids[0]) if self._admin_ids else None,
+            "rooms_cached": len(self._rooms),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "warm_ms": dict(self.warm_ms)
+        }
+
+runtime_cache = RuntimeCache()
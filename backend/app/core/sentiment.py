@@ -0,0 +1,221 @@
+import asyncio
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from backend.app.core.config import settings
+from backend.app.core.content_filter import fold_text
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Từ điển cảm xúc (đã bỏ dấu, cụm nhiều âm tiết được ưu tiên khớp dài nhất), trọng số -3..+3.
+# Tránh các từ mà khi bỏ dấu trùng với từ thông dụng khác nghĩa (chặn/chán, ngủ/ngu, số/sợ...);
+# các cụm trung tính (trả lời, vui lòng, tức là...) có trọng số 0 để "nuốt" âm tiết dễ gây nhầm.
+LEXICON: Dict[str, float] = {
+    # Tiếng Việt - tích cực
+    "tot": 2, "tuyet": 3, "tuyet voi": 3, "tuyet cu": 3, "xuat sac": 3, "hoan hao": 3, "hay qua": 2,
+    "vui": 2, "vui ve": 2, "hai long": 2, "thich": 2, "yeu thich": 2, "cam on": 2, "cam on nhieu": 3,
+    "de thuong": 2, "dep": 2, "nhanh": 1, "tien loi": 2, "huu ich": 2, "de dang": 1, "don gian": 1,
+    "on roi": 1, "on dinh": 1,
+    "hanh phuc": 3, "an tuong": 2, "chuyen nghiep": 2, "nhiet tinh": 2, "chu dao": 2, "thoai mai": 2,
+    "yen tam": 2, "muot": 1, "ung ho": 1, "khong sao": 1, "khong co gi": 1, "ok": 1, "oke": 1, "okela": 2,
+    "cham soc": 1, "loi ich": 1,
+    # Tiếng Việt - tiêu cực
+    "te": -2, "do te": -3, "te hai": -3, "buon": -2, "nham chan": -2, "chan qua": -2, "that vong": -3,
+    "buc minh": -3, "buc": -2, "tuc gian": -3, "gian du": -3, "kho chiu": -2, "cham": -1, "loi": -1, "bi loi": -2,
+    "ghet": -3, "xau": -2, "hong": -1, "bi hong": -2, "mat tien": -2, "lua dao": -3, "vo dung": -3,
+    "phien phuc": -2, "lam phien": -1, "kho": -1, "that bai": -2, "tuc": -2, "khon nan": -3, "chet tiet": -3,
+    "met": -1, "lo lang": -2, "that te": -3, "khong on": -2, "kho khan": -2,
+    # Cụm trung tính
+    "tra loi": 0, "loi moi": 0, "loi nhan": 0, "xin loi": 0, "vui long": 0, "tuc la": 0, "tiep tuc": 0,
+    "lien tuc": 0, "thu tuc": 0, "thoi gian": 0, "khong gian": 0, "trung gian": 0, "thuc te": 0, "kinh te": 0,
+    "quoc te": 0, "y te": 0, "tot nghiep": 0, "yeu cau": 0, "giai thich": 0, "buc anh": 0, "buc tranh": 0,
+    "on ao": -1,
+    # English
+    "good": 2, "great": 3, "awesome": 3, "excellent": 3, "love": 3, "thanks": 2, "thank": 2, "nice": 2,
+    "happy": 2, "perfect": 3, "cool": 1, "helpful": 2, "amazing": 3, "wonderful": 3, "fine": 1,
+    "bad": -2, "terrible": -3, "awful": -3, "hate": -3, "angry": -3, "sad": -2, "slow": -1, "broken": -2,
+    "bug": -1, "error": -1, "worst": -3, "useless": -3, "annoying": -2, "disappointed": -3, "problem": -1,
+    "fail": -2, "failed": -2, "crash": -2, "wrong": -1, "sucks": -3, "stupid": -3,
+    "no problem": 1, "no worries": 1,
+}
+_MAX_PHRASE = max(len(term.split()) for term in LEXICON)
+
+NEGATORS = {
+    "khong", "chang", "chua", "cha", "ko", "k", "kg", "hok",
+    "not", "no", "never", "dont", "cannot", "isnt", "wasnt", "doesnt", "didnt", "cant", "wont", "aint",
+}
+INTENSIFIERS = {"rat", "qua", "lam", "cuc", "sieu", "very", "so", "really", "extremely", "too"}
+# Phạm vi phủ định: số âm tiết phía sau từ phủ định
+NEGATION_WINDOW = 3
+NEGATION_FACTOR = -0.74
+INTENSITY_FACTOR = 1.5
+
+EMOJI = {
+    "😊": 2, "😀": 2, "😁": 2, "😄": 2, "😍": 3, "🥰": 3, "❤": 3, "👍": 2, "🎉": 2, "🙏": 1, "😂": 1,
+    "😡": -3, "😠": -3, "😢": -2, "😭": -2, "👎": -2, "😞": -2, "😤": -2, "💔": -2,
+}
+
+def sentiment_label(score: Optional[float]) -> str:
+    if score is None:
+        return "neutral"
+    if score >= settings.SENTIMENT_LABEL_THRESHOLD:
+        return "positive"
+    if score <= -settings.SENTIMENT_LABEL_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+class SentimentScorer:
+    """
+    Chấm điểm cảm xúc cục bộ theo từ điển (Việt + Anh) có xử lý phủ định và từ nhấn mạnh.
+    Trả về điểm trong [-1, 1] (chuẩn hóa kiểu VADER), đủ nhanh để chạy trên mọi tin nhắn.
+    """
+    def score(self, text: str) -> float:
+        if not text:
+            return 0.0
+        tokens = _NON_WORD.sub(" ", fold_text(text.replace("'", "").replace("’", ""))).split()
+        total = 0.0
+        negate_until = -1
+        boost_next = False
+        last_end = -1
+        last_value = 0.0
+        i = 0
+        while i < len(tokens):
+            # Khớp cụm dài nhất trước ("khong sao", "cam on nhieu" ...)
+            matched = None
+            for n in range(min(_MAX_PHRASE, len(tokens) - i), 0, -1):
+                phrase = " ".join(tokens[i:i + n])
+                if phrase in LEXICON:
+                    matched = (phrase, n)
+                    break
+            if matched:
+                phrase, n = matched
+                value = LEXICON[phrase]
+                if value:
+                    if boost_next:
+                        value *= INTENSITY_FACTOR
+                    if i <= negate_until:
+                        value *= NEGATION_FACTOR
+                    total += value
+                    last_end, last_value = i + n, value
+                boost_next = False
+                i += n
+                continue
+
+            token = tokens[i]
+            if token in NEGATORS:
+                negate_until = i + NEGATION_WINDOW
+            elif token in INTENSIFIERS:
+                if last_end == i:
+                    # Nhấn mạnh đặt sau từ cảm xúc ("tốt quá", "chậm lắm")
+                    total += last_value * (INTENSITY_FACTOR - 1)
+                    last_end = -1
+                else:
+                    boost_next = True
+            i += 1
+
+        for char, value in EMOJI.items():
+            if char in text:
+                total += value * text.count(char)
+        return round(total / math.sqrt(total * total + 15), 3) if total else 0.0
+
+class SentimentRollups:
+    """
+    Tổng hợp cảm xúc theo giờ cho từng phòng ("room") và từng hội thoại hỗ trợ ("support", khóa là user_id).
+    Điểm được cộng dồn trong bộ nhớ và ghi theo lô ($inc, an toàn khi nhiều worker) mỗi SENTIMENT_FLUSH_SECONDS;
+    bucket cũ tự xóa bằng TTL index.
+    """
+    def __init__(self):
+        # (scope, key, hour) -> [count, sum, negative, positive]
+        self._pending: Dict[Tuple[str, str, datetime], List[float]] = {}
+
+    def record(self, scope: str, key: str, score: float):
+        hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        acc = self._pending.setdefault((scope, key, hour), [0, 0.0, 0, 0])
+        acc[0] += 1
+        acc[1] += score
+        label = sentiment_label(score)
+        if label == "negative":
+            acc[2] += 1
+        elif label == "positive":
+            acc[3] += 1
+
+    async def flush(self, db) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        retention = timedelta(days=settings.SENTIMENT_RETENTION_DAYS)
+        ops = [
+            UpdateOne(
+                {"_id": f"{scope}:{key}:{hour.strftime('%Y%m%d%H')}"},
+                {
+                    "$inc": {"count": acc[0], "sum": acc[1], "negative": acc[2], "positive": acc[3]},
+                    "$setOnInsert": {"scope": scope, "key": key, "hour": hour, "expires_at": hour + retention}
+                },
+                upsert=True
+            )
+            for (scope, key, hour), acc in pending.items()
+        ]
+        try:
+            await db["sentiment_rollups"].bulk_write(ops, ordered=False)
+        except Exception:
+            # Giữ lại số liệu chưa ghi để lần sau thử lại
+            for bucket, acc in pending.items():
+                merged = self._pending.setdefault(bucket, [0, 0.0, 0, 0])
+                for idx, value in enumerate(acc):
+                    merged[idx] += value
+            raise
+        return len(ops)
+
+    async def run_flush_loop(self, db):
+        while True:
+            await asyncio.sleep(settings.SENTIMENT_FLUSH_SECONDS)
+            try:
+                await self.flush(db)
+            except Exception as e:
+                print(f"Error flushing sentiment rollups: {e}")
+
+    async def summary(self, db, scope: str, hours: int = 24, limit: int = 10, min_count: int = 3) -> List[dict]:
+        """
+        Cảm xúc trung bình trong `hours` giờ gần nhất theo từng khóa, tiêu cực nhất trước.
+        """
+        since = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        rows = await db["sentiment_rollups"].aggregate([
+            {"$match": {"scope": scope, "hour": {"$gte": since}}},
+            {"$group": {
+                "_id": "$key",
+                "count": {"$sum": "$count"},
+                "sum": {"$sum": "$sum"},
+                "negative": {"$sum": "$negative"},
+                "positive": {"$sum": "$positive"}
+            }},
+            {"$match": {"count": {"$gte": min_count}}}
+        ]).to_list(length=None)
+        result = [
+            {
+                "key": row["_id"],
+                "count": row["count"],
+                "average": round(row["sum"] / row["count"], 3),
+                "negative_share": round(row["negative"] / row["count"], 3),
+                "positive_share": round(row["positive"] / row["count"], 3)
+            }
+            for row in rows
+        ]
+        result.sort(key=lambda r: r["average"])
+        return result[:limit]
+
+    async def overview(self, db, hours: int = 24) -> dict:
+        rows = await self.summary(db, "room", hours=hours, limit=10 ** 6, min_count=1)
+        count = sum(r["count"] for r in rows)
+        if not count:
+            return {"messages": 0, "average": None, "negative_share": None, "positive_share": None}
+        return {
+            "messages": count,
+            "average": round(sum(r["average"] * r["count"] for r in rows) / count, 3),
+            "negative_share": round(sum(r["negative_share"] * r["count"] for r in rows) / count, 3),
+            "positive_share": round(sum(r["positive_share"] * r["count"] for r in rows) / count, 3)
+        }
+
+sentiment_scorer = SentimentScorer()
+sentiment_rollups = SentimentRollups()
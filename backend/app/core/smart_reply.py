@@ -0,0 +1,239 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.content_filter import content_filter, fold_text
+from backend.app.core.model_health import percentile
+
+_NON_WORD = re.compile(r"[^\w]+")
+_PRIVATE = re.compile(r"\d|@|https?:|www\.|\.com|\.vn")
+
+# Chỉ xét phần cuối tin nhắn (nơi thường chứa câu hỏi/ý chính)
+MAX_FEATURE_WORDS = 12
+# Số câu trả lời giữ lại cho mỗi đặc trưng (giới hạn chi phí dự đoán)
+REPLIES_PER_FEATURE = 8
+# Làm trơn: đặc trưng xuất hiện ít lần không được tin tưởng tuyệt đối
+_SMOOTHING = 2.0
+
+# Gợi ý mặc định khi chưa có mô hình (cài đặt mới, lịch sử còn ít)
+DEFAULT_QUESTION_REPLIES = ["Có", "Không", "Để mình xem nhé"]
+DEFAULT_REPLIES = ["Ok 👍", "Cảm ơn bạn!", "Để mình xem nhé"]
+
+def message_features(text: str) -> List[str]:
+    """
+    Đặc trưng của tin nhắn đến: các âm tiết (đã bỏ dấu) + cặp âm tiết liền kề, và dấu hiệu câu hỏi.
+    """
+    words = _NON_WORD.sub(" ", fold_text(text or "")).split()[-MAX_FEATURE_WORDS:]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if (text or "").rstrip().endswith("?"):
+        features.append("<?>")
+    return features
+
+def reply_key(text: str) -> str:
+    """
+    Khóa gộp các cách viết của cùng một câu trả lời ("Ok", "ok!", "OK").
+    Câu trả lời chỉ có emoji giữ nguyên.
+    """
+    key = " ".join(_NON_WORD.sub(" ", fold_text(text)).split())
+    return key or text.strip()
+
+def is_reply_candidate(text: str) -> bool:
+    """
+    Chỉ các câu trả lời ngắn, chung chung mới được học: không số, không liên kết/email/@mention.
+    """
+    text = (text or "").strip()
+    if not text or "\n" in text or len(text) > settings.SMART_REPLY_MAX_CHARS:
+        return False
+    if len(text.split()) > 6:
+        return False
+    return not _PRIVATE.search(text.lower())
+
+class SmartReplyModel:
+    """
+    Mô hình gợi ý trả lời nhanh: với mỗi đặc trưng của tin nhắn đến, các câu trả lời hay gặp nhất kèm trọng số.
+    Chỉ chứa văn bản câu trả lời đã ẩn danh (không lưu user, phòng hay nội dung tin nhắn gốc).
+    """
+    def __init__(self, replies: List[str], table: Dict[str, List[Tuple[int, float]]], prior: List[int], pairs: int):
+        self.replies = replies
+        self.table = table
+        self.prior = prior
+        self.pairs = pairs
+        self.blocked: set = set()
+
+    def suggest(self, text: str, k: int = 3) -> List[str]:
+        scores: Dict[int, float] = {}
+        for feature in set(message_features(text)):
+            for i, weight in self.table.get(feature, ()):
+                scores[i] = scores.get(i, 0.0) + weight
+        echo = reply_key(text or "")
+        result = []
+        for i in sorted(scores, key=scores.get, reverse=True) + self.prior:
+            if i in self.blocked or i in result or reply_key(self.replies[i]) == echo:
+                continue
+            result.append(i)
+            if len(result) == k:
+                break
+        return [self.replies[i] for i in result]
+
+def train_smart_reply_model(pairs: List[Tuple[str, str, str]], min_users: int) -> SmartReplyModel:
+    """
+    Huấn luyện từ các cặp (tin nhắn đến, câu trả lời, người trả lời).
+    Một câu trả lời chỉ được học khi có ít nhất min_users người khác nhau từng dùng (k-ẩn danh);
+    người trả lời chỉ dùng để đếm và không nằm trong mô hình.
+    Hàm thuần (không truy cập DB) để chạy được trong process riêng.
+    """
+    users = defaultdict(set)
+    surfaces = defaultdict(Counter)
+    for _, reply, sender_id in pairs:
+        key = reply_key(reply)
+        users[key].add(sender_id)
+        surfaces[key][reply.strip()] += 1
+
+    keys = sorted(k for k, senders in users.items() if len(senders) >= min_users)
+    index = {k: i for i, k in enumerate(keys)}
+    feature_counts: Dict[str, Counter] = defaultdict(Counter)
+    reply_counts: Counter = Counter()
+    for incoming, reply, _ in pairs:
+        i = index.get(reply_key(reply))
+        if i is None:
+            continue
+        reply_counts[i] += 1
+        for feature in set(message_features(incoming)):
+            feature_counts[feature][i] += 1
+
+    total_pairs = sum(reply_counts.values())
+    table = {}
+    for feature, counter in feature_counts.items():
+        seen = sum(counter.values())
+        if seen < 2:
+            continue
+        idf = math.log(1 + total_pairs / seen)
+        table[feature] = [
+            (i, round(count / (seen + _SMOOTHING) * idf, 4))
+            for i, count in counter.most_common(REPLIES_PER_FEATURE)
+        ]
+    return SmartReplyModel(
+        [surfaces[k].most_common(1)[0][0] for k in keys],
+        table,
+        [i for i, _ in reply_counts.most_common(10)],
+        total_pairs
+    )
+
+class SmartReplyEngine:
+    """
+    Gợi ý trả lời nhanh cục bộ cho MessageRead.suggestions: không gọi model AI bên ngoài.
+    Mô hình được huấn luyện định kỳ từ lịch sử phòng cộng đồng/nhóm (không dùng chat 1-1, AI, Help)
+    trong một process riêng để không chiếm event loop, rồi hoán đổi nguyên tử.
+    """
+    def __init__(self):
+        self.model: Optional[SmartReplyModel] = None
+        self.version = 0
+        self.trained_at: Optional[float] = None
+        self.train_ms = 0.0
+        self.served = 0
+        self._latency_us = deque(maxlen=1000)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def suggest(self, text: str, k: int = 3) -> List[str]:
+        if not settings.SMART_REPLY_ENABLED or not text or not text.strip():
+            return []
+        start = time.perf_counter()
+        if self.model and self.model.replies:
+            result = self.model.suggest(text, k)
+        else:
+            result = (DEFAULT_QUESTION_REPLIES if text.rstrip().endswith("?") else DEFAULT_REPLIES)[:k]
+        self._latency_us.append((time.perf_counter() - start) * 1_000_000)
+        self.served += 1
+        return result
+
+    async def load_pairs(self, db, exclude_rooms: List[str]) -> List[Tuple[str, str, str]]:
+        """
+        Cặp (tin nhắn, tin trả lời kế tiếp của người khác trong cùng phòng trong SMART_REPLY_MAX_GAP_SECONDS).
+        """
+        since = datetime.now(timezone.utc) - timedelta(days=settings.SMART_REPLY_HISTORY_DAYS)
+        cursor = db["messages"].find(
+            {
+                "room_id": {"$nin": exclude_rooms, "$not": re.compile(r"^direct_")},
+                "timestamp": {"$gte": since},
+                "is_bot": {"$ne": True},
+                "is_recalled": {"$ne": True},
+                "content": {"$type": "string"}
+            },
+            {"_id": 0, "room_id": 1, "sender_id": 1, "content": 1, "timestamp": 1}
+        ).sort([("room_id", 1), ("timestamp", 1)]).limit(settings.SMART_REPLY_MAX_MESSAGES)
+
+        pairs = []
+        previous = None
+        max_gap = settings.SMART_REPLY_MAX_GAP_SECONDS
+        async for msg in cursor:
+            if (
+                previous
+                and previous["room_id"] == msg["room_id"]
+                and previous.get("sender_id") != msg.get("sender_id")
+                and is_reply_candidate(msg["content"])
+                and isinstance(msg.get("timestamp"), datetime) and isinstance(previous.get("timestamp"), datetime)
+                and (msg["timestamp"] - previous["timestamp"]).total_seconds() <= max_gap
+            ):
+                pairs.append((previous["content"], msg["content"], msg.get("sender_id")))
+            previous = msg
+        return pairs
+
+    async def _train(self, pairs: List[Tuple[str, str, str]]) -> SmartReplyModel:
+        min_users = settings.SMART_REPLY_MIN_USERS
+        if settings.SMART_REPLY_TRAIN_IN_PROCESS:
+            try:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=1)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, train_smart_reply_model, pairs, min_users)
+            except Exception as e:
+                # Môi trường không cho tạo process (hoặc worker bị hỏng): huấn luyện trong thread
+                print(f"⚠️ Smart reply process training unavailable, using a thread: {e}")
+                self._executor = None
+        return await asyncio.to_thread(train_smart_reply_model, pairs, min_users)
+
+    async def refresh(self, db, exclude_rooms: List[str]) -> int:
+        pairs = await self.load_pairs(db, exclude_rooms)
+        start = time.perf_counter()
+        model = await self._train(pairs)
+        self.train_ms = (time.perf_counter() - start) * 1000
+        # Không bao giờ gợi ý câu chứa từ trong bộ lọc nội dung
+        model.blocked = {i for i, reply in enumerate(model.replies) if content_filter.check(reply).action}
+        self.model = model
+        self.version += 1
+        self.trained_at = time.time()
+        return len(model.replies)
+
+    async def run_refresh_loop(self, db, exclude_rooms: List[str]):
+        """
+        Job định kỳ huấn luyện lại mô hình (lần đầu ngay khi khởi động).
+        """
+        while True:
+            try:
+                count = await self.refresh(db, exclude_rooms)
+                print(f"💬 Smart replies trained: {count} replies from {self.model.pairs} pairs in {round(self.train_ms, 1)}ms")
+            except Exception as e:
+                print(f"Error training smart replies: {e}")
+            await asyncio.sleep(settings.SMART_REPLY_REFRESH_MINUTES * 60)
+
+    def stats(self) -> dict:
+        latencies = list(self._latency_us)
+        return {
+            "enabled": settings.SMART_REPLY_ENABLED,
+            "version": self.version,
+            "replies": len(self.model.replies) if self.model else 0,
+            "features": len(self.model.table) if self.model else 0,
+            "pairs": self.model.pairs if self.model else 0,
+            "trained_at": self.trained_at,
+            "train_ms": round(self.train_ms, 1),
+            "served": self.served,
+            "suggest_p50_us": percentile(latencies, 0.5),
+            "suggest_p95_us": percentile(latencies, 0.95)
+        }
+
+smart_replies = SmartReplyEngine()
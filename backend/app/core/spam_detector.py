@@ -0,0 +1,222 @@
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.content_filter import fold_text
+
+MASK64 = (1 << 64) - 1
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """
+    Đặc trưng cho SimHash: n-gram ký tự trên văn bản đã chuẩn hóa (bỏ dấu, chữ thường, bỏ dấu câu),
+    bền vững với các biến thể nhỏ như thêm emoji, đổi dấu câu, viết hoa.
+    """
+    normalized = _NON_WORD.sub(" ", fold_text(text)).strip()
+    if len(normalized) <= size:
+        return [normalized] if normalized else []
+    return [normalized[i:i + size] for i in range(len(normalized) - size + 1)]
+
+# BIT_TABLES[k]: byte -> bit thứ k của byte đó (0/1), dùng với bytes.translate để đếm bit theo cột
+_BIT_TABLES = [bytes((value >> k) & 1 for value in range(256)) for k in range(8)]
+
+def simhash(features: List[str]) -> int:
+    """
+    SimHash 64 bit. Hash của các đặc trưng được đóng gói thành bytes, mỗi cột bit được đếm bằng
+    slicing + bytes.translate + count (chạy trong C) thay vì lặp 64 lần cho từng đặc trưng trong Python.
+    Giá trị hash chỉ ổn định trong một process - đủ cho bộ phát hiện hoàn toàn trong bộ nhớ.
+    """
+    if not features:
+        return 0
+    packed = b"".join([(hash(f) & MASK64).to_bytes(8, "little") for f in features])
+    n = len(features)
+    fingerprint = 0
+    for pos in range(8):
+        column = packed[pos::8]
+        for k in range(8):
+            # Bit = 1 nếu đa số đặc trưng có bit đó bằng 1
+            if column.translate(_BIT_TABLES[k]).count(1) * 2 > n:
+                fingerprint |= 1 << (pos * 8 + k)
+    return fingerprint
+
+class _Entry(NamedTuple):
+    ts: float
+    fingerprint: int
+    user_id: str
+    room_id: str
+
+class SpamVerdict(NamedTuple):
+    action: Optional[str]  # None | "throttle" | "report"
+    user_duplicates: int
+    room_duplicates: int
+    distinct_senders: int
+    # "user": chính người gửi lặp lại; "room": nội dung đang bị nhiều tài khoản gửi hàng loạt trong phòng
+    scope: Optional[str] = None
+    # Các tài khoản tạo nên cụm gần trùng lặp (nhiều tin nhất trước), không gồm người gửi hiện tại nếu họ chưa góp tin nào
+    cluster_senders: Tuple[str, ...] = ()
+    # Fingerprint để record() khi tin được chấp nhận (None nếu tin quá ngắn, không kiểm tra)
+    fingerprint: Optional[int] = None
+
+class SpamDetector:
+    """
+    Phát hiện tin nhắn gần trùng lặp (spam) bằng SimHash trên cửa sổ thời gian trượt.
+    Tra cứu theo bảng băm chia dải (banding): 64 bit chia 4 dải x 16 bit, hai fingerprint lệch
+    <= 3 bit chắc chắn trùng ít nhất một dải, nên chỉ cần so sánh với các ứng viên chung dải
+    thay vì so từng cặp với toàn bộ cửa sổ.
+    check() chỉ đánh giá; fingerprint được đưa vào cửa sổ bằng record() sau khi tin đã qua mọi bước kiểm tra,
+    nên tin bị từ chối ở bước khác (slow mode, bị chặn...) không bị tính là spam. Tin bị chính bộ phát hiện chặn
+    được đếm riêng (strike) theo user để vẫn leo thang thành báo cáo khi user cố gửi tiếp.
+    """
+    def __init__(
+        self,
+        window_seconds: float,
+        max_distance: int,
+        user_burst: int,
+        room_burst: int,
+        min_chars: int,
+        report_cooldown: float = 600.0
+    ):
+        self.window = window_seconds
+        self.max_distance = max_distance
+        self.user_burst = user_burst
+        self.room_burst = room_burst
+        self.min_chars = min_chars
+        self.report_cooldown = report_cooldown
+        # (band, giá trị dải) -> các entry theo thứ tự thời gian
+        self._tables: Dict[Tuple[int, int], Deque[_Entry]] = {}
+        self._timeline: Deque[_Entry] = deque()
+        # Khóa báo cáo (user/room) -> thời điểm báo cáo gần nhất, tránh tạo báo cáo trùng lặp
+        self._reported: Dict[str, float] = {}
+        # user_id -> thời điểm các lần bị chặn vì lặp lại trong cửa sổ
+        self._strikes: Dict[str, Deque[float]] = {}
+        self.checked = 0
+        self.throttled = 0
+        self.reported = 0
+
+    @staticmethod
+    def _bands(fingerprint: int):
+        for band in range(BANDS):
+            yield band, (fingerprint >> (band * BAND_BITS)) & BAND_MASK
+
+    def _evict(self, now: float):
+        cutoff = now - self.window
+        while self._timeline and self._timeline[0].ts < cutoff:
+            entry = self._timeline.popleft()
+            for key in self._bands(entry.fingerprint):
+                bucket = self._tables.get(key)
+                if bucket is None:
+                    continue
+                while bucket and bucket[0].ts < cutoff:
+                    bucket.popleft()
+                if not bucket:
+                    del self._tables[key]
+        for user_id in [u for u, strikes in self._strikes.items() if strikes[-1] < cutoff]:
+            del self._strikes[user_id]
+
+    def _strike_count(self, user_id: str, now: float) -> int:
+        strikes = self._strikes.get(user_id)
+        if not strikes:
+            return 0
+        cutoff = now - self.window
+        while strikes and strikes[0] < cutoff:
+            strikes.popleft()
+        return len(strikes)
+
+    def check(self, user_id: str, room_id: str, content: str) -> SpamVerdict:
+        """
+        Đánh giá tin nhắn so với cửa sổ (không ghi nhận, xem record()) và trả về quyết định xử lý.
+        """
+        if not content or len(content) < self.min_chars:
+            return SpamVerdict(None, 0, 0, 0)
+
+        now = time.monotonic()
+        self._evict(now)
+        self.checked += 1
+
+        fingerprint = simhash(shingles(content))
+        seen = set()
+        user_dups = 0
+        room_dups = 0
+        cluster: Dict[str, int] = {}
+        for key in self._bands(fingerprint):
+            for entry in self._tables.get(key, ()):
+                if id(entry) in seen:
+                    continue
+                seen.add(id(entry))
+                if bin(entry.fingerprint ^ fingerprint).count("1") > self.max_distance:
+                    continue
+                if entry.user_id == user_id:
+                    user_dups += 1
+                if entry.room_id == room_id:
+                    room_dups += 1
+                    cluster[entry.user_id] = cluster.get(entry.user_id, 0) + 1
+        senders = set(cluster) | {user_id}
+        strikes = self._strike_count(user_id, now)
+
+        action = None
+        scope = None
+        report_key = None
+        if room_dups + 1 >= self.room_burst and len(senders) > 1:
+            # Nhiều tài khoản cùng gửi một nội dung: spam có tổ chức. Chỉ chặn nội dung này trong phòng,
+            # báo cáo quy cho các tài khoản đã tạo nên cụm (người gửi cuối có thể chỉ tình cờ trùng nội dung)
+            action = "report"
+            scope = "room"
+            report_key = f"room:{room_id}:{fingerprint >> (64 - BAND_BITS)}"
+        elif user_dups + strikes + 1 >= self.user_burst * 2:
+            action = "report"
+            scope = "user"
+            report_key = f"user:{user_id}"
+        elif user_dups + 1 >= self.user_burst:
+            action = "throttle"
+            scope = "user"
+
+        if action == "report":
+            last = self._reported.get(report_key)
+            if last is not None and now - last < self.report_cooldown:
+                # Đã báo cáo cụm này gần đây, chỉ cần chặn
+                action = "throttle"
+            else:
+                self._reported[report_key] = now
+                self._reported = {k: t for k, t in self._reported.items() if now - t < self.report_cooldown}
+                self.reported += 1
+        if action:
+            self.throttled += 1
+            if scope == "user":
+                self._strikes.setdefault(user_id, deque()).append(now)
+
+        cluster_senders = tuple(sorted(cluster, key=lambda u: -cluster[u]))
+        return SpamVerdict(action, user_dups, room_dups, len(senders), scope, cluster_senders, fingerprint)
+
+    def record(self, user_id: str, room_id: str, verdict: SpamVerdict):
+        """
+        Đưa fingerprint của tin đã được chấp nhận vào cửa sổ.
+        """
+        if verdict.fingerprint is None or verdict.action:
+            return
+        entry = _Entry(time.monotonic(), verdict.fingerprint, user_id, room_id)
+        self._timeline.append(entry)
+        for key in self._bands(verdict.fingerprint):
+            self._tables.setdefault(key, deque()).append(entry)
+
+    def stats(self) -> dict:
+        return {
+            "window_entries": len(self._timeline),
+            "users_with_strikes": len(self._strikes),
+            "buckets": len(self._tables),
+            "checked": self.checked,
+            "throttled": self.throttled,
+            "reported": self.reported
+        }
+
+spam_detector = SpamDetector(
+    window_seconds=settings.SPAM_WINDOW_SECONDS,
+    max_distance=settings.SPAM_MAX_HAMMING_DISTANCE,
+    user_burst=settings.SPAM_USER_BURST,
+    room_burst=settings.SPAM_ROOM_BURST,
+    min_chars=settings.SPAM_MIN_CHARS
+)
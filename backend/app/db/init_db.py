@@ -1,15 +1,17 @@
 import asyncio
 from datetime import datetime, timezone
 from backend.app.db.session import db
+from backend.app.db.migrations import schema_migrations
 
 async def init_db():
-    # Create indexes
-    await db["users"].create_index("id", unique=True)
-    await db["users"].create_index("username", unique=True)
-    await db["chat_rooms"].create_index("id", unique=True)
-    await db["room_members"].create_index([("room_id", 1), ("user_id", 1)], unique=True)
-    await db["messages"].create_index([("room_id", 1), ("timestamp", 1)])
+    # Index theo phiên bản (bỏ qua khi đã áp dụng), xem db/migrations.py
+    await schema_migrations.run(db)
+    # Dữ liệu mặc định: các bước độc lập nên chạy song song
+    # View support_threads: dựng lại từ lịch sử phòng help nếu chưa từng được duy trì
+    from backend.app.api.v1.endpoints.ws.support_threads import ensure_support_threads
+    await asyncio.gather(seed_default_rooms(), seed_default_faq(), ensure_support_threads())
 
+async def seed_default_rooms():
     # Check if rooms exist
     rooms_count = await db["chat_rooms"].count_documents({})
     
@@ -25,5 +27,17 @@ async def init_db():
     else:
         print("Rooms already exist.")
 
+async def seed_default_faq():
+    # Cơ sở tri thức FAQ của phòng Help: khởi tạo từ FAQ mặc định nếu chưa có
+    if await db["faq_entries"].count_documents({}) == 0:
+        import uuid
+        from backend.app.api.v1.endpoints.ws.constants import DEFAULT_FAQ_ENTRIES
+        now = datetime.now(timezone.utc)
+        await db["faq_entries"].insert_many([
+            {"id": str(uuid.uuid4()), **entry, "enabled": True, "created_at": now, "updated_at": now}
+            for entry in DEFAULT_FAQ_ENTRIES
+        ])
+        print("Default FAQ entries created.")
+
 if __name__ == "__main__":
     asyncio.run(init_db())
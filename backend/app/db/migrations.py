@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo.errors import OperationFailure
+
+# Index theo từng phiên bản schema. Thêm index mới: thêm phiên bản mới vào cuối, KHÔNG sửa phiên bản đã phát hành
+# (worker đã ghi dấu phiên bản đó sẽ bỏ qua). Mỗi mục: (collection, keys, options).
+SCHEMA_VERSIONS = [
+    (1, "core_indexes", [
+        ("users", "id", {"unique": True}),
+        ("users", "username", {"unique": True}),
+        ("chat_rooms", "id", {"unique": True}),
+        ("room_members", [("room_id", 1), ("user_id", 1)], {"unique": True}),
+        ("messages", [("room_id", 1), ("timestamp", 1)], {}),
+        ("messages", "id", {}),
+        ("messages", [("room_id", 1), ("seq", 1)], {}),
+        ("messages", [("room_id", 1), ("sender_id", 1), ("timestamp", -1)], {}),
+        ("messages", [("room_id", 1), ("receiver_id", 1), ("timestamp", -1)], {}),
+    ]),
+    # Phân vùng hội thoại riêng AI/Help (chỉ các tin có conversation_id)
+    (2, "conversation_partitions", [
+        ("messages", [("conversation_id", 1), ("timestamp", 1)], {"sparse": True}),
+        ("messages", [("conversation_id", 1), ("seq", 1)], {"sparse": True}),
+    ]),
+    (3, "moderation_quota_support_faq", [
+        ("moderation_lexicon", "folded", {"unique": True}),
+        ("ai_quota_counters", "expires_at", {"expireAfterSeconds": 0}),
+        ("support_threads", "user_id", {}),
+        ("support_threads", [("pending", 1), ("last_activity_at", 1)], {}),
+        ("support_threads", "last_activity_at", {}),
+        ("faq_entries", "id", {"unique": True}),
+    ]),
+    (4, "rollups_telemetry", [
+        ("sentiment_rollups", [("scope", 1), ("hour", 1)], {}),
+        ("sentiment_rollups", "expires_at", {"expireAfterSeconds": 0}),
+        ("ai_telemetry", "minute", {}),
+        ("ai_telemetry", "expires_at", {"expireAfterSeconds": 0}),
+    ]),
+    # Log ghi theo lô (core/log_sink.py): truy vấn thống kê theo trạng thái/loại + thời gian, TTL trên expires_at
+    (5, "log_sink", [
+        ("ai_usage", [("status", 1), ("timestamp", -1)], {}),
+        ("ai_usage", "expires_at", {"expireAfterSeconds": 0}),
+        ("system_logs", [("type", 1), ("timestamp", -1)], {}),
+        ("system_logs", "expires_at", {"expireAfterSeconds": 0}),
+    ]),
+    # Watermark cao nhất của phòng đông thành viên (ws/receipts.py get_read_watermarks)
+    (6, "read_watermarks", [
+        ("room_members", [("room_id", 1), ("last_read_seq", -1)], {}),
+    ]),
+    # Mỗi user đúng một support thread: upsert đồng thời không thể tạo thread trùng (xem PREPARE_STEPS)
+    (7, "support_threads_unique_user", [
+        ("support_threads", "user_id", {"unique": True}),
+    ]),
+]
+
+def _activity_key(thread: dict):
+    activity = thread.get("last_activity_at")
+    return (isinstance(activity, datetime), activity if isinstance(activity, datetime) else None)
+
+async def _dedupe_support_threads(db):
+    """
+    Gộp các support thread trùng user_id (do upsert đồng thời trước khi có index unique): giữ document có
+    hoạt động gần nhất, bổ sung trường nó còn thiếu từ các bản kia, cộng dồn unread_count, xóa các bản thừa.
+    Sau đó bỏ index user_id không unique của v3 để tạo lại dạng unique cùng tên.
+    """
+    groups = await db["support_threads"].aggregate([
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]).to_list(length=None)
+    for group in groups:
+        docs = await db["support_threads"].find({"_id": {"$in": group["ids"]}}).to_list(length=None)
+        docs.sort(key=_activity_key, reverse=True)
+        keep, extras = docs[0], docs[1:]
+        merged = {}
+        for doc in extras:
+            for field, value in doc.items():
+                if field != "_id" and field not in keep and field not in merged:
+                    merged[field] = value
+        merged["unread_count"] = sum(doc.get("unread_count", 0) for doc in docs)
+        await db["support_threads"].update_one({"_id": keep["_id"]}, {"$set": merged})
+        await db["support_threads"].delete_many({"_id": {"$in": [doc["_id"] for doc in extras]}})
+    if groups:
+        print(f"🔧 Merged duplicate support threads for {len(groups)} users")
+    try:
+        await db["support_threads"].drop_index("user_id_1")
+    except OperationFailure:
+        # Chưa có index (DB mới) hoặc worker khác đã bỏ
+        pass
+
+# Bước chuẩn bị dữ liệu chạy trước khi tạo index của một phiên bản (ví dụ dọn dữ liệu trùng trước index unique)
+PREPARE_STEPS: Dict[int, Callable[..., Awaitable[None]]] = {
+    7: _dedupe_support_threads,
+}
+
+def _marker(version: int) -> dict:
+    return {"type": "migration", "name": f"schema_v{version}"}
+
+class SchemaMigrations:
+    """
+    Tạo index theo phiên bản thay vì gọi create_index tuần tự ở mỗi lần khởi động.
+    Phiên bản đã áp dụng được ghi dấu trong system_configs (cùng kiểu dấu với ws/partitions.py), nên khi
+    schema đã mới nhất thì chỉ tốn một truy vấn. Index trong một phiên bản được tạo song song;
+    create_index là idempotent nên nhiều worker cùng chạy vẫn an toàn (bước chuẩn bị trong PREPARE_STEPS cũng vậy).
+    """
+    def __init__(self):
+        self.applied: List[int] = []
+        self.ran: List[int] = []
+        self.duration_ms: Optional[float] = None
+
+    @property
+    def latest(self) -> int:
+        return SCHEMA_VERSIONS[-1][0]
+
+    async def run(self, db) -> List[int]:
+        start = time.perf_counter()
+        done = await db["system_configs"].find(
+            {"type": "migration", "name": {"$in": [_marker(v)["name"] for v, _, _ in SCHEMA_VERSIONS]}, "done": True},
+            {"name": 1}
+        ).to_list(length=None)
+        done_names = {d["name"] for d in done}
+        self.applied = [v for v, _, _ in SCHEMA_VERSIONS if _marker(v)["name"] in done_names]
+
+        self.ran = []
+        for version, name, indexes in SCHEMA_VERSIONS:
+            if version in self.applied:
+                continue
+            prepare = PREPARE_STEPS.get(version)
+            if prepare:
+                await prepare(db)
+            await asyncio.gather(*[
+                db[collection].create_index(keys, **options) for collection, keys, options in indexes
+            ])
+            await db["system_configs"].update_one(
+                _marker(version),
+                {"$set": {"done": True, "description": name, "completed_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            self.applied.append(version)
+            self.ran.append(version)
+            print(f"🔧 Applied schema migration v{version} ({name}, {len(indexes)} indexes)")
+        self.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        return self.ran
+
+    def stats(self) -> dict:
+        return {
+            "latest": self.latest,
+            "applied": sorted(self.applied),
+            "ran_this_start": self.ran,
+            "duration_ms": self.duration_ms
+        }
+
+schema_migrations = SchemaMigrations()
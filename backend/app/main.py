@@ -2,9 +2,24 @@ from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
+import asyncio
 from backend.app.core.config import settings
 from backend.app.api.v1 import api_router
 from backend.app.db.init_db import init_db
+from backend.app.api.v1.endpoints.ws.receipts import run_unread_repair_loop
+from backend.app.api.v1.endpoints.ws.partitions import partitions
+from backend.app.core.content_filter import content_filter
+from backend.app.core.faq_kb import faq_kb
+from backend.app.core.smart_reply import smart_replies
+from backend.app.core.sentiment import sentiment_rollups
+from backend.app.core.ai_telemetry import ai_telemetry
+from backend.app.core.log_sink import log_sink
+from backend.app.core.runtime_cache import runtime_cache
+from backend.app.core.readiness import readiness
+from backend.app.core.ai_clients import ai_client_pool
+from backend.app.db.migrations import schema_migrations
+from backend.app.api.v1.endpoints.ws.constants import SELF_ISOLATED_ROOMS
+from backend.app.db.session import db
 
 app = FastAPI(
     title="LinkUp API",
@@ -19,9 +34,63 @@ app = FastAPI(
     redoc_url="/redoc",
 )
 
+async def warm_up():
+    """
+    Các bước khởi động cần MongoDB, chạy nền để worker nhận kết nối ngay; /ready báo sẵn sàng khi xong.
+    MongoDB chưa sẵn sàng thì thử lại với thời gian chờ tăng dần.
+    Bộ lọc nội dung và chỉ mục FAQ được dựng sau init_db (dữ liệu mặc định đã được tạo) và trước khi sẵn sàng.
+    """
+    delay = 1
+    while True:
+        try:
+            await readiness.phase("init_db", init_db())
+            terms, faqs = await asyncio.gather(
+                readiness.phase("content_filter", content_filter.rebuild(db)),
+                readiness.phase("faq_kb", faq_kb.rebuild(db))
+            )
+            print(f"🛡️ Content filter: {terms} terms | 📚 FAQ KB: {faqs} entries")
+            break
+        except Exception as e:
+            readiness.fail(e)
+            print(f"⚠️ Startup warm-up failed (retry in {delay}s): {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+    try:
+        # Cấu hình hệ thống, danh sách Admin, phòng hay dùng: nạp song song (lỗi thì cache tự nạp khi dùng)
+        await readiness.phase("caches", runtime_cache.warm(db))
+    except Exception as e:
+        print(f"⚠️ Cache warm-up failed: {e}")
+    readiness.mark_ready()
+    print(f"🚀 Ready after {readiness.ready_after_ms}ms {readiness.phases}")
+
+    # Backfill conversation_id cho tin nhắn AI/Help cũ theo lô (truy vấn dùng bộ lọc cũ cho tới khi xong)
+    asyncio.create_task(partitions.run_migration())
+    # Nạp sẵn SDK AI trong thread nền (import bị hoãn khỏi lúc khởi động, xem core/ai_clients.py)
+    if settings.AI_SDK_PREWARM:
+        asyncio.create_task(ai_client_pool.prewarm(db))
+
 @app.on_event("startup")
 async def startup_event():
-    await init_db()
+    asyncio.create_task(warm_up())
+    # Job nền đối soát bộ đếm chưa đọc
+    asyncio.create_task(run_unread_repair_loop())
+    # Huấn luyện định kỳ mô hình gợi ý trả lời nhanh (không dùng lịch sử AI/Help)
+    asyncio.create_task(smart_replies.run_refresh_loop(db, SELF_ISOLATED_ROOMS))
+    # Ghi theo lô các bucket tổng hợp cảm xúc
+    asyncio.create_task(sentiment_rollups.run_flush_loop(db))
+    # Ghi theo lô histogram hiệu năng AI theo phút
+    asyncio.create_task(ai_telemetry.run_flush_loop(db))
+    # Ghi theo lô log sử dụng AI / log hệ thống
+    asyncio.create_task(log_sink.run_flush_loop(db))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ghi nốt các bản ghi còn trong bộ đệm của các bộ ghi theo lô
+    for writer in (log_sink, ai_telemetry, sentiment_rollups):
+        try:
+            await writer.flush(db)
+        except Exception as e:
+            print(f"Error flushing buffered writes on shutdown: {e}")
 
 # Cấu hình thư mục lưu trữ tập trung (Centralized Storage)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -86,3 +155,20 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.get("/")
 async def root():
     return {"message": "Welcome to Enterprise Chat API"}
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """
+    Readiness probe: 503 cho tới khi migration, dữ liệu mặc định và cache nóng đã sẵn sàng.
+    """
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            **readiness.status(),
+            "migrations": schema_migrations.stats(),
+            "caches": runtime_cache.stats(),
+            "conversation_partitions_ready": partitions.ready,
+            "ai_sdk_loaded": ai_client_pool.stats()["sdk_loaded"]
+        }
+    )
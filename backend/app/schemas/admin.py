@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 
 class SystemConfigUpdate(BaseModel):
     configs: Dict[str, Any]
@@ -30,3 +30,23 @@ class SupportNoteUpdate(BaseModel):
 
 class SupportMessageUpdate(BaseModel):
     content: str
+
+class SlowModeUpdate(BaseModel):
+    seconds: int # 0 = tắt chế độ chậm
+
+class LexiconTermsCreate(BaseModel):
+    terms: List[str]
+    action: str = "block" # 'block' | 'mask' | 'flag'
+    whole_word: bool = True # Chỉ khớp nguyên từ (tránh chặn nhầm từ chứa chuỗi con)
+
+class FAQEntryCreate(BaseModel):
+    question: str
+    answer: str
+    keywords: List[str] = [] # Từ khóa/cách hỏi khác để tăng khả năng khớp
+    enabled: bool = True
+
+class FAQEntryUpdate(BaseModel):
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    keywords: Optional[List[str]] = None
+    enabled: Optional[bool] = None
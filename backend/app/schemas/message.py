@@ -25,9 +25,12 @@ class MessageRead(MessageBase):
     is_pinned: bool = False
     is_forwarded: bool = False
     status: Optional[str] = "sent" # sent, delivered, seen
+    seq: Optional[int] = None # Số thứ tự tăng dần trong phòng, so sánh với watermark đã đọc
+    seen_by: Optional[list[str]] = None
     reply_to_id: Optional[str] = None
     reply_to_content: Optional[str] = None
     suggestions: Optional[list[str]] = None
+    is_stopped: bool = False  # Câu trả lời AI bị dừng giữa chừng (cancel_ai)
     shared_post: Optional[dict] = None
     reactions: Optional[dict[str, list[str]]] = None
 
@@ -0,0 +1,63 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google import genai
+from backend.app.core.ai_clients import AIClientPool
+
+class _StaticKeys:
+    """DB giả chỉ trả về cấu hình API key, để benchmark không cần MongoDB."""
+    def __init__(self, google_key: str):
+        self.google_key = google_key
+
+    def __getitem__(self, name):
+        keys = self
+        class _Collection:
+            async def find_one(self, *args, **kwargs):
+                return {"type": "api_keys", "google_api_key": keys.google_key, "openai_api_key": ""}
+        return _Collection()
+
+async def time_to_first_token(client, model: str, prompt: str) -> float:
+    start = time.perf_counter()
+    stream = await client.aio.models.generate_content_stream(model=model, contents=prompt)
+    async for chunk in stream:
+        if chunk.text:
+            return (time.perf_counter() - start) * 1000
+    return (time.perf_counter() - start) * 1000
+
+async def main(iterations: int):
+    api_key = os.getenv("GOOGLE_API_KEY") or "bench-key"
+    db = _StaticKeys(api_key)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        genai.Client(api_key=api_key)
+    fresh_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    pool = AIClientPool()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await pool.get_google_client(db)
+    pooled_ms = (time.perf_counter() - start) * 1000 / iterations
+    print(f"Client setup per request | fresh {fresh_ms:8.2f}ms | pooled {pooled_ms:8.3f}ms")
+    print(f"Pool stats: {pool.stats()}")
+
+    # Đo TTFT thật khi có API key (mỗi request mới phải bắt tay TCP/TLS lại từ đầu)
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("Set GOOGLE_API_KEY to also measure time to first token against the live API.")
+        return
+    model = os.getenv("BENCH_MODEL", "gemini-2.5-flash-lite")
+    prompt = "Trả lời đúng một từ: xin chào"
+    fresh, pooled = [], []
+    shared = await pool.get_google_client(db)
+    for _ in range(min(iterations, 10)):
+        fresh.append(await time_to_first_token(genai.Client(api_key=api_key), model, prompt))
+        pooled.append(await time_to_first_token(shared, model, prompt))
+    print(f"TTFT avg | fresh client {sum(fresh) / len(fresh):8.1f}ms | pooled client {sum(pooled) / len(pooled):8.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
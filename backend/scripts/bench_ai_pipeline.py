@@ -0,0 +1,234 @@
+"""
+Benchmark đường ống AI đầu-cuối qua WebSocket thật, dùng provider giả lập (không tốn quota Gemini/OpenAI).
+
+Khởi động app FastAPI (uvicorn) trong process, tạo N user tạm, mở N kết nối WebSocket và cho mỗi user
+hỏi phòng "ai" nhiều lượt liên tiếp. Báo cáo:
+- Độ trễ đầu-cuối (gửi tin -> frame 'end') và thời gian tới chunk đầu tiên, p50/p95/max.
+- Số frame server gửi cho mỗi câu trả lời (theo loại frame).
+- Số lệnh MongoDB cho mỗi câu trả lời (đếm bằng pymongo command monitoring, theo tên lệnh).
+- Độ trễ event loop của server (lag của một tác vụ sleep 10ms).
+
+Cần MongoDB thật (MONGODB_URL trong .env). User tạm có quyền ai_unlimited để không đụng bộ đếm quota
+thật của phòng "ai"; toàn bộ dữ liệu của lượt chạy được xóa khi kết thúc.
+Kịch bản provider giả lập chỉnh bằng biến môi trường AI_FAKE_TTFT_MS, AI_FAKE_CHUNK_DELAY_MS,
+AI_FAKE_CHUNK_CHARS, AI_FAKE_FAILURE_RATE.
+
+    python backend/scripts/bench_ai_pipeline.py [conversations=20] [turns=3]
+"""
+import sys
+import os
+import asyncio
+import json
+import socket
+import time
+import uuid
+from collections import Counter
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+# Phải đặt trước khi import backend: chỉ dùng model giả lập; tắt rate limit vì mọi client chung IP loopback
+os.environ["AI_FALLBACK_MODELS"] = "fake-bench"
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from pymongo import monitoring
+
+# Lệnh nội bộ của driver (handshake, heartbeat) không tính vào thao tác của ứng dụng
+_DRIVER_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.counts = Counter()
+        self.enabled = False
+
+    def started(self, event):
+        if self.enabled and event.command_name not in _DRIVER_COMMANDS:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Đăng ký trước khi session.py tạo AsyncIOMotorClient
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+import uvicorn
+import websockets
+from backend.app.main import app
+from backend.app.db.session import db
+from backend.app.core.security import create_access_token
+from backend.app.core.ai_providers import fake_provider
+from backend.app.core.model_health import percentile
+from backend.app.core.log_sink import log_sink
+from backend.app.core.readiness import readiness
+from backend.app.api.v1.endpoints.ws.ai_scheduler import ai_scheduler
+
+QUESTIONS = [
+    "Làm sao để tạo nhóm chat mới?",
+    "Tóm tắt giúp mình các tính năng chính của LinkUp",
+    "Viết một đoạn giới thiệu ngắn về bản thân để đăng lên trang cá nhân",
+    "Cách thu hồi tin nhắn đã gửi nhầm?",
+]
+
+class LoopLagMonitor:
+    """Đo độ trễ event loop: một tác vụ ngủ interval giây, phần vượt quá là thời gian loop bị chiếm."""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (time.perf_counter() - start - self.interval) * 1000))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def create_users(run_id: str, count: int):
+    users = [
+        {
+            "id": str(uuid.uuid4()),
+            "username": f"bench_ai_{run_id}_{i}",
+            "email": f"bench_ai_{run_id}_{i}@bench.local",
+            "full_name": f"Bench {i}",
+            "hashed_password": "",
+            "is_active": True,
+            "is_superuser": False,
+            "role": "member",
+            "permissions": ["ai_unlimited"],
+        }
+        for i in range(count)
+    ]
+    await db["users"].insert_many(users)
+    return users
+
+async def cleanup(user_ids):
+    # Log sử dụng AI được ghi theo lô: ghi nốt trước khi xóa
+    await log_sink.flush(db)
+    ids = {"$in": user_ids}
+    await db["messages"].delete_many({"$or": [{"sender_id": ids}, {"receiver_id": ids}]})
+    await db["room_members"].delete_many({"user_id": ids})
+    await db["ai_usage"].delete_many({"user_id": ids})
+    await db["room_summaries"].delete_many({"_id": {"$in": [f"ai:{uid}" for uid in user_ids]}})
+    await db["users"].delete_many({"id": ids})
+
+async def conversation(url: str, index: int, turns: int, start: asyncio.Event, results: list, timeout: float):
+    async with websockets.connect(url, max_size=None) as ws:
+        await start.wait()
+        for turn in range(turns):
+            question = f"{QUESTIONS[(index + turn) % len(QUESTIONS)]} (#{index}.{turn})"
+            sent_at = time.perf_counter()
+            await ws.send(json.dumps({"type": "send_message", "room_id": "ai", "content": question}))
+            frames = Counter()
+            first_chunk_ms = None
+            error = None
+            while True:
+                try:
+                    frame = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                except asyncio.TimeoutError:
+                    error = "timeout"
+                    break
+                frame_type = frame.get("type")
+                frames[frame_type] += 1
+                if frame_type == "chunk" and first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - sent_at) * 1000
+                if frame_type == "end":
+                    break
+                if frame.get("is_error"):
+                    error = frame.get("content") or "error"
+                    break
+            results.append({
+                "latency_ms": (time.perf_counter() - sent_at) * 1000,
+                "first_chunk_ms": first_chunk_ms,
+                "frames": frames,
+                "error": error,
+            })
+
+def run_clients(url_base: str, tokens, turns: int, timeout: float):
+    """Client chạy trong thread riêng với event loop riêng để không làm sai số đo lag của server."""
+    async def main():
+        start = asyncio.Event()
+        results = []
+        tasks = [
+            asyncio.create_task(conversation(f"{url_base}/{token}", i, turns, start, results, timeout))
+            for i, token in enumerate(tokens)
+        ]
+        # Chờ mọi kết nối mở xong (tránh lẫn frame online/offline vào số liệu)
+        await asyncio.sleep(1.0)
+        began = time.perf_counter()
+        start.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return results, time.perf_counter() - began
+    return asyncio.run(main())
+
+def summarize(label: str, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"  {label:<16} n/a"
+    return (
+        f"  {label:<16} p50 {percentile(values, 0.5):8.1f}ms  p95 {percentile(values, 0.95):8.1f}ms  "
+        f"max {max(values):8.1f}ms"
+    )
+
+async def bench(conversations: int, turns: int, timeout: float = 60.0):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    # Chờ cả phần khởi động nền (migration, dữ liệu mặc định, cache nóng) để không đo lẫn thời gian khởi động
+    while not server.started or not readiness.ready:
+        await asyncio.sleep(0.05)
+
+    run_id = uuid.uuid4().hex[:8]
+    users = await create_users(run_id, conversations)
+    user_ids = [u["id"] for u in users]
+    tokens = [create_access_token(uid) for uid in user_ids]
+    fake_provider.configure()
+
+    monitor = LoopLagMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    command_counter.counts.clear()
+    command_counter.enabled = True
+    try:
+        results, elapsed = await asyncio.to_thread(
+            run_clients, f"ws://127.0.0.1:{port}/api/v1/ws", tokens, turns, timeout
+        )
+        # Các tác vụ nền của lượt cuối (ghi usage, tóm tắt) vẫn có thể đang chạy
+        await asyncio.sleep(0.5)
+    finally:
+        command_counter.enabled = False
+        monitor_task.cancel()
+        await cleanup(user_ids)
+        server.should_exit = True
+        await server_task
+
+    replies = [r for r in results if not r["error"]]
+    errors = Counter(r["error"] for r in results if r["error"])
+    frames = sum((r["frames"] for r in replies), Counter())
+    db_ops = sum(command_counter.counts.values())
+    per_reply = max(1, len(replies))
+
+    print(f"\n{conversations} conversations x {turns} turns | fake TTFT {fake_provider.ttft_ms:.0f}ms, "
+          f"chunk {fake_provider.chunk_chars} chars / {fake_provider.chunk_delay_ms:.0f}ms")
+    print(f"  replies {len(replies)}/{conversations * turns} in {elapsed:.1f}s "
+          f"({len(replies) / elapsed:.1f} replies/s) | errors {dict(errors) or 0}")
+    print(summarize("end-to-end", [r["latency_ms"] for r in replies]))
+    print(summarize("first chunk", [r["first_chunk_ms"] for r in replies]))
+    print(f"  frames/reply     {sum(frames.values()) / per_reply:6.1f}  "
+          + ", ".join(f"{t}={c / per_reply:.1f}" for t, c in frames.most_common()))
+    print(f"  db ops/reply     {db_ops / per_reply:6.1f}  "
+          + ", ".join(f"{c}={n / per_reply:.1f}" for c, n in command_counter.counts.most_common()))
+    print(summarize("loop lag", monitor.samples))
+    waits = ai_scheduler.stats()["wait_ms"]["ai_room"]
+    print(f"  scheduler wait   p50 {waits['p50_ms']}ms  p95 {waits['p95_ms']}ms "
+          f"(AI_MAX_CONCURRENT={ai_scheduler.max_concurrent})")
+
+if __name__ == "__main__":
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    asyncio.run(bench(conversations, turns))
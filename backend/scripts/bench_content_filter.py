@@ -0,0 +1,75 @@
+import sys
+import os
+import random
+import string
+import time
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.app.core.content_filter import AhoCorasickAutomaton, ContentFilter, fold_text
+
+SYLLABLES = [
+    "anh", "em", "ban", "toi", "chung", "ta", "noi", "chuyen", "hom", "nay", "troi", "dep",
+    "nhom", "hoc", "lap", "trinh", "ung", "dung", "tin", "nhan", "cong", "dong", "ho", "tro",
+    "nguoi", "dung", "mat", "khau", "tai", "khoan", "bao", "mat", "vui", "ve", "cam", "on",
+]
+VI_WORDS = ["xin chào", "cảm ơn", "đồng ý", "hẹn gặp lại", "tuyệt vời", "không sao", "được rồi", "nhóm học"]
+
+def random_term(rng: random.Random) -> str:
+    word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+    return word if rng.random() < 0.7 else f"{word} {rng.choice(SYLLABLES)}"
+
+def random_message(rng: random.Random, length: int) -> str:
+    parts = []
+    while sum(len(p) + 1 for p in parts) < length:
+        parts.append(rng.choice(VI_WORDS) if rng.random() < 0.5 else rng.choice(SYLLABLES))
+    return " ".join(parts)[:length]
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def bench(lexicon_size: int, rng: random.Random, iterations: int = 2000):
+    terms = list({random_term(rng) for _ in range(lexicon_size)})
+    entries = [(t, rng.choice(["block", "mask", "flag"]), True) for t in terms]
+
+    start = time.perf_counter()
+    automaton = AhoCorasickAutomaton(entries)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    flt = ContentFilter()
+    flt.automaton = automaton
+    print(f"\nLexicon {len(terms):>7} terms | build {build_ms:8.1f}ms | {len(automaton.goto)} states")
+
+    for length in (100, 500, 2000):
+        messages = [random_message(rng, length) for _ in range(200)]
+        # Chèn từ cấm vào một phần tin nhắn để đo cả đường có khớp
+        for i in range(0, len(messages), 4):
+            messages[i] = messages[i][: length // 2] + " " + rng.choice(terms) + " " + messages[i][length // 2:]
+
+        samples = []
+        for i in range(iterations):
+            msg = messages[i % len(messages)]
+            t0 = time.perf_counter()
+            flt.check(msg)
+            samples.append((time.perf_counter() - t0) * 1e6)
+
+        naive_samples = []
+        folded_terms = [fold_text(t) for t in terms]
+        for i in range(min(50, iterations)):
+            folded = fold_text(messages[i % len(messages)])
+            t0 = time.perf_counter()
+            [t for t in folded_terms if t in folded]
+            naive_samples.append((time.perf_counter() - t0) * 1e6)
+
+        print(
+            f"  msg {length:>5} chars | aho-corasick avg {sum(samples) / len(samples):8.1f}µs "
+            f"p99 {percentile(samples, 0.99):8.1f}µs | naive 'in' loop avg {sum(naive_samples) / len(naive_samples):10.1f}µs"
+        )
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 10000, 50000]
+    rng = random.Random(42)
+    for size in sizes:
+        bench(size, rng)
@@ -0,0 +1,133 @@
+"""
+Benchmark cơ sở tri thức FAQ phòng Help (BM25) so với một lượt gọi model.
+
+- Dựng chỉ mục với FAQ mặc định + N mục tổng hợp, đo thời gian dựng và độ trễ tra cứu p50/p95.
+- Bộ câu hỏi có nhãn (diễn đạt lại câu hỏi FAQ, có/không dấu, câu hỏi ngoài FAQ): tỉ lệ trả lời trực tiếp,
+  tỉ lệ đúng mục, tỉ lệ chỉ làm ngữ cảnh và tỉ lệ bỏ qua theo ngưỡng FAQ_HIGH_CONFIDENCE/FAQ_MEDIUM_CONFIDENCE.
+- Độ trễ trả lời đầy đủ của provider giả lập (AI_FAKE_TTFT_MS, AI_FAKE_CHUNK_DELAY_MS...) để so sánh.
+
+Không cần MongoDB.
+
+    python backend/scripts/bench_faq_kb.py [sizes=0,1000,10000]
+"""
+import sys
+import os
+import asyncio
+import random
+import time
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.app.core.config import settings
+from backend.app.core.faq_kb import BM25Index
+from backend.app.core.ai_providers import fake_provider
+from backend.app.api.v1.endpoints.ws.constants import DEFAULT_FAQ_ENTRIES
+
+# (câu hỏi, chỉ số mục FAQ mặc định mong đợi hoặc None nếu nằm ngoài FAQ)
+LABELLED_QUERIES = [
+    ("LinkUp là gì vậy?", 0),
+    ("linkup la gi", 0),
+    ("tạo nhóm chat thế nào", 1),
+    ("lam sao tao nhom", 1),
+    ("mình muốn tạo phòng mới", 1),
+    ("chat với ai như thế nào", 2),
+    ("dùng trợ lý AI ở đâu", 2),
+    ("thu hồi tin nhắn được không", 3),
+    ("chặn người dùng khác sao", 3),
+    ("tạo nhóm bị lỗi không vào được", 1),
+    ("tôi bị trừ tiền hai lần khi thanh toán", None),
+    ("quên mật khẩu phải làm sao", None),
+    ("ứng dụng có bản cho máy tính không", None),
+    ("gặp admin", None),
+]
+
+TOPICS = [
+    "thông báo", "ảnh đại diện", "mật khẩu", "email", "gọi video", "tệp đính kèm", "emoji", "ghim tin nhắn",
+    "tìm kiếm", "chế độ tối", "ngôn ngữ", "xóa tài khoản", "báo cáo vi phạm", "lời mời", "quyền quản trị",
+]
+ACTIONS = ["bật", "tắt", "đổi", "xem", "gửi", "xóa", "cập nhật", "khôi phục", "chia sẻ", "tải xuống"]
+
+def synthetic_entries(count: int, rng: random.Random) -> list:
+    entries = []
+    for i in range(count):
+        topic, action = rng.choice(TOPICS), rng.choice(ACTIONS)
+        entries.append({
+            "id": f"syn-{i}",
+            "question": f"Làm sao để {action} {topic} số {i}?",
+            "answer": f"Vào Cài đặt > {topic.capitalize()} rồi chọn '{action}' (mục {i}).",
+            "keywords": [f"{action} {topic}"]
+        })
+    return entries
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def classify(index: BM25Index, query: str):
+    matches = index.search(query, k=max(1, settings.FAQ_CONTEXT_ENTRIES))
+    if matches and matches[0].confidence >= settings.FAQ_HIGH_CONFIDENCE:
+        return "answer", matches[0]
+    if matches and matches[0].confidence >= settings.FAQ_MEDIUM_CONFIDENCE:
+        return "context", matches[0]
+    return "miss", matches[0] if matches else None
+
+def bench(extra: int, rng: random.Random, iterations: int = 2000):
+    defaults = [{"id": f"default-{i}", **entry} for i, entry in enumerate(DEFAULT_FAQ_ENTRIES)]
+    entries = defaults + synthetic_entries(extra, rng)
+
+    start = time.perf_counter()
+    index = BM25Index(entries)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for i in range(iterations):
+        query = LABELLED_QUERIES[i % len(LABELLED_QUERIES)][0]
+        t0 = time.perf_counter()
+        index.search(query, k=settings.FAQ_CONTEXT_ENTRIES)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    decisions = {"answer": 0, "context": 0, "miss": 0}
+    correct = wrong = false_answers = 0
+    for query, expected in LABELLED_QUERIES:
+        decision, match = classify(index, query)
+        decisions[decision] += 1
+        if decision == "answer":
+            if expected is None:
+                false_answers += 1
+            elif match.entry["id"] == f"default-{expected}":
+                correct += 1
+            else:
+                wrong += 1
+
+    total = len(LABELLED_QUERIES)
+    print(f"\n{len(entries):>7} FAQ entries | {len(index.postings)} terms | build {build_ms:8.1f}ms")
+    print(f"  lookup p50 {percentile(samples, 0.5):.3f}ms  p95 {percentile(samples, 0.95):.3f}ms")
+    print(f"  decisions answer {decisions['answer']}/{total}  context {decisions['context']}/{total}  "
+          f"miss {decisions['miss']}/{total} | answered correctly {correct}, wrong entry {wrong}, "
+          f"answered off-FAQ question {false_answers}")
+    return samples
+
+async def llm_latency(runs: int = 5):
+    samples = []
+    for query, _ in LABELLED_QUERIES[:runs]:
+        t0 = time.perf_counter()
+        async for _chunk in fake_provider.stream(None, "fake-bench", "", query):
+            pass
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [0, 1000, 10000]
+    rng = random.Random(42)
+    print(f"thresholds: high {settings.FAQ_HIGH_CONFIDENCE}, medium {settings.FAQ_MEDIUM_CONFIDENCE}")
+    lookup_samples = []
+    for size in sizes:
+        lookup_samples = bench(size, rng)
+
+    llm = asyncio.run(llm_latency())
+    faq_p50 = percentile(lookup_samples, 0.5)
+    llm_p50 = percentile(llm, 0.5)
+    print(f"\nfull reply latency: FAQ lookup p50 {faq_p50:.3f}ms vs fake provider p50 {llm_p50:.1f}ms "
+          f"(TTFT {fake_provider.ttft_ms:.0f}ms, {fake_provider.chunk_delay_ms:.0f}ms/chunk) "
+          f"-> ~{llm_p50 / max(faq_p50, 1e-6):,.0f}x faster per answered question")
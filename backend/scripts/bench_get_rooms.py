@@ -0,0 +1,129 @@
+"""
+Kiểm tra số round-trip MongoDB của GET /rooms/ (danh sách phòng ở sidebar).
+
+Tạo một user với N phòng (nửa phòng 1-1 có bạn bè/chặn, nửa phòng nhóm, mỗi phòng vài tin nhắn), gọi get_rooms
+và đếm lệnh MongoDB bằng pymongo command monitoring. Số lệnh phải cố định, không phụ thuộc số phòng
+(tối đa ROUND_TRIP_BUDGET), và thời gian dựng sidebar được in ra để so sánh.
+
+Cần MongoDB thật (MONGODB_URL trong .env); dùng database tạm và xóa khi kết thúc. Thoát với mã 1 nếu vượt ngân sách.
+Ngân sách round-trip được khóa không cần MongoDB bởi backend/tests/test_get_rooms_round_trips.py (python -m pytest backend/tests);
+script này dùng để đo thời gian thật.
+
+    python backend/scripts/bench_get_rooms.py [rooms=10,100] [repeat=5]
+"""
+import sys
+import os
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+# Database tạm: phải đặt trước khi import backend
+os.environ["MONGODB_DB"] = f"bench_rooms_{uuid.uuid4().hex[:8]}"
+
+from pymongo import monitoring
+
+# memberships, phòng + tin nhắn cuối (aggregate), support_threads, thành viên phòng 1-1, users, friend_requests
+ROUND_TRIP_BUDGET = 6
+
+# Lệnh nội bộ của driver (handshake, heartbeat) không tính vào thao tác của ứng dụng
+_DRIVER_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.counts = Counter()
+        self.enabled = False
+
+    def started(self, event):
+        if self.enabled and event.command_name not in _DRIVER_COMMANDS:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Đăng ký trước khi session.py tạo AsyncIOMotorClient
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+from backend.app.db.session import client, db
+from backend.app.db.init_db import init_db
+from backend.app.api.v1.endpoints.rooms import get_rooms
+
+async def seed(user_id: str, rooms: int):
+    now = datetime.now(timezone.utc)
+    chat_rooms, members, users, friends, messages = [], [], [], [], []
+    for i in range(rooms):
+        updated_at = now - timedelta(minutes=i)
+        if i % 2:
+            room_id = f"direct_{user_id}_{i}"
+            other_id = f"{user_id}-peer-{i}"
+            chat_rooms.append({"id": room_id, "name": room_id, "type": "direct", "updated_at": updated_at})
+            members += [
+                {"room_id": room_id, "user_id": user_id, "unread_count": i % 3},
+                {"room_id": room_id, "user_id": other_id}
+            ]
+            users.append({
+                "id": other_id, "username": other_id, "is_online": True,
+                "blocked_users": [user_id] if i % 7 == 0 else []
+            })
+            if i % 4 == 1:
+                friends.append({"status": "accepted", "from_id": user_id, "to_id": other_id})
+        else:
+            room_id = f"{user_id}-group-{i}"
+            chat_rooms.append({"id": room_id, "name": room_id, "type": "group", "updated_at": updated_at})
+            members.append({"room_id": room_id, "user_id": user_id, "unread_count": 1})
+        messages += [
+            {
+                "id": f"{room_id}-{j}", "room_id": room_id, "content": f"tin {j}", "sender_name": "bench",
+                "timestamp": updated_at - timedelta(seconds=10 - j)
+            }
+            for j in range(5)
+        ]
+    await db["users"].insert_many([{"id": user_id, "username": user_id}, *users])
+    await db["chat_rooms"].insert_many(chat_rooms)
+    await db["room_members"].insert_many(members)
+    await db["messages"].insert_many(messages)
+    if friends:
+        await db["friend_requests"].insert_many(friends)
+
+async def bench(sizes, repeat: int) -> bool:
+    ok = True
+    await init_db()
+    for size in sizes:
+        user_id = f"bench-{uuid.uuid4().hex[:8]}"
+        await seed(user_id, size)
+        current_user = {"id": user_id, "username": user_id, "blocked_users": []}
+        samples = []
+        for _ in range(repeat):
+            command_counter.counts.clear()
+            command_counter.enabled = True
+            start = time.perf_counter()
+            rooms = await get_rooms(db=db, current_user=current_user)
+            samples.append((time.perf_counter() - start) * 1000)
+            command_counter.enabled = False
+        round_trips = sum(command_counter.counts.values())
+        within = round_trips <= ROUND_TRIP_BUDGET
+        ok = ok and within
+        print(f"\n{size:>4} rooms -> {len(rooms)} in sidebar | {round_trips} round trips "
+              f"({'OK' if within else f'OVER BUDGET {ROUND_TRIP_BUDGET}'}) {dict(command_counter.counts)}")
+        print(f"  get_rooms median {statistics.median(samples):.1f}ms  max {max(samples):.1f}ms")
+    return ok
+
+async def main(sizes, repeat: int) -> bool:
+    try:
+        return await bench(sizes, repeat)
+    finally:
+        await client.drop_database(db.name)
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10, 100]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sys.exit(0 if asyncio.run(main(sizes, repeat)) else 1)
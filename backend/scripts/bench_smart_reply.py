@@ -0,0 +1,79 @@
+"""
+Benchmark mô hình gợi ý trả lời nhanh cục bộ (MessageRead.suggestions).
+
+Sinh lịch sử hội thoại tổng hợp (câu hỏi/lời chào/cảm ơn... và các câu trả lời ngắn của nhiều user),
+huấn luyện mô hình rồi đo:
+- Thời gian huấn luyện theo số cặp (tin nhắn, trả lời).
+- Độ trễ gợi ý top-3 cho mỗi tin nhắn, p50/p95/max (mục tiêu: dưới 1ms).
+- Tỉ lệ gợi ý chứa câu trả lời "đúng chủ đề" trên tập tin nhắn kiểm tra.
+
+Không cần MongoDB.
+
+    python backend/scripts/bench_smart_reply.py [pairs=10000,100000]
+"""
+import sys
+import os
+import random
+import time
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.app.core.smart_reply import train_smart_reply_model
+
+# Chủ đề: (các mẫu tin nhắn đến, các câu trả lời hay gặp)
+TOPICS = [
+    (["chào mọi người", "hello cả nhà", "chào buổi sáng nhé"], ["Chào bạn!", "Hello 👋", "Chào buổi sáng!"]),
+    (["cảm ơn bạn nhiều", "thanks nha", "cám ơn mọi người đã giúp"], ["Không có gì!", "Không có chi 😊", "Rất vui được giúp"]),
+    (["tối nay đi ăn không?", "cuối tuần đi cà phê không?", "mai họp được không?"], ["Ok luôn", "Được nhé", "Mình bận rồi"]),
+    (["deadline báo cáo là khi nào?", "ai làm phần giao diện vậy?", "đã sửa lỗi đăng nhập chưa?"], ["Để mình kiểm tra", "Mình chưa rõ", "Đang làm rồi"]),
+    (["chúc mừng sinh nhật bạn", "chúc mừng team nhé", "chúc mừng năm mới"], ["Cảm ơn bạn!", "Cảm ơn nhiều ❤️", "Yeah 🎉"]),
+]
+FILLER = ["nha", "nhé", "ạ", "vậy", "đi", "luôn", "với", "hôm nay", "bây giờ", "nào"]
+
+def synthetic_pairs(count: int, rng: random.Random, users: int = 200):
+    pairs = []
+    for _ in range(count):
+        prompts, replies = rng.choice(TOPICS)
+        message = rng.choice(prompts)
+        if rng.random() < 0.5:
+            message = f"{message} {rng.choice(FILLER)}"
+        # 10% câu trả lời hiếm/riêng tư: chỉ một user dùng, không được học
+        if rng.random() < 0.1:
+            reply = f"riêng tư {rng.randint(0, 10 ** 9)}"
+        else:
+            reply = rng.choice(replies)
+        pairs.append((message, reply, f"user-{rng.randrange(users)}"))
+    return pairs
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def bench(count: int, rng: random.Random, iterations: int = 5000):
+    pairs = synthetic_pairs(count, rng)
+    start = time.perf_counter()
+    model = train_smart_reply_model(pairs, min_users=3)
+    train_ms = (time.perf_counter() - start) * 1000
+
+    tests = synthetic_pairs(iterations, rng)
+    samples = []
+    on_topic = 0
+    for message, _, _ in tests:
+        t0 = time.perf_counter()
+        suggestions = model.suggest(message, 3)
+        samples.append((time.perf_counter() - t0) * 1000)
+        topic_replies = next(r for p, r in TOPICS if any(message.startswith(x) for x in p))
+        if any(s in topic_replies for s in suggestions):
+            on_topic += 1
+
+    print(f"\n{count:>8} pairs | train {train_ms:8.1f}ms | {len(model.replies)} replies, {len(model.table)} features")
+    print(f"  suggest p50 {percentile(samples, 0.5):.4f}ms  p95 {percentile(samples, 0.95):.4f}ms  "
+          f"max {max(samples):.4f}ms | on-topic {on_topic / len(tests):.1%}")
+    print(f"  sample: {tests[0][0]!r} -> {model.suggest(tests[0][0], 3)}")
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10000, 100000]
+    rng = random.Random(7)
+    for size in sizes:
+        bench(size, rng)
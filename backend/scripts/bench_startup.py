@@ -0,0 +1,126 @@
+"""
+Benchmark thời gian khởi động của worker.
+
+Đo:
+- Import backend.app.main trong process Python mới (trung vị của N lần), và SDK AI có bị nạp lúc import không.
+- Thời gian import riêng các SDK AI đã được hoãn (google.genai, langchain_openai): phần này giờ chạy nền sau khi sẵn sàng.
+- Với MongoDB thật (MONGODB_URL trong .env), trên database tạm (xóa khi kết thúc):
+  + Tạo toàn bộ index tuần tự (cách cũ, mỗi lần khởi động) so với migration theo phiên bản lần đầu (song song)
+    và lần khởi động sau (đã áp dụng, chỉ một truy vấn).
+  + Thời gian từ lúc server bắt đầu tới khi /ready trả 200 (migration + dữ liệu mặc định + nạp cache).
+
+    python backend/scripts/bench_startup.py [runs=5] [--no-db]
+"""
+import sys
+import os
+import asyncio
+import json
+import statistics
+import subprocess
+import time
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(ROOT)
+
+# Database tạm: phải đặt trước khi import backend
+os.environ["MONGODB_DB"] = f"bench_startup_{uuid.uuid4().hex[:8]}"
+
+_IMPORT_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import backend.app.main
+print(json.dumps({
+    "ms": (time.perf_counter() - start) * 1000,
+    "sdk_loaded": [m for m in ("google.genai", "langchain_openai") if m in sys.modules]
+}))
+"""
+
+_SDK_PROBE = """
+import time, json, importlib
+result = {}
+for module in ("google.genai", "langchain_openai"):
+    start = time.perf_counter()
+    try:
+        importlib.import_module(module)
+        result[module] = (time.perf_counter() - start) * 1000
+    except ImportError:
+        result[module] = None
+print(json.dumps(result))
+"""
+
+def run_probe(code: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    return json.loads(out[-1])
+
+def bench_imports(runs: int):
+    samples = [run_probe(_IMPORT_PROBE) for _ in range(runs)]
+    ms = [s["ms"] for s in samples]
+    print(f"\nimport backend.app.main ({runs} runs): median {statistics.median(ms):.0f}ms  "
+          f"min {min(ms):.0f}ms  max {max(ms):.0f}ms")
+    print(f"  AI SDK loaded at import: {samples[0]['sdk_loaded'] or 'none'}")
+    sdk = run_probe(_SDK_PROBE)
+    deferred = ", ".join(f"{m} {v:.0f}ms" if v is not None else f"{m} (not installed)" for m, v in sdk.items())
+    print(f"  deferred to background prewarm: {deferred}")
+
+async def bench_db():
+    import uvicorn
+    import socket
+    from backend.app.db.session import client, db
+    from backend.app.db.migrations import SCHEMA_VERSIONS, schema_migrations
+
+    legacy_db = client[f"{db.name}_legacy"]
+    try:
+        start = time.perf_counter()
+        for _, _, indexes in SCHEMA_VERSIONS:
+            for collection, keys, options in indexes:
+                await legacy_db[collection].create_index(keys, **options)
+        legacy_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _, _, indexes in SCHEMA_VERSIONS:
+            for collection, keys, options in indexes:
+                await legacy_db[collection].create_index(keys, **options)
+        legacy_repeat_ms = (time.perf_counter() - start) * 1000
+
+        await schema_migrations.run(db)
+        first_ms = schema_migrations.duration_ms
+        await schema_migrations.run(db)
+        repeat_ms = schema_migrations.duration_ms
+
+        count = sum(len(indexes) for _, _, indexes in SCHEMA_VERSIONS)
+        print(f"\nindexes ({count}, {len(SCHEMA_VERSIONS)} versions)")
+        print(f"  sequential create_index: first {legacy_ms:.0f}ms | every later start {legacy_repeat_ms:.0f}ms")
+        print(f"  versioned migrations:    first {first_ms:.0f}ms | every later start {repeat_ms:.0f}ms")
+
+        from backend.app.main import app
+        from backend.app.core.readiness import readiness
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+        began = time.perf_counter()
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.005)
+        accepting_ms = (time.perf_counter() - began) * 1000
+        while not readiness.ready:
+            await asyncio.sleep(0.005)
+        ready_ms = (time.perf_counter() - began) * 1000
+        print(f"\nserver accepting connections after {accepting_ms:.0f}ms, /ready after {ready_ms:.0f}ms")
+        print(f"  phases: {readiness.phases}")
+        server.should_exit = True
+        await server_task
+    finally:
+        await client.drop_database(db.name)
+        await client.drop_database(legacy_db.name)
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    runs = int(args[0]) if args else 5
+    bench_imports(runs)
+    if "--no-db" not in sys.argv:
+        asyncio.run(bench_db())
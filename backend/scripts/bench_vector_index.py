@@ -0,0 +1,75 @@
+import sys
+import os
+import random
+import time
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import numpy as np
+from backend.app.api.v1.endpoints.ws.ai_retrieval import RoomVectorIndex, embed_texts
+
+WORDS = [
+    "nhóm", "dự án", "deadline", "báo cáo", "họp", "thứ hai", "thứ sáu", "khách hàng", "triển khai", "máy chủ",
+    "cơ sở dữ liệu", "giao diện", "lỗi", "sửa", "kiểm thử", "ăn trưa", "cuối tuần", "quyết định", "ngân sách", "tài liệu",
+]
+QUERIES = [
+    "tuần trước nhóm quyết định gì về cơ sở dữ liệu",
+    "deadline báo cáo khách hàng là khi nào",
+    "ai sửa lỗi giao diện",
+    "lịch triển khai máy chủ",
+]
+
+def random_message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16)))
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def build_index(size: int, dim: int, rng: random.Random, pool_size: int = 20000) -> RoomVectorIndex:
+    # Embedding cho 1M tin nhắn bằng Python mất nhiều phút, nên embed một tập mẫu rồi lặp lại các hàng:
+    # chi phí truy vấn chỉ phụ thuộc kích thước ma trận, không phụ thuộc nội dung
+    pool_texts = [random_message(rng) for _ in range(min(size, pool_size))]
+    start = time.perf_counter()
+    pool = embed_texts(pool_texts, dim)
+    embed_rate = len(pool_texts) / (time.perf_counter() - start)
+
+    index = RoomVectorIndex("bench", dim, capacity=size)
+    rows = np.resize(np.arange(len(pool)), size)
+    index.vectors[:size] = pool[rows]
+    index.seqs[:size] = np.arange(1, size + 1)
+    index.alive[:size] = True
+    index.size = size
+    index.last_seq = size
+    index.ids = [f"m{i}" for i in range(size)]
+    index.meta = [{"sender_name": "bench", "timestamp": None, "content": pool_texts[r]} for r in rows[:size]]
+    # Một phần nhỏ tin nhắn bị ẩn với user truy vấn (xóa phía tôi)
+    index.hidden["viewer"] = set(rng.sample(range(size), k=min(size // 100, 10000)))
+    print(f"  embed throughput {embed_rate:10.0f} msgs/s | matrix {index.vectors[:size].nbytes / 1e6:8.1f} MB")
+    return index
+
+def bench(size: int, dim: int, rng: random.Random, iterations: int = 50):
+    print(f"\n{size:>9} messages, dim {dim}")
+    index = build_index(size, dim, rng)
+    embed_samples, search_samples = [], []
+    for i in range(iterations):
+        query = QUERIES[i % len(QUERIES)]
+        t0 = time.perf_counter()
+        vector = embed_texts([query], dim)[0]
+        t1 = time.perf_counter()
+        index.search(vector, "viewer", k=5, max_seq=size - 20)
+        t2 = time.perf_counter()
+        embed_samples.append((t1 - t0) * 1000)
+        search_samples.append((t2 - t1) * 1000)
+    print(
+        f"  query embed avg {sum(embed_samples) / iterations:6.3f}ms | "
+        f"top-5 search p50 {percentile(search_samples, 0.5):8.2f}ms p95 {percentile(search_samples, 0.95):8.2f}ms"
+    )
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    dim = int(os.getenv("AI_RETRIEVAL_DIM", "256"))
+    rng = random.Random(7)
+    for size in sizes:
+        bench(size, dim, rng)
@@ -0,0 +1,15 @@
+import asyncio
+import sys
+import os
+
+# Add the project root to sys.path to allow importing from 'backend'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.app.api.v1.endpoints.ws.support_threads import rebuild_support_threads
+
+async def main():
+    count = await rebuild_support_threads()
+    print(f"Rebuilt {count} support threads.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
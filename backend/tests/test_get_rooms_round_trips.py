@@ -0,0 +1,130 @@
+"""
+Khóa ngân sách round-trip MongoDB của GET /rooms/ (danh sách phòng ở sidebar) mà không cần MongoDB thật.
+
+get_rooms chạy trên một database giả ghi lại mỗi lệnh gửi tới server (find/aggregate khi to_list, find_one...)
+và trả về dữ liệu mẫu. Số lệnh phải <= ROUND_TRIP_BUDGET và không đổi theo số phòng.
+Đo thời gian trên MongoDB thật: backend/scripts/bench_get_rooms.py.
+
+    python -m pytest backend/tests
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.app.api.v1.endpoints.rooms import get_rooms
+
+# memberships, phòng + tin nhắn cuối (aggregate), support_threads, thành viên phòng 1-1, users, friend_requests
+ROUND_TRIP_BUDGET = 6
+
+ME = "me"
+
+class _Cursor:
+    def __init__(self, database, command: str, docs):
+        self._database = database
+        self._command = command
+        self._docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        self._database.commands.append(self._command)
+        return [dict(doc) for doc in self._docs]
+
+class _Collection:
+    def __init__(self, database, name: str):
+        self._database = database
+        self._name = name
+
+    def _docs(self, query):
+        return self._database.fixtures(self._name, query or {})
+
+    def find(self, query=None, *args, **kwargs):
+        return _Cursor(self._database, f"{self._name}.find", self._docs(query))
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        return _Cursor(self._database, f"{self._name}.aggregate", self._docs(pipeline[0]["$match"]))
+
+    async def find_one(self, query=None, *args, **kwargs):
+        self._database.commands.append(f"{self._name}.find_one")
+        docs = self._docs(query)
+        return dict(docs[0]) if docs else None
+
+    async def count_documents(self, query=None, *args, **kwargs):
+        self._database.commands.append(f"{self._name}.count_documents")
+        return len(self._docs(query))
+
+class CountingDatabase:
+    """
+    Database giả: mỗi thao tác tới server được ghi vào commands; dữ liệu mẫu cho một user có `rooms` phòng
+    (nửa phòng 1-1 có bạn bè/chặn, nửa phòng nhóm, phòng nào cũng có tin nhắn cuối).
+    """
+    def __init__(self, rooms: int):
+        self.commands = []
+        now = datetime.now(timezone.utc)
+        self.chat_rooms, self.members, self.users, self.friends = [], [], [], []
+        for i in range(rooms):
+            updated_at = now - timedelta(minutes=i)
+            if i % 2:
+                room_id = f"direct_{ME}_{i}"
+                peer = f"peer-{i}"
+                self.chat_rooms.append({"id": room_id, "name": room_id, "type": "direct", "updated_at": updated_at})
+                self.members += [
+                    {"room_id": room_id, "user_id": ME, "unread_count": i % 3},
+                    {"room_id": room_id, "user_id": peer}
+                ]
+                self.users.append({
+                    "id": peer, "username": peer, "is_online": True,
+                    "blocked_users": [ME] if i % 7 == 0 else []
+                })
+                if i % 4 == 1:
+                    self.friends.append({"status": "accepted", "from_id": ME, "to_id": peer})
+            else:
+                room_id = f"group-{i}"
+                self.chat_rooms.append({"id": room_id, "name": room_id, "type": "group", "updated_at": updated_at})
+                self.members.append({"room_id": room_id, "user_id": ME, "unread_count": 1})
+        for room in self.chat_rooms:
+            room["last_message_doc"] = [{
+                "id": f"{room['id']}-last", "content": "tin cuối", "sender_name": "bench", "timestamp": room["updated_at"]
+            }]
+
+    def fixtures(self, collection: str, query: dict):
+        if collection == "room_members":
+            if query.get("user_id") == ME:
+                return [m for m in self.members if m["user_id"] == ME]
+            room_ids = set(query.get("room_id", {}).get("$in", []))
+            return [m for m in self.members if m["room_id"] in room_ids and m["user_id"] != ME]
+        if collection == "chat_rooms":
+            return self.chat_rooms[:100]
+        if collection == "users":
+            return self.users
+        if collection == "friend_requests":
+            return self.friends
+        return []
+
+    def __getitem__(self, name: str) -> _Collection:
+        return _Collection(self, name)
+
+def _run(rooms: int):
+    database = CountingDatabase(rooms)
+    result = asyncio.run(get_rooms(db=database, current_user={"id": ME, "username": ME, "blocked_users": []}))
+    return database, result
+
+@pytest.mark.parametrize("rooms", [10, 100])
+def test_get_rooms_within_round_trip_budget(rooms):
+    database, result = _run(rooms)
+    assert len(result) == rooms
+    assert len(database.commands) <= ROUND_TRIP_BUDGET, database.commands
+
+def test_get_rooms_round_trips_do_not_grow_with_rooms():
+    small, _ = _run(10)
+    large, _ = _run(100)
+    assert sorted(small.commands) == sorted(large.commands)
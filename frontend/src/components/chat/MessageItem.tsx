@@ -73,7 +73,8 @@ export const MessageItem: React.FC<MessageItemProps> = ({
     showAvatar = true, 
     showName = true,
     isFirst = true,
-    isLast = true
+    isLast = true,
+    isLatest = false
 }) => {
   const { currentUser, token } = useAuthStore();
   const { 
@@ -86,7 +87,11 @@ export const MessageItem: React.FC<MessageItemProps> = ({
     addReaction, 
     activeDropdownId, 
     setActiveDropdown,
-    setViewingUser
+    setViewingUser,
+    sendMessage,
+    dismissSuggestions,
+    requestAISuggestion,
+    cancelAI
   } = useChatStore();
   
   const getAuthenticatedUrl = (url?: string) => {
@@ -455,6 +460,9 @@ export const MessageItem: React.FC<MessageItemProps> = ({
                             {message.is_edited && (
                                 <span className="text-[10px] ml-1 opacity-60">(đã sửa)</span>
                             )}
+                            {message.isStopped && (
+                                <span className="text-[10px] ml-1 opacity-60 italic">(đã dừng)</span>
+                            )}
                         </div>
                     )}
                 </div>
@@ -492,6 +500,44 @@ export const MessageItem: React.FC<MessageItemProps> = ({
                     <div className="flex items-center space-x-1 mt-2 mb-1 ml-1 opacity-60">
                         <div className="w-1 h-1 bg-purple-500 rounded-full animate-pulse" />
                         <span className="text-[10px] text-purple-600 font-medium italic">LinkUp AI đang soạn thảo...</span>
+                        {/* Chỉ người hỏi mới dừng được: phòng AI, và phòng Help phía người dùng */}
+                        {(message.roomId === 'ai' || (message.roomId === 'help' && !currentUser?.is_superuser)) && (
+                            <button
+                                onClick={() => cancelAI(message.id)}
+                                className="ml-2 px-2 py-0.5 rounded-full border border-purple-200 text-[10px] font-bold text-purple-600 hover:bg-purple-50 transition-colors"
+                            >
+                                Dừng
+                            </button>
+                        )}
+                    </div>
+                )}
+
+                {/* Gợi ý trả lời nhanh (tính cục bộ trên server) + soạn bằng AI khi người dùng chủ động yêu cầu */}
+                {isLatest && !isMe && !message.isBot && !message.suggestionsDismissed && message.suggestions && message.suggestions.length > 0 && (
+                    <div className="flex flex-wrap items-center gap-1.5 mt-2">
+                        {message.suggestions.map((suggestion) => (
+                            <button
+                                key={suggestion}
+                                onClick={() => {
+                                    sendMessage(suggestion);
+                                    dismissSuggestions(message.id);
+                                }}
+                                className="px-3 py-1 rounded-full border border-blue-200 bg-white text-[12px] text-blue-600 font-medium hover:bg-blue-50 transition-colors"
+                            >
+                                {suggestion}
+                            </button>
+                        ))}
+                        <button
+                            onClick={() => {
+                                requestAISuggestion(message.id);
+                                dismissSuggestions(message.id);
+                            }}
+                            className="px-2.5 py-1 rounded-full border border-purple-200 bg-white text-[12px] text-purple-600 font-medium hover:bg-purple-50 transition-colors flex items-center gap-1"
+                            title="Nhờ LinkUp AI soạn câu trả lời"
+                        >
+                            <Sparkles size={11} />
+                            <span>AI soạn</span>
+                        </button>
                     </div>
                 )}
             </div>
@@ -14,7 +14,7 @@ import toast from 'react-hot-toast';
 import { ConfirmModal } from '../components/common/ConfirmModal';
 
 // Sub-components
-import type { Stats, User, SystemConfig, SupportConversation, SupportMessage, Room, Report } from './admin/types';
+import type { Stats, User, SystemConfig, SupportConversation, SupportMessage, Room, Report, AITelemetry } from './admin/types';
 import { OverviewTab } from './admin/OverviewTab';
 import { UsersTab } from './admin/UsersTab';
 import { RoomsTab } from './admin/RoomsTab';
@@ -34,6 +34,7 @@ export const AdminPage: React.FC<{ onBack: () => void }> = ({ onBack }) => {
     const [config, setConfig] = useState<SystemConfig | null>(null);
     const [restrictedUsers, setRestrictedUsers] = useState<string[]>([]);
     const [restrictedRooms, setRestrictedRooms] = useState<string[]>([]);
+    const [aiTelemetry, setAITelemetry] = useState<AITelemetry | null>(null);
     const [loading, setLoading] = useState(true);
     const [saving, setSaving] = useState(false);
     const [searchTerm, setSearchTerm] = useState('');
@@ -231,6 +232,8 @@ export const AdminPage: React.FC<{ onBack: () => void }> = ({ onBack }) => {
             setConfig(configRes.data);
             setRestrictedUsers(restrictedRes.data.users);
             setRestrictedRooms(restrictedRes.data.rooms);
+            // Hiệu năng AI theo model (không chặn việc tải các dữ liệu khác)
+            api.get('/admin/ai/telemetry').then(res => setAITelemetry(res.data)).catch(() => setAITelemetry(null));
             if (showToast) toast.success("Dữ liệu đã được làm mới");
         } catch (error) {
             console.error('Admin fetch error:', error);
@@ -521,6 +524,7 @@ export const AdminPage: React.FC<{ onBack: () => void }> = ({ onBack }) => {
                     <AIAssistantTab 
                         config={config} 
                         stats={stats}
+                        telemetry={aiTelemetry}
                         saving={saving} 
                         restrictedUsers={restrictedUsers}
                         restrictedRooms={restrictedRooms}
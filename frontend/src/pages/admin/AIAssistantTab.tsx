@@ -6,10 +6,10 @@ import {
     Search, UserMinus, ShieldAlert, Settings,
     Activity, Clock, Ban, Globe
 } from 'lucide-react';
-import type { AIAssistantTabProps } from './types';
+import type { AIAssistantTabProps, AITelemetryMetric } from './types';
 
 export const AIAssistantTab: React.FC<AIAssistantTabProps> = ({
-    stats, config, onConfigChange, onSave, saving,
+    stats, telemetry, config, onConfigChange, onSave, saving,
     restrictedUsers = [], restrictedRooms = [], 
     onToggleUserRestriction = () => {}, onToggleRoomRestriction = () => {}
 }) => {
@@ -19,6 +19,9 @@ export const AIAssistantTab: React.FC<AIAssistantTabProps> = ({
     const feedbackTotal = (stats?.ai_feedback_positive || 0) + (stats?.ai_feedback_negative || 0);
     const positiveRate = feedbackTotal > 0 ? ((stats?.ai_feedback_positive || 0) / feedbackTotal) * 100 : 0;
     const errorRate = (stats?.ai_calls_today || 0) > 0 ? ((stats?.ai_errors_count || 0) / (stats?.ai_calls_today || 1)) * 100 : 0;
+    const overall = telemetry?.overall;
+    const totalP50 = overall?.metrics.total_ms.p50;
+    const overallErrorRate = overall && overall.requests > 0 ? overall.error_rate * 100 : null;
 
     return (
         <div className="space-y-6 animate-in fade-in slide-in-from-bottom-4 duration-500 max-w-6xl">
@@ -153,9 +156,9 @@ export const AIAssistantTab: React.FC<AIAssistantTabProps> = ({
                             </div>
                             
                             <div className="grid grid-cols-3 gap-4 p-4 bg-slate-50 rounded-2xl border border-dashed border-slate-200">
-                                <FeedbackMetric label="Tốc độ xử lý" value="1.2s" icon={<Clock size={14} />} />
-                                <FeedbackMetric label="Tokens trung bình" value="240" icon={<BrainCircuit size={14} />} />
-                                <FeedbackMetric label="Uptime AI" value="99.9%" icon={<Activity size={14} />} />
+                                <FeedbackMetric label="Tốc độ xử lý (p50)" value={formatMs(totalP50)} icon={<Clock size={14} />} />
+                                <FeedbackMetric label="Tokens trung bình" value={overall?.avg_output_tokens ?? '—'} icon={<BrainCircuit size={14} />} />
+                                <FeedbackMetric label="Tỷ lệ thành công" value={overallErrorRate === null ? '—' : `${(100 - overallErrorRate).toFixed(1)}%`} icon={<Activity size={14} />} />
                             </div>
                         </div>
                     </div>
@@ -183,6 +186,61 @@ export const AIAssistantTab: React.FC<AIAssistantTabProps> = ({
                         </div>
                         <Sparkles className="absolute -right-8 -bottom-8 w-64 h-64 text-white/5 rotate-12" />
                     </div>
+
+                    {/* Hiệu năng theo model (histogram theo phút từ /admin/ai/telemetry) */}
+                    <div className="md:col-span-2 lg:col-span-4 bg-white p-8 rounded-[2rem] border border-slate-200 shadow-sm">
+                        <div className="flex items-center justify-between mb-6">
+                            <h4 className="font-black text-slate-800 flex items-center gap-2">
+                                <Clock size={20} className="text-indigo-500" />
+                                Hiệu năng theo Model ({telemetry?.minutes ?? 60} phút gần nhất)
+                            </h4>
+                            <span className="text-[10px] font-black uppercase text-slate-400 tracking-widest">p50 / p90 / p99</span>
+                        </div>
+                        {!telemetry || telemetry.groups.length === 0 ? (
+                            <p className="text-sm font-medium text-slate-400">Chưa có lượt trả lời AI nào trong khoảng thời gian này.</p>
+                        ) : (
+                            <div className="overflow-x-auto">
+                                <table className="w-full text-sm">
+                                    <thead>
+                                        <tr className="text-left text-[10px] font-black uppercase tracking-widest text-slate-400">
+                                            <th className="pb-3 pr-4">Model</th>
+                                            <th className="pb-3 pr-4">Lượt / Lỗi</th>
+                                            <th className="pb-3 pr-4">Mức fallback</th>
+                                            <th className="pb-3 pr-4">Chờ hàng đợi</th>
+                                            <th className="pb-3 pr-4">TTFT</th>
+                                            <th className="pb-3 pr-4">Tổng thời gian</th>
+                                            <th className="pb-3 pr-4">Token/s</th>
+                                            <th className="pb-3">Phân bố TTFT</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody className="divide-y divide-slate-100">
+                                        {telemetry.groups.map((group) => (
+                                            <tr key={`${group.model}-${group.provider}`} className="align-middle">
+                                                <td className="py-3 pr-4">
+                                                    <p className="font-bold text-slate-700">{group.model}</p>
+                                                    <p className="text-[10px] font-bold uppercase text-slate-400">{group.provider}</p>
+                                                </td>
+                                                <td className="py-3 pr-4 font-bold text-slate-600">
+                                                    {group.requests}
+                                                    <span className={group.errors > 0 ? 'text-rose-500' : 'text-slate-300'}> / {group.errors}</span>
+                                                </td>
+                                                <td className="py-3 pr-4 text-xs font-bold text-slate-500">
+                                                    {Object.entries(group.levels || {}).map(([level, count]) => `${level === 'local' ? 'local' : `#${level}`}: ${count}`).join(', ')}
+                                                </td>
+                                                <td className="py-3 pr-4 text-xs font-bold text-slate-600">{formatPercentiles(group.metrics.queue_ms)}</td>
+                                                <td className="py-3 pr-4 text-xs font-bold text-slate-600">{formatPercentiles(group.metrics.ttft_ms)}</td>
+                                                <td className="py-3 pr-4 text-xs font-bold text-slate-600">{formatPercentiles(group.metrics.total_ms)}</td>
+                                                <td className="py-3 pr-4 text-xs font-bold text-slate-600">{group.metrics.tokens_per_s.p50 ?? '—'}</td>
+                                                <td className="py-3">
+                                                    <MiniHistogram counts={group.metrics.ttft_ms.histogram} />
+                                                </td>
+                                            </tr>
+                                        ))}
+                                    </tbody>
+                                </table>
+                            </div>
+                        )}
+                    </div>
                 </div>
             )}
 
@@ -379,6 +437,29 @@ const StatCard = ({ icon, label, value, subValue, bg, percentage, isError = fals
     </div>
 );
 
+const formatMs = (value?: number | null) => {
+    if (value === null || value === undefined) return '—';
+    return value >= 1000 ? `${(value / 1000).toFixed(1)}s` : `${Math.round(value)}ms`;
+};
+
+const formatPercentiles = (metric: AITelemetryMetric) =>
+    metric.samples > 0 ? `${formatMs(metric.p50)} / ${formatMs(metric.p90)} / ${formatMs(metric.p99)}` : '—';
+
+const MiniHistogram = ({ counts }: { counts: number[] }) => {
+    const max = Math.max(1, ...counts);
+    return (
+        <div className="flex items-end gap-px h-8 w-40">
+            {counts.map((count, i) => (
+                <div
+                    key={i}
+                    className="flex-1 bg-indigo-400 rounded-t-sm"
+                    style={{ height: `${count > 0 ? Math.max(8, (count / max) * 100) : 0}%` }}
+                />
+            ))}
+        </div>
+    );
+};
+
 const FeedbackMetric = ({ label, value, icon }: any) => (
     <div className="flex flex-col">
         <div className="flex items-center gap-1.5 text-slate-400 mb-1">
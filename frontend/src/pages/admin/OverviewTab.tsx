@@ -102,6 +102,14 @@ export const OverviewTab: React.FC<OverviewTabProps> = ({ stats, loading, onManu
                             <span className="text-4xl font-black text-slate-900 leading-none">{stats.total_rooms}</span>
                             <span className="text-xs text-slate-400 font-bold mb-1">active</span>
                         </div>
+                        {stats.sentiment && stats.sentiment.messages > 0 && (
+                            <p className="text-[10px] font-bold text-slate-400 mt-2">
+                                Cảm xúc 24h: <span className={(stats.sentiment.average || 0) < 0 ? 'text-rose-500' : 'text-emerald-600'}>
+                                    {(stats.sentiment.average || 0) > 0 ? '+' : ''}{(stats.sentiment.average || 0).toFixed(2)}
+                                </span>
+                                {' '}· {Math.round((stats.sentiment.negative_share || 0) * 100)}% tiêu cực
+                            </p>
+                        )}
                     </div>
                 </div>
 
@@ -32,6 +32,12 @@ export interface Stats {
         type: string;
     }>;
     hourly_stats: number[];
+    sentiment?: {
+        messages: number;
+        average: number | null;
+        negative_share: number | null;
+        positive_share: number | null;
+    };
     latency_ms: number;
 }
 
@@ -201,8 +207,43 @@ export interface ReportsTabProps {
     onAction: (reportId: string, action: string, note?: string) => void;
 }
 
+export interface AITelemetryMetric {
+    samples: number;
+    avg: number | null;
+    p50: number | null;
+    p90: number | null;
+    p99: number | null;
+    histogram: number[];
+}
+
+export interface AITelemetryGroup {
+    model?: string;
+    provider?: string;
+    levels?: Record<string, number>;
+    requests: number;
+    errors: number;
+    error_rate: number;
+    output_tokens: number;
+    avg_output_tokens: number | null;
+    metrics: {
+        queue_ms: AITelemetryMetric;
+        ttft_ms: AITelemetryMetric;
+        total_ms: AITelemetryMetric;
+        tokens_per_s: AITelemetryMetric;
+    };
+}
+
+export interface AITelemetry {
+    minutes: number;
+    group_by: 'model' | 'provider';
+    bounds: { latency_ms: number[]; tokens_per_s: number[] };
+    overall: AITelemetryGroup;
+    groups: AITelemetryGroup[];
+}
+
 export interface AIAssistantTabProps {
     stats: Stats;
+    telemetry?: AITelemetry | null;
     config: SystemConfig;
     saving: boolean;
     onConfigChange: (config: SystemConfig) => void;
@@ -45,6 +45,8 @@ interface ChatState {
     pinMessage: (messageId: string) => void;
     addReaction: (messageId: string, emoji: string) => void;
     reportMessage: (messageId: string, reason?: string) => void;
+    requestAISuggestion: (messageId: string) => void;
+    cancelAI: (messageId?: string) => void;
     forwardMessage: (msg: Message, targetRoomId: string) => Promise<boolean>;
     setReplyingTo: (msg: Message | null) => void;
     setEditingMessage: (msg: Message | null) => void;
@@ -190,7 +192,8 @@ export const useChatStore = create<ChatState>()(
                     status: m.status,
                     reply_to_id: m.reply_to_id,
                     reply_to_content: m.reply_to_content,
-                    suggestions: m.suggestions
+                    suggestions: m.suggestions,
+                    isStopped: m.is_stopped
                 }));
                 set({ messages: formattedMessages });
                 
@@ -321,6 +324,15 @@ export const useChatStore = create<ChatState>()(
                 reconnectAttempt = 0;
                 startHeartbeat(socket);
                 console.log('✅ WebSocket Connected');
+
+                // Kết nối lại giữa lúc AI đang trả lời: xin server gửi lại phần đã lỡ
+                get().messages
+                    .filter(m => m.isBot && m.isStreaming)
+                    .forEach(m => socket.send(JSON.stringify({
+                        type: 'resume_ai',
+                        message_id: m.id,
+                        offset: m.content.length
+                    })));
             };
 
             socket.onmessage = (event) => {
@@ -359,7 +371,9 @@ export const useChatStore = create<ChatState>()(
                                 is_pinned: data.is_pinned,
                                 status: data.status || 'sent',
                                 reply_to_id: data.reply_to_id,
-                                reply_to_content: data.reply_to_content
+                                reply_to_content: data.reply_to_content,
+                                suggestions: data.suggestions,
+                                isStopped: data.is_stopped
                             };
 
                             get().addMessage(msgData);
@@ -706,15 +720,50 @@ export const useChatStore = create<ChatState>()(
                             const newMessages = [...state.messages];
                             const msgIndex = newMessages.findIndex(m => m.id === data.message_id);
                             if (msgIndex !== -1) {
+                                const current = newMessages[msgIndex].content;
+                                let content = current + data.content;
+                                if (typeof data.offset === 'number') {
+                                    // Frame có offset: bỏ phần trùng (đã nhận qua resume) và bỏ qua frame tới sớm hơn phần còn thiếu
+                                    if (data.offset > current.length) return state;
+                                    content = current.length >= data.offset + data.content.length
+                                        ? current
+                                        : current.slice(0, data.offset) + data.content;
+                                }
                                 newMessages[msgIndex] = {
                                     ...newMessages[msgIndex],
-                                    content: newMessages[msgIndex].content + data.content,
+                                    content,
                                     isStreaming: true,
                                 };
                             }
                             return { messages: newMessages };
                         });
                         break;
+                    case 'ai_cancelled':
+                        // Lượt AI bị dừng khi còn trong hàng đợi (chưa có frame nào): bỏ trạng thái đang soạn
+                        set((state) => {
+                            const newAiTyping = { ...state.aiTypingRooms };
+                            delete newAiTyping[data.room_id];
+                            return {
+                                messages: state.messages.map(m =>
+                                    m.id === data.message_id ? { ...m, isStreaming: false } : m
+                                ),
+                                aiTypingRooms: newAiTyping,
+                                aiSuggestion: state.aiSuggestion && state.aiSuggestion.messageId === data.message_id
+                                    ? { ...state.aiSuggestion, isStreaming: false }
+                                    : state.aiSuggestion
+                            };
+                        });
+                        break;
+                    case 'ai_resume':
+                        // Server không còn giữ (hoặc đã cắt bớt) bộ đệm: dừng trạng thái stream, nội dung đầy đủ có trong lịch sử
+                        if (data.status !== 'truncated') {
+                            set((state) => ({
+                                messages: state.messages.map(m =>
+                                    m.id === data.message_id ? { ...m, isStreaming: false } : m
+                                )
+                            }));
+                        }
+                        break;
                     case 'end':
                         set((state) => {
                             const newMessages = [...state.messages];
@@ -1045,6 +1094,29 @@ export const useChatStore = create<ChatState>()(
             }
         },
 
+        requestAISuggestion: (messageId: string) => {
+            const { socket, activeRoom } = get();
+            if (socket && socket.readyState === WebSocket.OPEN && activeRoom) {
+                socket.send(JSON.stringify({
+                    type: 'request_ai_suggestion',
+                    message_id: messageId,
+                    room_id: activeRoom.id
+                }));
+            }
+        },
+
+        cancelAI: (messageId?: string) => {
+            const { socket, activeRoom } = get();
+            if (socket && socket.readyState === WebSocket.OPEN && activeRoom) {
+                // Không có messageId: dừng mọi lượt AI của mình trong phòng hiện tại
+                socket.send(JSON.stringify({
+                    type: 'cancel_ai',
+                    message_id: messageId,
+                    room_id: activeRoom.id
+                }));
+            }
+        },
+
         forwardMessage: async (msg: Message, targetRoomId: string) => {
             const { socket } = get();
             if (socket && socket.readyState === WebSocket.OPEN) {
@@ -73,6 +73,7 @@ export interface Message {
   isBot: boolean;
   status?: 'sending' | 'sent' | 'delivered' | 'seen';
   isStreaming?: boolean;  // New features
+  isStopped?: boolean; // Câu trả lời AI bị người dùng dừng giữa chừng
   is_edited?: boolean;
   is_recalled?: boolean;
   is_pinned?: boolean;